@@ -14,3 +14,12 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_asgi_application()
+
+# Warm up the RAG service so the first request after deploy is not a cold one.
+# Opt-in, so management commands and tests that load this module stay light.
+from django.conf import settings  # noqa: E402
+
+if settings.RAG_WARMUP_ENABLED:
+    from qa.services.warmup import warm_up_in_background
+
+    warm_up_in_background()
@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_init
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
@@ -14,6 +15,16 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
 
 
+@worker_process_init.connect
+def warm_up_worker_process(**kwargs):
+    """Open Gemini connections in each forked worker before it takes tasks."""
+    from django.conf import settings
+    if not settings.RAG_WARMUP_ENABLED:
+        return
+    from qa.services.warmup import warm_up_in_background
+    warm_up_in_background()
+
+
 @app.task(bind=True, ignore_result=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import config, Csv
 import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -39,6 +39,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     
     # Third-party apps
     'rest_framework',
@@ -61,8 +62,10 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.db_router.ReplicaStickinessMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.SamplingProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -96,9 +99,32 @@ DATABASES = {
         'PASSWORD': config('DATABASE_PASSWORD'),
         'HOST': config('DATABASE_HOST', default='localhost'),
         'PORT': config('DATABASE_PORT', default='5432'),
+        # Persistent connections, reused across requests and Celery tasks, checked before reuse
+        'CONN_MAX_AGE': config('DATABASE_CONN_MAX_AGE', default=60, cast=int),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'connect_timeout': config('DATABASE_CONNECT_TIMEOUT', default=5, cast=int),
+        },
     }
 }
 
+# Read replicas, e.g. DATABASE_REPLICA_HOSTS=localhost:5433 (see core/db_router.py)
+for _number, _replica in enumerate(config('DATABASE_REPLICA_HOSTS', default='', cast=Csv()), start=1):
+    _host, _, _port = _replica.partition(':')
+    DATABASES[f'replica{_number}'] = dict(
+        DATABASES['default'],
+        HOST=_host,
+        PORT=_port or DATABASES['default']['PORT'],
+        # Fail over quickly when a replica is down
+        OPTIONS={'connect_timeout': 2},
+        TEST={'MIRROR': 'default'},
+    )
+
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+DATABASE_REPLICA_STICKY_SECONDS = config('DATABASE_REPLICA_STICKY_SECONDS', default=15, cast=int)
+DATABASE_REPLICA_MAX_LAG_SECONDS = config('DATABASE_REPLICA_MAX_LAG_SECONDS', default=10, cast=float)
+DATABASE_REPLICA_HEALTH_INTERVAL = config('DATABASE_REPLICA_HEALTH_INTERVAL', default=5, cast=float)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -151,7 +177,7 @@ AUTH_USER_MODEL = 'users.User'
 # REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -175,6 +201,9 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+# Token users are cached this many seconds between database lookups (see users/authentication.py)
+AUTH_USER_CACHE_TTL = config('AUTH_USER_CACHE_TTL', default=60, cast=int)
+
 
 # CELERY CONFIGURATION
 CELERY_BROKER_URL = config('REDIS_URL', default='redis://localhost:6379/0')
@@ -185,13 +214,138 @@ CELERY_RESULT_SERIALIZER = 'json'  # Fixed: was CELLERY_RESULT_SERIALIZER
 CELERY_TIMEZONE = 'UTC'
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60  # 30 minutes
+# documents keeps its tasks in task.py, which autodiscovery (tasks.py) doesn't find
+CELERY_IMPORTS = ['documents.task']
+
+# FAIR INGESTION SCHEDULING (see documents/scheduler.py)
+INGEST_FAIR_SCHEDULING = config('INGEST_FAIR_SCHEDULING', default=True, cast=bool)
+# Keep close to the total worker concurrency so the Celery queue itself stays short
+INGEST_MAX_INFLIGHT = config('INGEST_MAX_INFLIGHT', default=8, cast=int)
+INGEST_TENANT_CONCURRENCY = config('INGEST_TENANT_CONCURRENCY', default=2, cast=int)
+INGEST_TENANT_WEIGHT = config('INGEST_TENANT_WEIGHT', default=1, cast=int)
+INGEST_SIZE_PENALTY_SECONDS_PER_MB = config('INGEST_SIZE_PENALTY_SECONDS_PER_MB', default=30, cast=float)
+INGEST_INFLIGHT_TIMEOUT = CELERY_TASK_TIME_LIMIT
+CELERY_BEAT_SCHEDULE = {
+    # Safety net: dispatch also runs on every enqueue and every finished job
+    'dispatch-ingestion': {
+        'task': 'documents.task.dispatch_ingestion',
+        'schedule': config('INGEST_DISPATCH_INTERVAL', default=5, cast=float),
+    },
+    'purge-stale-uploads': {
+        'task': 'documents.task.purge_stale_uploads',
+        'schedule': 3600,
+    },
+    # Deletions queue a purge themselves; this picks up any that were lost
+    'purge-deleted-documents': {
+        'task': 'documents.task.purge_deleted_documents',
+        'schedule': 3600,
+    },
+    # Safety net for asks whose scheduled flush was lost, and takes over entries of crashed workers
+    'flush-question-writes': {
+        'task': 'qa.tasks.flush_question_writes',
+        'schedule': config('QA_WRITE_BEHIND_SWEEP_INTERVAL', default=10, cast=float),
+    },
+}
+
+# CACHE CONFIGURATION
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': config('REDIS_URL', default='redis://localhost:6379/0'),
+        'KEY_PREFIX': 'docassistant',
+    }
+}
 
 # FILE UPLOAD SETTINGS
 MAX_UPLOAD_SIZE = 50 * 1024 * 1024  # 50 MB
 ALLOWED_DOCUMENT_TYPES = ['pdf', 'docx', 'txt', 'md']
+# Resumable uploads: parts are appended to a partial file, then copied into storage on completion
+UPLOAD_PART_MAX_SIZE = config('UPLOAD_PART_MAX_SIZE', default=8 * 1024 * 1024, cast=int)
+UPLOAD_PARTIAL_DIR = config('UPLOAD_PARTIAL_DIR', default=os.path.join(MEDIA_ROOT, 'uploads', 'partial'))
+UPLOAD_SESSION_TTL_HOURS = config('UPLOAD_SESSION_TTL_HOURS', default=24, cast=int)
+# Deleted documents' chunks are removed this many rows per DELETE statement
+DOCUMENT_PURGE_BATCH_SIZE = config('DOCUMENT_PURGE_BATCH_SIZE', default=5000, cast=int)
 
 # AI CONFIGURATION (Google Gemini)
-GOOGLE_API_KEY = config('GOOGLE_API_KEY')
+GOOGLE_API_KEY = config('GOOGLE_API_KEY', default='')
 GEMINI_MODEL_NAME = config('GEMINI_MODEL_NAME', default='gemini-1.5-pro')
 GEMINI_EMBEDDING_MODEL = config('GEMINI_EMBEDDING_MODEL', default='models/text-embedding-004')
-AI_TEMPERATURE = config('AI_TEMPERATURE', default=0.7, cast=float)
\ No newline at end of file
+AI_TEMPERATURE = config('AI_TEMPERATURE', default=0.7, cast=float)
+
+# 'gemini' or 'fake' (deterministic offline stand-in for benchmarks and tests)
+RAG_PROVIDER = config('RAG_PROVIDER', default='gemini')
+RAG_EMBEDDING_DIMENSION = config('RAG_EMBEDDING_DIMENSION', default=3072, cast=int)  # gemini-embedding-001
+FAKE_LLM_EMBED_LATENCY_MS = config('FAKE_LLM_EMBED_LATENCY_MS', default=0, cast=float)
+FAKE_LLM_GENERATE_LATENCY_MS = config('FAKE_LLM_GENERATE_LATENCY_MS', default=0, cast=float)
+
+# RAG CONTEXT ASSEMBLY
+RAG_CONTEXT_TOKEN_BUDGET = config('RAG_CONTEXT_TOKEN_BUDGET', default=6000, cast=int)
+RAG_HISTORY_TOKEN_BUDGET = config('RAG_HISTORY_TOKEN_BUDGET', default=1500, cast=int)
+RAG_HISTORY_RECENT_TURNS = config('RAG_HISTORY_RECENT_TURNS', default=3, cast=int)
+RAG_HISTORY_SUMMARY_TTL = config('RAG_HISTORY_SUMMARY_TTL', default=24 * 60 * 60, cast=int)
+
+# RAG BATCH PROCESSING
+RAG_EMBED_BATCH_SIZE = config('RAG_EMBED_BATCH_SIZE', default=100, cast=int)  # Gemini batchEmbedContents limit
+RAG_BATCH_MAX_QUESTIONS = config('RAG_BATCH_MAX_QUESTIONS', default=500, cast=int)
+RAG_BATCH_CONCURRENCY = config('RAG_BATCH_CONCURRENCY', default=4, cast=int)
+RAG_BATCH_PROGRESS_INTERVAL = config('RAG_BATCH_PROGRESS_INTERVAL', default=10, cast=int)
+
+# RAG REDUCED-DIMENSION SEARCH
+# Scan RAG_REDUCED_DIMENSION leading dimensions first, then re-rank RAG_RERANK_POOL_SIZE candidates
+# with full vectors. 0 disables it; try `manage.py evaluate_retrieval --reduced-dimension 256`.
+RAG_REDUCED_DIMENSION = config('RAG_REDUCED_DIMENSION', default=0, cast=int)
+RAG_RERANK_POOL_SIZE = config('RAG_RERANK_POOL_SIZE', default=100, cast=int)
+
+# RAG EMBEDDING MIGRATIONS (see qa/services/reembedding.py)
+RAG_BACKFILL_MAX_RPM = config('RAG_BACKFILL_MAX_RPM', default=300, cast=int)  # Embedding requests per minute
+RAG_BACKFILL_MIN_RPM = config('RAG_BACKFILL_MIN_RPM', default=10, cast=int)
+RAG_BACKFILL_RPM_STEP = config('RAG_BACKFILL_RPM_STEP', default=10, cast=int)
+RAG_BACKFILL_SLICE_SECONDS = config('RAG_BACKFILL_SLICE_SECONDS', default=60, cast=int)
+RAG_BACKFILL_MAX_ERRORS = config('RAG_BACKFILL_MAX_ERRORS', default=8, cast=int)
+
+# RAG SERVICE WARM-UP
+RAG_INDEX_CACHE_SIZE = config('RAG_INDEX_CACHE_SIZE', default=16, cast=int)  # Users' indexes kept per process
+RAG_WARMUP_ENABLED = config('RAG_WARMUP_ENABLED', default=False, cast=bool)  # Enable on web and worker processes
+RAG_WARMUP_PRELOAD_USERS = config('RAG_WARMUP_PRELOAD_USERS', default=0, cast=int)
+
+# RAG COLLECTION SHARDS (see qa/services/collection_index.py)
+RAG_COLLECTION_SHARD_CACHE_SIZE = config('RAG_COLLECTION_SHARD_CACHE_SIZE', default=64, cast=int)  # Collections' shards kept per process
+RAG_COLLECTION_CHANGE_TTL = config('RAG_COLLECTION_CHANGE_TTL', default=24 * 60 * 60, cast=int)  # Older shards are rebuilt in full
+
+# RAG CONVERSATION CANDIDATES (see qa/services/candidate_cache.py)
+# Follow-ups are answered from the last turns' candidates when the best of them scores at least
+# RAG_CANDIDATE_MIN_SIMILARITY (1 / (1 + squared L2 distance)); 1.01 disables the shortcut.
+RAG_CANDIDATE_MIN_SIMILARITY = config('RAG_CANDIDATE_MIN_SIMILARITY', default=0.6, cast=float)
+RAG_CANDIDATE_POOL_SIZE = config('RAG_CANDIDATE_POOL_SIZE', default=20, cast=int)  # Candidates kept per turn
+RAG_CANDIDATE_TURNS = config('RAG_CANDIDATE_TURNS', default=3, cast=int)
+RAG_CANDIDATE_CACHE_TTL = config('RAG_CANDIDATE_CACHE_TTL', default=30 * 60, cast=int)
+
+# ASK WRITE-BEHIND (see qa/write_behind.py)
+QA_WRITE_BEHIND_ENABLED = config('QA_WRITE_BEHIND_ENABLED', default=True, cast=bool)
+QA_WRITE_BEHIND_FLUSH_DELAY = config('QA_WRITE_BEHIND_FLUSH_DELAY', default=1, cast=float)  # Seconds a write waits to batch with others
+QA_WRITE_BEHIND_BATCH_SIZE = config('QA_WRITE_BEHIND_BATCH_SIZE', default=500, cast=int)
+QA_WRITE_BEHIND_CLAIM_IDLE_SECONDS = config('QA_WRITE_BEHIND_CLAIM_IDLE_SECONDS', default=60, cast=int)
+QA_WRITE_BEHIND_PENDING_TTL = config('QA_WRITE_BEHIND_PENDING_TTL', default=10 * 60, cast=int)
+
+# METRICS
+# Set PROMETHEUS_MULTIPROC_DIR in the environment to aggregate metrics across worker processes
+# /metrics answers scrapers sending "Authorization: Bearer METRICS_AUTH_TOKEN", or, with no token
+# set, only requests from METRICS_ALLOWED_IPS (REMOTE_ADDR, so list the proxy's address behind one)
+METRICS_AUTH_TOKEN = config('METRICS_AUTH_TOKEN', default='')
+METRICS_ALLOWED_IPS = [ip for ip in config('METRICS_ALLOWED_IPS', default='127.0.0.1,::1').split(',') if ip]
+
+# PROFILING
+# Sampled requests/tasks are written as collapsed stacks (flame graph input) to PROFILING_DIR
+PROFILING_ENABLED = config('PROFILING_ENABLED', default=False, cast=bool)
+PROFILING_SAMPLE_RATE = config('PROFILING_SAMPLE_RATE', default=0.0, cast=float)
+PROFILING_TASK_SAMPLE_RATE = config('PROFILING_TASK_SAMPLE_RATE', default=0.0, cast=float)
+PROFILING_INTERVAL_MS = config('PROFILING_INTERVAL_MS', default=5, cast=int)
+PROFILING_ALLOW_HEADER = config('PROFILING_ALLOW_HEADER', default=DEBUG, cast=bool)
+PROFILING_HEADER = 'X-Profile'
+PROFILING_DIR = config('PROFILING_DIR', default=os.path.join(BASE_DIR, 'profiles'))
+PROFILING_MAX_FILES = config('PROFILING_MAX_FILES', default=200, cast=int)
+
+# ADMIN (see core/admin.py)
+# Unfiltered changelists of larger tables show the planner's row estimate instead of COUNT(*)
+ADMIN_EXACT_COUNT_LIMIT = config('ADMIN_EXACT_COUNT_LIMIT', default=100000, cast=int)
+ADMIN_COUNT_TIMEOUT_MS = config('ADMIN_COUNT_TIMEOUT_MS', default=200, cast=int)
@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from core.views import metrics
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
@@ -22,6 +23,9 @@ urlpatterns = [
     # Other endpoints
     path('api/v1/documents/', include('documents.urls')),
     path('api/v1/qa/', include('qa.urls')),
+    
+    # Monitoring
+    path('metrics', metrics, name='metrics'),
 ]
 
 if settings.DEBUG:
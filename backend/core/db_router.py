@@ -0,0 +1,127 @@
+"""Read-replica routing.
+
+Only reads made inside ``replica_reads()`` go to a replica: the vector search
+path and list endpoints opt in, everything else (including every write) uses
+``default``. A user who has just written is pinned to the primary for
+DATABASE_REPLICA_STICKY_SECONDS so they always read their own upload or
+question, whatever the replica lag. Replicas that are unreachable or lag by
+more than DATABASE_REPLICA_MAX_LAG_SECONDS are skipped until their next health
+check; with no healthy replica, reads fall back to the primary.
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+
+
+_replica_reads = ContextVar('replica_reads', default=False)
+_wrote_primary = ContextVar('wrote_primary', default=False)
+
+# alias -> (healthy, checked_at), per process
+_health = {}
+_health_lock = threading.Lock()
+
+LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+def _pin_key(user_id) -> str:
+    return f"db_primary_pin:{user_id}"
+
+
+def pin_to_primary(user_id):
+    """Route the user's replica reads to the primary until replicas have caught up with their write."""
+    if user_id and replica_aliases():
+        cache.set(_pin_key(user_id), 1, settings.DATABASE_REPLICA_STICKY_SECONDS)
+
+
+def is_pinned(user_id) -> bool:
+    return bool(user_id) and cache.get(_pin_key(user_id)) is not None
+
+
+def replica_aliases() -> list:
+    return [alias for alias in settings.DATABASES if alias.startswith('replica')]
+
+
+def check_replica(alias: str) -> bool:
+    """Whether a replica answers and is within the allowed replication lag."""
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(LAG_QUERY)
+            lag = float(cursor.fetchone()[0])
+    except DatabaseError:
+        return False
+    return lag <= settings.DATABASE_REPLICA_MAX_LAG_SECONDS
+
+
+def is_replica_healthy(alias: str) -> bool:
+    now = time.monotonic()
+    healthy, checked_at = _health.get(alias, (None, 0))
+    if healthy is None or now - checked_at > settings.DATABASE_REPLICA_HEALTH_INTERVAL:
+        with _health_lock:
+            healthy = check_replica(alias)
+            _health[alias] = (healthy, now)
+    return healthy
+
+
+def choose_replica():
+    """A random healthy replica, or None to read from the primary."""
+    healthy = [alias for alias in replica_aliases() if is_replica_healthy(alias)]
+    return random.choice(healthy) if healthy else None
+
+
+@contextmanager
+def replica_reads(user_id=None):
+    """Send reads in this block to a replica, unless the user was pinned to the primary."""
+    token = _replica_reads.set(not is_pinned(user_id))
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    """Route opted-in reads to healthy replicas and everything else to the primary."""
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get():
+            return choose_replica() or 'default'
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        _wrote_primary.set(True)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaStickinessMiddleware:
+    """Pin a user to the primary after a request of theirs wrote to it."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _wrote_primary.set(False)
+        try:
+            response = self.get_response(request)
+            user = getattr(request, 'user', None)
+            if _wrote_primary.get() and user is not None and user.is_authenticated:
+                pin_to_primary(user.id)
+            return response
+        finally:
+            _wrote_primary.reset(token)
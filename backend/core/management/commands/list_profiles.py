@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from core.profiling import ProfileStore
+
+
+class Command(BaseCommand):
+    help = 'List the slowest recent request/task profiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--kind', choices=['request', 'task'])
+        parser.add_argument('--recent', action='store_true', help='Sort by start time instead of duration')
+
+    def handle(self, *args, **options):
+        profiles = ProfileStore().list(kind=options['kind'])
+        sort_key = 'started_at' if options['recent'] else 'duration_ms'
+        profiles.sort(key=lambda profile: profile.get(sort_key) or 0, reverse=True)
+
+        if not profiles:
+            self.stdout.write('No profiles recorded.')
+            return
+
+        for profile in profiles[:options['limit']]:
+            self.stdout.write(
+                f"{profile['duration_ms']:>8} ms  {profile['samples']:>6} samples  "
+                f"{profile['kind']:<7} {profile['name']}  [{profile.get('status')}]  {profile['started_at']}"
+            )
+            self.stdout.write(f"          {profile['path']}")
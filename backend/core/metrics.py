@@ -0,0 +1,115 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from prometheus_client import Counter, Gauge, Histogram
+
+
+STAGE_SECONDS = Histogram(
+    'rag_stage_seconds',
+    'Latency of each RAG pipeline stage',
+    ['pipeline', 'stage'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+PIPELINE_SECONDS = Histogram(
+    'rag_pipeline_seconds',
+    'End-to-end latency of a RAG pipeline run',
+    ['pipeline'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300),
+)
+CHUNKS_SCANNED = Histogram(
+    'rag_chunks_scanned',
+    'Number of candidate chunks scanned per vector search',
+    buckets=(10, 100, 1000, 10_000, 100_000, 1_000_000),
+)
+TOKENS = Histogram(
+    'rag_tokens',
+    'Tokens per LLM call',
+    ['kind'],
+    buckets=(100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000),
+)
+CACHE_REQUESTS = Counter(
+    'rag_cache_requests_total',
+    'Cache lookups in the RAG pipeline',
+    ['cache', 'result'],
+)
+# Ingestion metrics are not labelled by tenant: one series per user would grow without bound
+INGEST_QUEUE_DEPTH = Gauge(
+    'ingest_queue_depth',
+    'Ingestion jobs waiting in tenant queues',
+    multiprocess_mode='livemostrecent',
+)
+INGEST_QUEUED_TENANTS = Gauge(
+    'ingest_queued_tenants',
+    'Tenants with ingestion jobs waiting',
+    multiprocess_mode='livemostrecent',
+)
+INGEST_INFLIGHT = Gauge(
+    'ingest_inflight',
+    'Ingestion jobs dispatched to workers and not yet finished',
+    multiprocess_mode='livemostrecent',
+)
+INGEST_WAIT_SECONDS = Histogram(
+    'ingest_queue_wait_seconds',
+    'Time an ingestion job waited in its tenant queue before dispatch',
+    buckets=(1, 10, 60, 300, 900, 1800, 3600, 4 * 3600),
+)
+
+_current_timer = ContextVar('stage_timer', default=None)
+
+
+class StageTimer:
+    """Collect per-stage timings (in ms) for one pipeline run.
+
+    While active, module-level ``stage()`` blocks in nested service calls are
+    recorded on this timer, so a single breakdown covers the whole request.
+    """
+
+    def __init__(self, pipeline: str):
+        self.pipeline = pipeline
+        self.timings = {}
+        self.total_ms = 0
+        self._start = None
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current_timer.set(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self._start
+        self.total_ms = int(elapsed * 1000)
+        PIPELINE_SECONDS.labels(self.pipeline).observe(elapsed)
+        _current_timer.reset(self._token)
+        return False
+
+    def record(self, name: str, seconds: float):
+        self.timings[name] = self.timings.get(name, 0) + int(seconds * 1000)
+        STAGE_SECONDS.labels(self.pipeline, name).observe(seconds)
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+
+@contextmanager
+def stage(name: str, pipeline: str = 'rag'):
+    """Time a block on the active StageTimer, or as a standalone stage."""
+    timer = _current_timer.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if timer is not None:
+            timer.record(name, elapsed)
+        else:
+            STAGE_SECONDS.labels(pipeline, name).observe(elapsed)
+
+
+def record_cache_lookup(cache_name: str, hit: bool):
+    CACHE_REQUESTS.labels(cache_name, 'hit' if hit else 'miss').inc()
@@ -0,0 +1,39 @@
+from django.conf import settings
+
+from .profiling import ProfileStore, SamplingProfiler, should_sample
+
+
+class SamplingProfilerMiddleware:
+    """Profile a sample of requests, or those flagged with the profiling header."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        profiler = SamplingProfiler().start()
+        response = None
+        try:
+            response = self.get_response(request)
+            return response
+        finally:
+            profiler.stop()
+            user = getattr(request, 'user', None)
+            ProfileStore().save(profiler, {
+                'kind': 'request',
+                'name': f"{request.method} {request.path}",
+                'method': request.method,
+                'path': request.path,
+                'query_string': request.META.get('QUERY_STRING', ''),
+                'status': response.status_code if response is not None else 500,
+                'user_id': str(user.pk) if user is not None and user.is_authenticated else None,
+            })
+
+    def should_profile(self, request):
+        if not settings.PROFILING_ENABLED:
+            return False
+        if settings.PROFILING_ALLOW_HEADER and request.headers.get(settings.PROFILING_HEADER):
+            return True
+        return should_sample(settings.PROFILING_SAMPLE_RATE)
@@ -0,0 +1,9 @@
+from .db_router import replica_reads
+
+
+class ReplicaReadMixin:
+    """Serve a DRF view's list reads from a read replica (see core/db_router.py)."""
+
+    def list(self, request, *args, **kwargs):
+        with replica_reads(getattr(request.user, 'id', None)):
+            return super().list(request, *args, **kwargs)
@@ -0,0 +1,27 @@
+from rest_framework.pagination import CursorPagination
+
+
+class NestedCursorPagination(CursorPagination):
+    """Cursor pagination for nested listings (a detail action's related rows).
+
+    The parent viewset's OrderingFilter describes the parent rows, so it is
+    ignored here; the fixed ordering must match a composite index.
+    """
+    page_size_query_param = 'page_size'
+
+    def get_ordering(self, request, queryset, view):
+        return self.ordering
+
+
+class ChunkCursorPagination(NestedCursorPagination):
+    """Keyset pagination over one document's chunks, served by the (document, chunk_index) index."""
+    ordering = ('chunk_index',)
+    page_size = 100
+    max_page_size = 1000
+
+
+class QuestionCursorPagination(NestedCursorPagination):
+    """Keyset pagination over one conversation's questions, served by the (conversation, created_at) index."""
+    ordering = ('created_at',)
+    page_size = 50
+    max_page_size = 500
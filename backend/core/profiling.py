@@ -0,0 +1,140 @@
+"""Low-overhead sampling profiler for requests and Celery tasks.
+
+A sampled run gets a background thread that snapshots the worker thread's
+stack every PROFILING_INTERVAL_MS. Stacks are written in collapsed format
+("frame;frame;frame count"), which flamegraph.pl, speedscope and inferno read
+directly, next to a JSON file with the request/task metadata.
+"""
+import functools
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from django.conf import settings
+from django.utils import timezone
+
+
+class SamplingProfiler:
+    """Periodically sample one thread's call stack from a background thread."""
+
+    def __init__(self, thread_id: int = None, interval: float = None):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval or settings.PROFILING_INTERVAL_MS / 1000
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self.started_at = None
+        self.duration_ms = 0
+
+    def start(self):
+        self.started_at = timezone.now()
+        self._start = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration_ms = int((time.perf_counter() - self._start) * 1000)
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            stack.reverse()
+            self.stacks[';'.join(stack)] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        return '\n'.join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+class ProfileStore:
+    """Profiles on local disk, rotated to keep the newest PROFILING_MAX_FILES."""
+
+    def __init__(self, directory=None, max_files: int = None):
+        self.directory = Path(directory or settings.PROFILING_DIR)
+        self.max_files = max_files or settings.PROFILING_MAX_FILES
+
+    def save(self, profiler: SamplingProfiler, metadata: dict) -> str:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        profile_id = f"{profiler.started_at:%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}"
+        metadata = dict(
+            metadata,
+            id=profile_id,
+            started_at=profiler.started_at.isoformat(),
+            duration_ms=profiler.duration_ms,
+            samples=profiler.samples,
+            interval_ms=int(profiler.interval * 1000),
+        )
+        (self.directory / f"{profile_id}.collapsed").write_text(profiler.collapsed())
+        (self.directory / f"{profile_id}.json").write_text(json.dumps(metadata, indent=2))
+        self.rotate()
+        return profile_id
+
+    def rotate(self):
+        profiles = sorted(self.directory.glob('*.json'))
+        for path in profiles[:max(len(profiles) - self.max_files, 0)]:
+            path.unlink(missing_ok=True)
+            path.with_suffix('.collapsed').unlink(missing_ok=True)
+
+    def list(self, kind: str = None) -> list:
+        if not self.directory.exists():
+            return []
+        profiles = []
+        for path in self.directory.glob('*.json'):
+            try:
+                metadata = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            if kind and metadata.get('kind') != kind:
+                continue
+            metadata['path'] = str(path.with_suffix('.collapsed'))
+            profiles.append(metadata)
+        return profiles
+
+
+def should_sample(rate: float) -> bool:
+    return settings.PROFILING_ENABLED and rate > 0 and random.random() < rate
+
+
+def profile_task(func):
+    """Celery task decorator that profiles PROFILING_TASK_SAMPLE_RATE of runs.
+
+    Apply it below @shared_task so the profiler wraps the task body.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not should_sample(settings.PROFILING_TASK_SAMPLE_RATE):
+            return func(*args, **kwargs)
+
+        profiler = SamplingProfiler().start()
+        status = 'success'
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            status = 'error'
+            raise
+        finally:
+            profiler.stop()
+            ProfileStore().save(profiler, {
+                'kind': 'task',
+                'name': f"{func.__module__}.{func.__name__}",
+                'args': [str(arg)[:200] for arg in args],
+                'status': status,
+            })
+    return wrapper
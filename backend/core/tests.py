@@ -1,3 +1,171 @@
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from io import StringIO
+from unittest.mock import patch
+import tempfile
+import time
 
-# Create your tests here.
+from . import db_router
+from .middleware import SamplingProfilerMiddleware
+from .profiling import ProfileStore
+
+
+def slow_view(request):
+    time.sleep(0.05)
+    return HttpResponse('ok')
+
+
+class SamplingProfilerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.settings_override = override_settings(
+            PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=0.0, PROFILING_ALLOW_HEADER=True,
+            PROFILING_INTERVAL_MS=1, PROFILING_DIR=self.tmp.name, PROFILING_MAX_FILES=2,
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def test_flagged_request_writes_collapsed_stacks(self):
+        middleware = SamplingProfilerMiddleware(slow_view)
+        middleware(RequestFactory().get('/api/v1/documents/', HTTP_X_PROFILE='1'))
+
+        profiles = ProfileStore().list()
+        self.assertEqual(len(profiles), 1)
+        self.assertEqual(profiles[0]['name'], 'GET /api/v1/documents/')
+        self.assertGreater(profiles[0]['samples'], 0)
+        with open(profiles[0]['path']) as f:
+            self.assertIn('slow_view', f.read())
+
+    def test_unflagged_requests_are_not_profiled_and_files_rotate(self):
+        middleware = SamplingProfilerMiddleware(slow_view)
+        middleware(RequestFactory().get('/'))
+        self.assertEqual(ProfileStore().list(), [])
+
+        for _ in range(3):
+            middleware(RequestFactory().get('/', HTTP_X_PROFILE='1'))
+        self.assertEqual(len(ProfileStore().list()), 2)
+
+        stdout = StringIO()
+        call_command('list_profiles', stdout=stdout)
+        self.assertIn('GET /', stdout.getvalue())
+
+
+class StageTimerTests(SimpleTestCase):
+
+    def test_nested_stages_land_on_the_active_timer(self):
+        from prometheus_client import REGISTRY
+        from .metrics import StageTimer, stage
+
+        before = REGISTRY.get_sample_value('rag_stage_seconds_count', {'pipeline': 'timer-test', 'stage': 'search'}) or 0
+        with StageTimer('timer-test') as timer:
+            with timer.stage('lookup'):
+                time.sleep(0.01)
+            for _ in range(2):
+                # As called from inside a service, without a reference to the timer
+                with stage('search'):
+                    time.sleep(0.01)
+
+        self.assertEqual(set(timer.timings), {'lookup', 'search'})
+        self.assertGreaterEqual(timer.timings['search'], 20)
+        self.assertGreaterEqual(timer.total_ms, sum(timer.timings.values()))
+        self.assertEqual(
+            REGISTRY.get_sample_value('rag_stage_seconds_count', {'pipeline': 'timer-test', 'stage': 'search'}), before + 2,
+        )
+
+    def test_stage_outside_a_timer_is_only_observed(self):
+        from prometheus_client import REGISTRY
+        from .metrics import stage
+
+        before = REGISTRY.get_sample_value('rag_stage_seconds_count', {'pipeline': 'rag', 'stage': 'standalone'}) or 0
+        with stage('standalone'):
+            pass
+        self.assertEqual(REGISTRY.get_sample_value('rag_stage_seconds_count', {'pipeline': 'rag', 'stage': 'standalone'}), before + 1)
+
+
+class MetricsEndpointTests(SimpleTestCase):
+
+    @override_settings(METRICS_AUTH_TOKEN='', METRICS_ALLOWED_IPS=['127.0.0.1'])
+    def test_without_a_token_only_allowed_addresses_are_served(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'rag_stage_seconds', response.content)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.7').status_code, 403)
+
+    @override_settings(METRICS_AUTH_TOKEN='scrape-secret', METRICS_ALLOWED_IPS=['127.0.0.1'])
+    def test_token_is_required_when_set(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret', REMOTE_ADDR='203.0.113.7')
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(
+    DATABASES=dict(settings.DATABASES, replica1=settings.DATABASES['default'], replica2=settings.DATABASES['default']),
+    DATABASE_REPLICA_STICKY_SECONDS=60,
+)
+class ReplicaRouterTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.router = db_router.ReplicaRouter()
+
+    def test_only_opted_in_reads_use_replicas(self):
+        with patch.object(db_router, 'is_replica_healthy', return_value=True):
+            self.assertEqual(self.router.db_for_read(None), 'default')
+            with db_router.replica_reads():
+                self.assertIn(self.router.db_for_read(None), ('replica1', 'replica2'))
+                self.assertEqual(self.router.db_for_write(None), 'default')
+
+    def test_user_reads_own_writes_from_primary(self):
+        db_router.pin_to_primary(42)
+        with patch.object(db_router, 'is_replica_healthy', return_value=True):
+            with db_router.replica_reads(42):
+                self.assertEqual(self.router.db_for_read(None), 'default')
+            with db_router.replica_reads(43):
+                self.assertNotEqual(self.router.db_for_read(None), 'default')
+
+    def test_unhealthy_replicas_fail_over(self):
+        with patch.object(db_router, 'is_replica_healthy', side_effect=lambda alias: alias == 'replica2'):
+            with db_router.replica_reads():
+                self.assertEqual({self.router.db_for_read(None) for _ in range(20)}, {'replica2'})
+        with patch.object(db_router, 'is_replica_healthy', return_value=False):
+            with db_router.replica_reads():
+                self.assertEqual(self.router.db_for_read(None), 'default')
+
+
+class LargeTableAdminTests(TestCase):
+
+    def setUp(self):
+        from qa.benchmarks import create_corpus
+
+        self.admin = get_user_model().objects.create_superuser(username='ops', email='ops@example.com', password='pass12345')
+        self.client.force_login(self.admin)
+        self.documents = create_corpus(self.admin, n_documents=3, chunks_per_document=4)
+
+    def test_chunk_changelist_filters_by_document_id(self):
+        url = '/admin/documents/documentchunk/'
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'document_id': str(self.documents[1].id)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 4)
+        self.assertContains(response, 'name="document_id"')
+        # No vectors or extracted text, and no query per listed chunk
+        columns = ('"embedding"', '"embedding_reduced"', '"extracted_text"')
+        self.assertFalse([query for query in queries if any(column in query['sql'] for column in columns)])
+        self.assertLess(len(queries), 10)
+
+        response = self.client.get(url, {'document_id': 'not-an-id'})
+        self.assertEqual(response.context['cl'].result_count, 0)
+
+    def test_changelists_render(self):
+        for url in ('/admin/documents/document/', '/admin/qa/question/', '/admin/qa/conversation/', '/admin/users/user/'):
+            response = self.client.get(url, {'q': 'example'})
+            self.assertEqual(response.status_code, 200, url)
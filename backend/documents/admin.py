@@ -1,19 +1,31 @@
 from django.contrib import admin
-from .models import Document, DocumentCollection, DocumentChunk
+from core.admin import LargeTableAdmin, RelatedIdFilter
+from .models import Document, DocumentCollection, DocumentChunk, EmbeddingMigration, UploadSession
+
+
+class DocumentIdFilter(RelatedIdFilter):
+    title = 'document'
+    parameter_name = 'document_id'
+
 
 # Register your admin here.
 @admin.register(DocumentCollection)
-class DocumentCollectionAdmin(admin.ModelAdmin):
+class DocumentCollectionAdmin(LargeTableAdmin):
     list_display = ['name', 'user', 'created_at']
     list_filter = ['created_at']
+    list_select_related = ['user']
     search_fields = ['name', 'description', 'user__email']
+    raw_id_fields = ['user']
     
 @admin.register(Document)
-class DocumentAdmin(admin.ModelAdmin):
+class DocumentAdmin(LargeTableAdmin):
     list_display = ['title', 'user', 'file_type', 'status', 'created_at']
     list_filter = ['file_type', 'status', 'created_at']
+    list_select_related = ['user']
     search_fields = ['title', 'user__email']
     readonly_fields = ['file_size', 'page_count', 'word_count', 'processed_at']  # Fixed: processing_at -> processed_at
+    raw_id_fields = ['user']
+    autocomplete_fields = ['collection']
     
     def save_model(self, request, obj, form, change):
         """Override to automatically calculate file_size from uploaded file."""
@@ -22,7 +34,35 @@ class DocumentAdmin(admin.ModelAdmin):
         super().save_model(request, obj, form, change)
     
 @admin.register(DocumentChunk)
-class DocumentChunkAdmin(admin.ModelAdmin):
+class DocumentChunkAdmin(LargeTableAdmin):
     list_display = ['document', 'chunk_index', 'page_number']
-    list_filter = ['document']
-    search_fields = ['text']
\ No newline at end of file
+    # Filtering by document id, since listing every document in the sidebar doesn't scale
+    list_filter = [DocumentIdFilter]
+    search_fields = ['text']
+    # By the document column itself: ordering by the foreign key would sort on the document's created_at
+    ordering = ['document_id', 'chunk_index']
+    autocomplete_fields = ['document']
+    # Vectors are thousands of floats each and unreadable in a form
+    exclude = ['embedding', 'embedding_reduced']
+    
+    def get_queryset(self, request):
+        # The manager defers the vectors; the joined document must not bring its extracted_text along
+        return super().get_queryset(request).select_related('document').defer('document__extracted_text')
+    
+@admin.register(UploadSession)
+class UploadSessionAdmin(LargeTableAdmin):
+    list_display = ['filename', 'user', 'status', 'received_bytes', 'file_size', 'created_at']
+    list_filter = ['status', 'file_type']
+    list_select_related = ['user']
+    search_fields = ['filename', 'user__email']
+    readonly_fields = ['received_bytes', 'parts_received', 'sha256', 'document']
+    raw_id_fields = ['user', 'collection']
+    
+@admin.register(EmbeddingMigration)
+class EmbeddingMigrationAdmin(admin.ModelAdmin):
+    list_display = ['user', 'target_model', 'status', 'embedded_chunks', 'total_chunks', 'requests_per_minute', 'updated_at']
+    list_filter = ['status', 'target_model']
+    list_select_related = ['user']
+    search_fields = ['user__email']
+    readonly_fields = ['embedded_chunks', 'total_chunks', 'last_chunk_id', 'requests_per_minute', 'consecutive_errors', 'completed_at']
+    raw_id_fields = ['user']
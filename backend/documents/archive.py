@@ -0,0 +1,339 @@
+"""Portable archives of documents, chunks and embeddings.
+
+An archive is a directory that can be moved between environments and loaded
+again without re-running ingestion or paying for embeddings:
+
+    manifest.json       format version, counts, embedding models, SHA-256 of every file
+    documents.jsonl     one document per line, including extracted_text and collection name
+    chunks/*.npy        one column per file: ids, owning document, index, page, embedding model
+    chunks/embeddings.npy   float32 (chunks, dimension); rows without an embedding are zero
+    chunks/text.bin     chunk texts back to back, UTF-8, sliced by chunks/text_offsets.npy
+    files/              original files, with --include-files
+
+Columns are written through memory maps and read back the same way, so neither
+side holds the corpus in memory. On PostgreSQL chunks are loaded with a binary
+COPY, which takes the vectors in pgvector's binary form.
+"""
+import hashlib
+import io
+import json
+import os
+import shutil
+import struct
+import uuid
+from datetime import datetime, timezone as dt_timezone
+import numpy as np
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Document, DocumentChunk, DocumentCollection
+
+
+FORMAT = 'doc-assistant-archive'
+FORMAT_VERSION = 1
+READ_SIZE = 1024 * 1024
+
+DOCUMENT_FIELDS = (
+    'id', 'title', 'file_type', 'file_size', 'status', 'processing_error', 'extracted_text',
+    'page_count', 'word_count', 'chunks_count', 'created_at', 'processed_at',
+)
+CHUNK_COLUMNS = ('ids', 'document', 'chunk_index', 'page_number', 'has_embedding', 'embedding_model', 'text_offsets')
+
+# Chunk columns loaded by COPY, in order
+COPY_COLUMNS = ('id', 'document_id', 'user_id', 'text', 'chunk_index', 'page_number', 'embedding', 'embedding_model', 'created_at')
+PG_EPOCH = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class ArchiveError(Exception):
+    """The archive is incomplete, corrupted or of an unknown format."""
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _column_path(directory: str, name: str) -> str:
+    return os.path.join(directory, 'chunks', f'{name}.npy')
+
+
+def export_archive(documents, directory: str, include_files: bool = False, progress=None) -> dict:
+    """Write the documents and their chunks to a new archive directory; returns its manifest."""
+    if os.path.exists(directory) and os.listdir(directory):
+        raise ArchiveError(f"{directory} is not empty.")
+    os.makedirs(os.path.join(directory, 'chunks'), exist_ok=True)
+
+    document_index = {}
+    with open(os.path.join(directory, 'documents.jsonl'), 'w', encoding='utf-8') as out:
+        rows = documents.with_content().order_by('created_at').values(*DOCUMENT_FIELDS, 'file', 'collection__name')
+        for row in rows.iterator(chunk_size=100):
+            document_index[row['id']] = len(document_index)
+            stored_name = row.pop('file')
+            row['collection'] = row.pop('collection__name')
+            row['file'] = os.path.basename(stored_name) if stored_name else None
+            row['archived_file'] = None
+            if include_files and stored_name and default_storage.exists(stored_name):
+                row['archived_file'] = f"files/{document_index[row['id']]}-{row['file']}"
+                os.makedirs(os.path.join(directory, 'files'), exist_ok=True)
+                with default_storage.open(stored_name, 'rb') as source, \
+                        open(os.path.join(directory, row['archived_file']), 'wb') as target:
+                    shutil.copyfileobj(source, target, READ_SIZE)
+            out.write(json.dumps(row, cls=DjangoJSONEncoder) + '\n')
+
+    chunks = DocumentChunk.objects.with_embeddings().filter(document_id__in=list(document_index))
+    total = chunks.count()
+    dimension = DocumentChunk._meta.get_field('embedding').dimensions
+
+    def column(name, dtype, shape=()):
+        return np.lib.format.open_memmap(_column_path(directory, name), mode='w+', dtype=dtype, shape=(total,) + shape)
+
+    ids = column('ids', 'u1', (16,))
+    owners = column('document', 'i4')
+    indexes = column('chunk_index', 'i4')
+    pages = column('page_number', 'i4')
+    has_embedding = column('has_embedding', '?')
+    model_codes = column('embedding_model', 'i2')
+    embeddings = column('embeddings', 'f4', (dimension,))
+    offsets = np.lib.format.open_memmap(_column_path(directory, 'text_offsets'), mode='w+', dtype='i8', shape=(total + 1,))
+
+    models = []
+    position = 0
+    written = 0
+    # Chunks added after the count are left for the next export; with fewer, the manifest records how many were written
+    rows = chunks.order_by('document_id', 'chunk_index').values_list(
+        'id', 'document_id', 'text', 'chunk_index', 'page_number', 'embedding', 'embedding_model',
+    )[:total]
+    with open(os.path.join(directory, 'chunks', 'text.bin'), 'wb') as text_out:
+        for i, (chunk_id, document_id, text, chunk_index, page_number, embedding, model) in enumerate(rows.iterator(chunk_size=2000)):
+            ids[i] = np.frombuffer(chunk_id.bytes, dtype='u1')
+            owners[i] = document_index[document_id]
+            indexes[i] = chunk_index
+            pages[i] = -1 if page_number is None else page_number
+            if embedding is not None:
+                has_embedding[i] = True
+                embeddings[i] = embedding
+            if model not in models:
+                models.append(model)
+            model_codes[i] = models.index(model)
+
+            encoded = text.encode('utf-8')
+            offsets[i] = position
+            text_out.write(encoded)
+            position += len(encoded)
+            written = i + 1
+            if progress and written % 10000 == 0:
+                progress(written, total)
+    offsets[written] = position
+
+    for array in (ids, owners, indexes, pages, has_embedding, model_codes, embeddings, offsets):
+        array.flush()
+    del ids, owners, indexes, pages, has_embedding, model_codes, embeddings, offsets
+
+    files = {}
+    for root, _, names in os.walk(directory):
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            files[os.path.relpath(path, directory)] = _sha256(path)
+    manifest = {
+        'format': FORMAT,
+        'version': FORMAT_VERSION,
+        'created_at': timezone.now().isoformat(),
+        'documents': len(document_index),
+        'chunks': written,
+        'embedding_dimension': dimension,
+        'embedding_models': models,
+        'files': files,
+    }
+    with open(os.path.join(directory, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def verify_archive(directory: str) -> dict:
+    """Check the archive's format and every file's checksum; returns the manifest."""
+    try:
+        with open(os.path.join(directory, 'manifest.json')) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ArchiveError(f"Cannot read manifest: {e}")
+    if manifest.get('format') != FORMAT or manifest.get('version') != FORMAT_VERSION:
+        raise ArchiveError(f"Unsupported archive format {manifest.get('format')} v{manifest.get('version')}.")
+
+    for name, expected in manifest['files'].items():
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            raise ArchiveError(f"{name} is missing.")
+        if _sha256(path) != expected:
+            raise ArchiveError(f"{name} does not match its checksum.")
+    return manifest
+
+
+def _field(encoded: bytes) -> bytes:
+    return struct.pack('>i', len(encoded)) + encoded
+
+
+NULL_FIELD = struct.pack('>i', -1)
+
+
+def _copy_row(chunk_id, document_id, user_id, text, chunk_index, page_number, embedding, model, created_at) -> bytes:
+    """One tuple of PostgreSQL's binary COPY format for COPY_COLUMNS."""
+    from pgvector import Vector
+
+    delta = created_at - PG_EPOCH
+    microseconds = (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+    return b''.join((
+        struct.pack('>h', len(COPY_COLUMNS)),
+        _field(chunk_id.bytes),
+        _field(document_id.bytes),
+        _field(struct.pack('>q', user_id)),
+        _field(text.encode('utf-8')),
+        _field(struct.pack('>i', chunk_index)),
+        NULL_FIELD if page_number is None else _field(struct.pack('>i', page_number)),
+        NULL_FIELD if embedding is None else _field(Vector(embedding).to_binary()),
+        _field(model.encode('utf-8')),
+        _field(struct.pack('>q', microseconds)),
+    ))
+
+
+class _CopyStream(io.RawIOBase):
+    """File-like view of a generator of byte strings, for cursor.copy_expert()."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while not self._buffer:
+            try:
+                self._buffer = next(self._chunks)
+            except StopIteration:
+                return 0
+        size = min(len(target), len(self._buffer))
+        target[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def _binary_copy(rows):
+    yield b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+    batch = []
+    for row in rows:
+        batch.append(_copy_row(*row))
+        if len(batch) >= 1000:
+            yield b''.join(batch)
+            batch = []
+    batch.append(struct.pack('>h', -1))
+    yield b''.join(batch)
+
+
+def _chunk_rows(directory: str, manifest: dict, document_ids: list, user_id, keep_ids: bool):
+    """Yield chunk rows in COPY_COLUMNS order straight from the memory-mapped columns."""
+    columns = {name: np.load(_column_path(directory, name), mmap_mode='r') for name in CHUNK_COLUMNS}
+    embeddings = np.load(_column_path(directory, 'embeddings'), mmap_mode='r')
+    models = manifest['embedding_models']
+    created_at = timezone.now()
+
+    with open(os.path.join(directory, 'chunks', 'text.bin'), 'rb') as text_in:
+        offsets = columns['text_offsets']
+        for i in range(manifest['chunks']):
+            text = text_in.read(int(offsets[i + 1] - offsets[i])).decode('utf-8')
+            page_number = int(columns['page_number'][i])
+            yield (
+                uuid.UUID(bytes=columns['ids'][i].tobytes()) if keep_ids else uuid.uuid4(),
+                document_ids[columns['document'][i]],
+                user_id,
+                text,
+                int(columns['chunk_index'][i]),
+                None if page_number < 0 else page_number,
+                np.array(embeddings[i]) if columns['has_embedding'][i] else None,
+                models[columns['embedding_model'][i]],
+                created_at,
+            )
+
+
+def import_archive(directory: str, user, keep_ids: bool = False, batch_size: int = 2000) -> dict:
+    """Load an archive into user's account in one transaction; returns counts of what was created.
+
+    Documents keep their collections (matched or created by name). With
+    keep_ids the original document and chunk ids are reused, e.g. to restore
+    a backup; otherwise new ones are assigned so an archive can be loaded
+    next to its source.
+    """
+    from qa.services.collection_index import RESET, record_collection_change
+    from qa.services.index_cache import bump_index_version
+
+    manifest = verify_archive(directory)
+    if manifest['embedding_dimension'] != DocumentChunk._meta.get_field('embedding').dimensions:
+        raise ArchiveError(f"Archive embeddings have {manifest['embedding_dimension']} dimensions.")
+
+    with open(os.path.join(directory, 'documents.jsonl'), encoding='utf-8') as f:
+        rows = [json.loads(line) for line in f]
+
+    with transaction.atomic():
+        collections = {}
+        documents = []
+        for row in rows:
+            name = row.pop('collection')
+            if name and name not in collections:
+                collections[name] = DocumentCollection.objects.get_or_create(user=user, name=name)[0]
+
+            archived_file, file_name = row.pop('archived_file'), row.pop('file')
+            stored_name = ''
+            if archived_file:
+                with open(os.path.join(directory, archived_file), 'rb') as source:
+                    file_field = Document._meta.get_field('file')
+                    stored_name = default_storage.save(file_field.generate_filename(None, file_name), File(source))
+
+            row['id'] = row['id'] if keep_ids else uuid.uuid4()
+            row['processed_at'] = parse_datetime(row['processed_at']) if row['processed_at'] else None
+            # created_at is set on insert
+            row.pop('created_at')
+            documents.append(Document(user=user, collection=collections.get(name), file=stored_name, **row))
+
+        Document.objects.bulk_create(documents, batch_size=500)
+        # bulk_create skips the signals that keep these counters
+        for collection in collections.values():
+            count = sum(1 for document in documents if document.collection_id == collection.id)
+            DocumentCollection.objects.filter(id=collection.id).update(documents_count=F('documents_count') + count)
+        type(user).objects.filter(id=user.id).update(total_documents=F('total_documents') + len(documents))
+
+        chunk_rows = _chunk_rows(directory, manifest, [document.id for document in documents], user.id, keep_ids)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.copy_expert(
+                    f"COPY {DocumentChunk._meta.db_table} ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT binary)",
+                    _CopyStream(_binary_copy(chunk_rows)),
+                    size=READ_SIZE,
+                )
+        else:
+            batch = []
+            for row in chunk_rows:
+                batch.append(DocumentChunk(**dict(zip(COPY_COLUMNS, row))))
+                if len(batch) >= batch_size:
+                    DocumentChunk.objects.bulk_create(batch)
+                    batch = []
+            DocumentChunk.objects.bulk_create(batch)
+
+        loaded = DocumentChunk.objects.filter(document_id__in=[document.id for document in documents]).count()
+        if loaded != manifest['chunks']:
+            raise ArchiveError(f"Loaded {loaded} chunks, the manifest lists {manifest['chunks']}.")
+
+    if connection.vendor == 'postgresql':
+        # Fresh statistics so the planner sees the new rows, then rebuild the user's search index on next use
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {DocumentChunk._meta.db_table}')
+    bump_index_version(user.id)
+    for collection in collections.values():
+        record_collection_change(collection.id, user.id, RESET)
+    return {'documents': len(documents), 'chunks': loaded, 'collections': len(collections)}
@@ -0,0 +1,88 @@
+"""Benchmarks for DOCX text extraction on large generated documents.
+
+Compares DocumentProcessor's streaming extractor with the python-docx object
+model it replaced. Each extraction runs in a forked child so its peak
+memory can be read from the child's max RSS; tracemalloc would miss lxml's
+allocations, which make up most of python-docx's footprint.
+"""
+import multiprocessing
+import random
+import resource
+import time
+from typing import Dict
+
+from qa.benchmarks import synthetic_text
+from .utils import DocumentProcessor
+
+
+def generate_docx(path: str, paragraphs: int, paragraphs_per_page: int = 40, table_every: int = 50,
+                  table_rows: int = 10, seed: int = 0) -> str:
+    """Write a synthetic DOCX with page breaks and a table every table_every paragraphs."""
+    from docx import Document as DocxDocument
+
+    rng = random.Random(seed)
+    doc = DocxDocument()
+    for idx in range(1, paragraphs + 1):
+        doc.add_paragraph(synthetic_text(rng, words=60))
+        if table_every and idx % table_every == 0:
+            table = doc.add_table(rows=table_rows, cols=3)
+            for row in table.rows:
+                for cell in row.cells:
+                    cell.text = synthetic_text(rng, words=8)
+        if paragraphs_per_page and idx % paragraphs_per_page == 0:
+            doc.add_page_break()
+    doc.save(path)
+    return path
+
+
+def extract_with_python_docx(file_path: str) -> tuple[str, int]:
+    """The previous extractor: python-docx object model, paragraph-count page estimate (skips tables)."""
+    from docx import Document as DocxDocument
+
+    doc = DocxDocument(file_path)
+    text = "\n\n".join([para.text for para in doc.paragraphs if para.text])
+    return text, max(1, len(doc.paragraphs) // 20)
+
+
+EXTRACTORS = {
+    'streaming': DocumentProcessor.extract_text_from_docx,
+    'python_docx': extract_with_python_docx,
+}
+
+
+def _run_extractor(name: str, file_path: str, results):
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    text, page_count = EXTRACTORS[name](file_path)
+    seconds = time.perf_counter() - start
+    results.put({
+        'seconds': seconds,
+        'peak_rss_mb': (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_kb) / 1024,
+        'characters': len(text),
+        'page_count': page_count,
+    })
+
+
+def measure_extraction(name: str, file_path: str) -> Dict:
+    """Run one extractor in a forked child and return its timing and peak memory growth."""
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    child = context.Process(target=_run_extractor, args=(name, file_path, results))
+    child.start()
+    result = results.get()
+    child.join()
+    return result
+
+
+def benchmark_docx_extraction(file_path: str, repeat: int = 3) -> Dict:
+    """Best-of-repeat time and peak memory of each extractor on one file."""
+    summary = {}
+    for name in EXTRACTORS:
+        runs = [measure_extraction(name, file_path) for _ in range(repeat)]
+        summary[name] = {
+            'seconds': round(min(run['seconds'] for run in runs), 4),
+            'peak_rss_mb': round(min(run['peak_rss_mb'] for run in runs), 1),
+            'characters': runs[0]['characters'],
+            'page_count': runs[0]['page_count'],
+        }
+    return summary
@@ -0,0 +1,84 @@
+"""Soft deletion of documents with background purging.
+
+Deleting a document only stamps deleted_at: the default manager and the
+search index stop returning it at once, and the request returns without
+touching its chunks. purge_deleted_documents then removes the chunks in
+batches of set-based DELETEs (never loading a row, let alone its embedding),
+deletes the stored file and finally the document row itself.
+"""
+from collections import Counter
+from functools import partial
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ChunkEmbedding, Document, DocumentChunk, DocumentCollection
+
+
+def soft_delete_documents(documents, detach_collection: bool = False) -> int:
+    """Hide documents from every read path and queue their purge; returns how many were deleted.
+
+    With detach_collection the documents are also taken out of their
+    collection, so the collection row itself can be deleted right away.
+    """
+    from qa.services.collection_index import REMOVE, record_collection_change
+    from qa.services.index_cache import bump_index_version
+    from .task import purge_deleted_documents
+
+    with transaction.atomic():
+        rows = list(documents.values_list('id', 'user_id', 'collection_id'))
+        if not rows:
+            return 0
+        changes = {'deleted_at': timezone.now()}
+        if detach_collection:
+            changes['collection'] = None
+        Document.objects.filter(id__in=[row[0] for row in rows]).update(**changes)
+
+        if not detach_collection:
+            for collection_id, count in Counter(row[2] for row in rows if row[2]).items():
+                DocumentCollection.objects.filter(id=collection_id).update(documents_count=F('documents_count') - count)
+
+        # Loaded indexes drop the documents' chunks when they are rebuilt
+        for user_id in {row[1] for row in rows}:
+            bump_index_version(user_id)
+        for document_id, user_id, collection_id in rows:
+            transaction.on_commit(partial(record_collection_change, collection_id, user_id, REMOVE, document_id))
+        transaction.on_commit(purge_deleted_documents.delay)
+    return len(rows)
+
+
+def _delete_in_batches(sql: str, params: list, batch_size: int) -> int:
+    deleted = 0
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, params + [batch_size])
+            count = cursor.rowcount
+        deleted += count
+        if count < batch_size:
+            return deleted
+
+
+def purge_document(document: Document, batch_size: int = None) -> int:
+    """Delete a soft-deleted document's rows and file; returns how many chunks were removed."""
+    batch_size = batch_size or settings.DOCUMENT_PURGE_BATCH_SIZE
+    chunks = DocumentChunk._meta.db_table
+    embeddings = ChunkEmbedding._meta.db_table
+    document_id = DocumentChunk._meta.get_field('document').get_db_prep_value(document.id, connection)
+
+    _delete_in_batches(
+        f'DELETE FROM {embeddings} WHERE id IN ('
+        f'SELECT e.id FROM {embeddings} e JOIN {chunks} c ON c.id = e.chunk_id WHERE c.document_id = %s LIMIT %s)',
+        [document_id], batch_size,
+    )
+    removed = _delete_in_batches(
+        f'DELETE FROM {chunks} WHERE id IN (SELECT id FROM {chunks} WHERE document_id = %s LIMIT %s)',
+        [document_id], batch_size,
+    )
+
+    if document.file:
+        document.file.delete(save=False)
+    # Only the (now empty) chunk relation and upload sessions remain to cascade. Deleting by id
+    # leaves the caller free to pass a partly loaded document; the signal still needs these fields.
+    Document.all_objects.filter(id=document.id).only('id', 'user_id', 'collection_id', 'deleted_at').delete()
+    return removed
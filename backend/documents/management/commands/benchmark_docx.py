@@ -0,0 +1,47 @@
+import json
+import os
+import tempfile
+from django.core.management.base import BaseCommand
+
+from documents import benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Benchmark streaming DOCX extraction against python-docx on generated documents'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--paragraphs', type=int, nargs='+', default=[1000, 10000, 50000],
+                            help='Document sizes to generate, in paragraphs')
+        parser.add_argument('--file', help='Benchmark this DOCX instead of generated ones')
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Write results as JSON to this path')
+
+    def handle(self, *args, **options):
+        results = []
+        if options['file']:
+            results.append(self.run(options['file'], options['repeat'], label=options['file']))
+        else:
+            with tempfile.TemporaryDirectory() as directory:
+                for paragraphs in options['paragraphs']:
+                    path = benchmarks.generate_docx(
+                        os.path.join(directory, f'{paragraphs}.docx'), paragraphs, seed=options['seed'],
+                    )
+                    results.append(self.run(path, options['repeat'], label=f'{paragraphs} paragraphs'))
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def run(self, path, repeat, label):
+        result = benchmarks.benchmark_docx_extraction(path, repeat=repeat)
+        result['file'] = label
+        result['file_size_mb'] = round(os.path.getsize(path) / 1024 / 1024, 2)
+        for name in benchmarks.EXTRACTORS:
+            row = result[name]
+            self.stdout.write(
+                f"{label} ({result['file_size_mb']} MB) {name}: {row['seconds']} s, "
+                f"+{row['peak_rss_mb']} MB peak RSS, {row['characters']} chars, {row['page_count']} pages"
+            )
+        return result
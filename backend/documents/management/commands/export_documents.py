@@ -0,0 +1,42 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from documents.archive import ArchiveError, export_archive
+from documents.models import Document
+
+
+class Command(BaseCommand):
+    help = (
+        "Export a user's or a collection's documents, chunks and embeddings to an archive directory "
+        "that import_documents loads without re-running ingestion."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Archive directory to create')
+        parser.add_argument('--user', help='Email of the user whose documents to export')
+        parser.add_argument('--collection', help='ID of the collection to export')
+        parser.add_argument('--include-files', action='store_true', help='Also copy the original uploaded files')
+
+    def handle(self, *args, **options):
+        if bool(options['user']) == bool(options['collection']):
+            raise CommandError('Pass exactly one of --user or --collection.')
+
+        documents = Document.objects.all()
+        if options['user']:
+            try:
+                documents = documents.filter(user=get_user_model().objects.get(email=options['user']))
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"No user with email {options['user']}.")
+        else:
+            documents = documents.filter(collection_id=options['collection'])
+
+        try:
+            manifest = export_archive(
+                documents, options['output'], include_files=options['include_files'],
+                progress=lambda done, total: self.stdout.write(f"  {done}/{total} chunks"),
+            )
+        except ArchiveError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {manifest['documents']} documents and {manifest['chunks']} chunks to {options['output']}"
+        ))
@@ -0,0 +1,41 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from documents.archive import ArchiveError, import_archive, verify_archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Load an archive written by export_documents into a user's account. Checksums are verified first; "
+        "on PostgreSQL chunks and embeddings are loaded with a binary COPY in one transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('archive', help='Archive directory')
+        parser.add_argument('--user', help='Email of the user to import into')
+        parser.add_argument('--keep-ids', action='store_true', help='Reuse the archived document and chunk ids (restoring a backup)')
+        parser.add_argument('--verify-only', action='store_true', help='Only check the archive against its manifest')
+
+    def handle(self, *args, **options):
+        try:
+            if options['verify_only']:
+                manifest = verify_archive(options['archive'])
+                self.stdout.write(self.style.SUCCESS(
+                    f"Archive is intact: {manifest['documents']} documents, {manifest['chunks']} chunks"
+                ))
+                return
+
+            if not options['user']:
+                raise CommandError('--user is required.')
+            try:
+                user = get_user_model().objects.get(email=options['user'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"No user with email {options['user']}.")
+
+            counts = import_archive(options['archive'], user, keep_ids=options['keep_ids'])
+        except ArchiveError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {counts['documents']} documents and {counts['chunks']} chunks "
+            f"into {counts['collections']} collections for {user.email}"
+        ))
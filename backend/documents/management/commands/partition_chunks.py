@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from documents import partitioning
+
+
+STEPS = ['status', 'backfill', 'create', 'copy', 'index', 'swap', 'drop-old']
+
+
+class Command(BaseCommand):
+    help = (
+        "Migrate document_chunks online to a table hash-partitioned by user. Run the steps in order: "
+        "backfill, create, copy, index, swap, then drop-old once the swap is known good. "
+        "Writes keep flowing until swap, which only takes a brief lock."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('step', choices=STEPS)
+        parser.add_argument('--partitions', type=int, default=16, help='Number of hash partitions (create, index)')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per transaction (backfill, copy)')
+        parser.add_argument('--after', help='Resume the copy after this chunk id')
+        parser.add_argument('--no-vector-index', action='store_true', help='Skip the HNSW index on embedding (needs pgvector >= 0.7)')
+        parser.add_argument('--lock-timeout', default='5s', help='Give up the swap if its lock is not granted within this time')
+
+    def handle(self, *args, **options):
+        step = options['step']
+        if step != 'backfill' and connection.vendor != 'postgresql':
+            raise CommandError('Partitioning requires PostgreSQL.')
+
+        try:
+            if step == 'status':
+                for key, value in partitioning.status().items():
+                    self.stdout.write(f"{key}: {value}")
+
+            elif step == 'backfill':
+                updated = partitioning.backfill_users(
+                    options['batch_size'], progress=lambda n: self.stdout.write(f"  {n} chunks updated"),
+                )
+                self.stdout.write(self.style.SUCCESS(f"Filled user on {updated} chunks"))
+
+            elif step == 'create':
+                missing = partitioning.status()['missing_user']
+                if missing:
+                    raise CommandError(f"{missing} chunks have no user yet; run the backfill step first.")
+                partitioning.create_partitioned_table(options['partitions'])
+                self.stdout.write(self.style.SUCCESS(
+                    f"Created {partitioning.PARTITIONED_TABLE} with {options['partitions']} partitions; writes are mirrored"
+                ))
+
+            elif step == 'copy':
+                copied = partitioning.copy_rows(
+                    options['batch_size'], after=options['after'],
+                    progress=lambda n, last: self.stdout.write(f"  {n} rows copied, last id {last}"),
+                )
+                self.stdout.write(self.style.SUCCESS(f"Copied {copied} rows"))
+
+            elif step == 'index':
+                partitioning.build_indexes(
+                    options['partitions'], vector_index=not options['no_vector_index'],
+                    progress=lambda name: self.stdout.write(f"  built {name}"),
+                )
+                self.stdout.write(self.style.SUCCESS('Indexes built on every partition'))
+
+            elif step == 'swap':
+                state = partitioning.status()
+                if state.get('rows') != state.get('copied_rows'):
+                    raise CommandError(f"Row counts differ ({state.get('rows')} vs {state.get('copied_rows')}); rerun copy.")
+                partitioning.swap_tables(options['lock_timeout'])
+                self.stdout.write(self.style.SUCCESS(
+                    f"{partitioning.TABLE} is now partitioned; the old table is kept as {partitioning.OLD_TABLE}"
+                ))
+
+            elif step == 'drop-old':
+                partitioning.drop_old_table()
+                self.stdout.write(self.style.SUCCESS(f"Dropped {partitioning.OLD_TABLE}"))
+
+        except ValueError as e:
+            raise CommandError(str(e))
@@ -0,0 +1,44 @@
+# Generated by Django 6.0.1 on 2026-10-19 11:20
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counts(apps, schema_editor):
+    Document = apps.get_model('documents', 'Document')
+    DocumentChunk = apps.get_model('documents', 'DocumentChunk')
+    DocumentCollection = apps.get_model('documents', 'DocumentCollection')
+
+    chunk_counts = (
+        DocumentChunk.objects.filter(document=OuterRef('pk'))
+        .order_by().values('document').annotate(count=Count('id')).values('count')
+    )
+    Document.objects.update(chunks_count=Coalesce(Subquery(chunk_counts), 0))
+
+    document_counts = (
+        Document.objects.filter(collection=OuterRef('pk'))
+        .order_by().values('collection').annotate(count=Count('id')).values('count')
+    )
+    DocumentCollection.objects.update(documents_count=Coalesce(Subquery(document_counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='chunks_count',
+            field=models.IntegerField(default=0, editable=False, help_text='Denormalized number of chunks'),
+        ),
+        migrations.AddField(
+            model_name='documentcollection',
+            name='documents_count',
+            field=models.IntegerField(default=0, editable=False, help_text='Denormalized number of documents in the collection'),
+        ),
+        migrations.RunPython(backfill_counts, migrations.RunPython.noop),
+    ]
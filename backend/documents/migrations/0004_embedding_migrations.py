@@ -0,0 +1,69 @@
+# Generated by Django 6.0.1 on 2026-10-19 14:05
+
+import django.db.models.deletion
+import pgvector.django.vector
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+def tag_existing_embeddings(apps, schema_editor):
+    # Every embedding stored so far came from the configured Gemini embedding model
+    DocumentChunk = apps.get_model('documents', 'DocumentChunk')
+    DocumentChunk.objects.filter(embedding__isnull=False).update(embedding_model=settings.GEMINI_EMBEDDING_MODEL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0003_uploadsession'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentchunk',
+            name='embedding_model',
+            field=models.CharField(blank=True, help_text='Embedding model that produced embedding', max_length=100),
+        ),
+        migrations.RunPython(tag_existing_embeddings, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='ChunkEmbedding',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('model', models.CharField(help_text='Embedding model tag, e.g. models/gemini-embedding-001@768', max_length=100)),
+                ('embedding', pgvector.django.vector.VectorField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('chunk', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='extra_embeddings', to='documents.documentchunk')),
+            ],
+            options={
+                'db_table': 'chunk_embeddings',
+                'indexes': [models.Index(fields=['model', 'chunk'], name='chunk_embed_model_f3f82b_idx')],
+                'constraints': [models.UniqueConstraint(fields=('chunk', 'model'), name='unique_chunk_embedding_model')],
+            },
+        ),
+        migrations.CreateModel(
+            name='EmbeddingMigration',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('target_model', models.CharField(max_length=100)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('paused', 'Paused'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('total_chunks', models.IntegerField(default=0)),
+                ('embedded_chunks', models.IntegerField(default=0)),
+                ('last_chunk_id', models.UUIDField(blank=True, null=True)),
+                ('requests_per_minute', models.IntegerField(default=0)),
+                ('consecutive_errors', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='embedding_migrations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'embedding_migrations',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['user', 'status'], name='embedding_m_user_id_8caaea_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'target_model'), name='unique_user_embedding_migration')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-19 15:30
+
+import pgvector.django.vector
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0004_embedding_migrations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentchunk',
+            name='embedding_reduced',
+            field=pgvector.django.vector.VectorField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 6.0.1 on 2026-10-19 16:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+BACKFILL_BATCH_SIZE = 5000
+
+
+def backfill_chunk_users(apps, schema_editor):
+    # Search filters chunks on user_id, so existing chunks must carry their document's owner
+    # before the code that reads it is deployed. The migration is not atomic, so each batch
+    # commits on its own and no long transaction holds locks on the table.
+    Document = apps.get_model('documents', 'Document')
+    DocumentChunk = apps.get_model('documents', 'DocumentChunk')
+    owner = Subquery(Document.objects.filter(id=OuterRef('document_id')).values('user_id')[:1])
+    while True:
+        ids = list(DocumentChunk.objects.filter(user__isnull=True).order_by().values_list('id', flat=True)[:BACKFILL_BATCH_SIZE])
+        if not ids:
+            return
+        DocumentChunk.objects.filter(id__in=ids).update(user_id=owner)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('documents', '0005_documentchunk_embedding_reduced'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentchunk',
+            name='user',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_chunk_users, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='chunkembedding',
+            name='chunk',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='extra_embeddings', to='documents.documentchunk'),
+        ),
+    ]
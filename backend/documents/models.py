@@ -1,6 +1,9 @@
 from django.db import models
+import os
 import uuid
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db.models.functions import Upper
 from pgvector.django import VectorField
 
 # Create your models here.
@@ -9,6 +12,7 @@ class DocumentCollection(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='collections')
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True)
+    documents_count = models.IntegerField(default=0, editable=False, help_text='Denormalized number of documents in the collection')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -21,6 +25,19 @@ class DocumentCollection(models.Model):
     def __str__(self):
         return self.name
     
+class DocumentQuerySet(models.QuerySet):
+    def with_content(self):
+        """Load extracted_text as well; it can be tens of megabytes per row."""
+        return self.defer(None)
+
+
+class DocumentManager(models.Manager.from_queryset(DocumentQuerySet)):
+    """Hides deleted documents and defers extracted_text unless explicitly requested with with_content()."""
+    
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True).defer('extracted_text')
+
+
 class Document(models.Model):
     
     FILE_TYPE_CHOICES = [
@@ -55,41 +72,193 @@ class Document(models.Model):
     extracted_text = models.TextField(blank=True)
     page_count = models.IntegerField(default=0)
     word_count = models.IntegerField(default=0)
+    chunks_count = models.IntegerField(default=0, editable=False, help_text='Denormalized number of chunks')
     
     # Metadata
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     processed_at = models.DateTimeField(null=True, blank=True)
+    # Set when the document is deleted; its rows and file are purged in the background (documents/deletion.py)
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+    
+    objects = DocumentManager()
+    # Includes deleted documents awaiting purge
+    all_objects = models.Manager()
     
     class Meta:
         db_table = 'documents'
         ordering = ['-created_at']
         indexes = [models.Index(fields=['user', '-created_at']),
                    models.Index(fields=['status']),
+                   models.Index(fields=['user', 'deleted_at'], condition=models.Q(deleted_at__isnull=False), name='documents_deleted_idx'),
+                   # Serves the admin's title search (icontains compares UPPER() of both sides)
+                   GinIndex(OpClass(Upper('title'), name='gin_trgm_ops'), name='documents_title_trgm'),
                    ]
     
     def __str__(self):
         return self.title
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored collection so counters can follow a move between collections
+        if 'collection_id' in instance.__dict__:
+            instance._loaded_collection_id = instance.collection_id
+        return instance
+    
+class DocumentChunkQuerySet(models.QuerySet):
+    def with_embeddings(self):
+        """Load the 3072-dimension embedding vectors as well (~12 KB per chunk)."""
+        return self.defer(None)
+
+
+class DocumentChunkManager(models.Manager.from_queryset(DocumentChunkQuerySet)):
+    """Defers the embedding vectors unless explicitly requested with with_embeddings()."""
+    
+    def get_queryset(self):
+        return super().get_queryset().defer('embedding', 'embedding_reduced')
+
+
 class DocumentChunk(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='chunks')
+    # Copy of document.user, so user-scoped reads skip the join to documents and, once the table is
+    # hash-partitioned on it (manage.py partition_chunks), touch only that user's partition.
+    # Nullable only until partition_chunks --backfill has filled rows written before it existed.
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+', null=True, editable=False)
     
     # Chunk content
     text = models.TextField()
     chunk_index = models.IntegerField(help_text='Index of the chunk within the document')
     page_number = models.IntegerField(null=True, blank=True, help_text='Page number from which the chunk was extracted, if applicable')
     
-    # Vector embedding (3072 dimensions for Gemini)
+    # Vector embedding (3072 dimensions for Gemini) from the default embedding model;
+    # embeddings from other models live in ChunkEmbedding
     embedding = VectorField(dimensions=3072, null=True, blank=True)
+    embedding_model = models.CharField(max_length=100, blank=True, help_text='Embedding model that produced embedding')
+    # Leading RAG_REDUCED_DIMENSION dimensions of embedding, re-normalized, for the first-pass search
+    embedding_reduced = VectorField(null=True, blank=True)
     
     # Metadata
     created_at = models.DateTimeField(auto_now_add=True)
     
+    objects = DocumentChunkManager()
+    
     class Meta:
         db_table = 'document_chunks'
         ordering = ['document', 'chunk_index']
-        indexes = [models.Index(fields=['document', 'chunk_index'])]
+        indexes = [
+            models.Index(fields=['document', 'chunk_index']),
+            # Serves the admin's text search (icontains compares UPPER() of both sides)
+            GinIndex(OpClass(Upper('text'), name='gin_trgm_ops'), name='document_chunks_text_trgm'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        if self.user_id is None and self.document_id is not None:
+            self.user_id = self.document.user_id
+        super().save(*args, **kwargs)
+    
+    def __str__(self):
+        return f'Chunk {self.chunk_index} of Document {self.document.id}'
+
+
+class ChunkEmbedding(models.Model):
+    """A chunk's embedding from a model other than the default, stored side by side with it."""
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # No database constraint: the primary key of the partitioned document_chunks table is (id, user_id),
+    # which a foreign key on id alone cannot reference. Deletes still cascade through the ORM.
+    chunk = models.ForeignKey(DocumentChunk, on_delete=models.CASCADE, related_name='extra_embeddings', db_constraint=False)
+    model = models.CharField(max_length=100, help_text='Embedding model tag, e.g. models/gemini-embedding-001@768')
+    embedding = VectorField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'chunk_embeddings'
+        constraints = [models.UniqueConstraint(fields=['chunk', 'model'], name='unique_chunk_embedding_model')]
+        indexes = [models.Index(fields=['model', 'chunk'])]
+    
+    def __str__(self):
+        return f'{self.model} embedding of {self.chunk_id}'
+
+
+class EmbeddingMigration(models.Model):
+    """Re-embedding of one user's chunks with a new model; search switches over when it completes."""
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('paused', 'Paused'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='embedding_migrations')
+    target_model = models.CharField(max_length=100)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    
+    # Progress and checkpoint: chunks are walked in id order, so the backfill resumes after last_chunk_id
+    total_chunks = models.IntegerField(default=0)
+    embedded_chunks = models.IntegerField(default=0)
+    last_chunk_id = models.UUIDField(null=True, blank=True)
+    
+    # Adaptive throttle: raised while the API keeps up, halved on errors
+    requests_per_minute = models.IntegerField(default=0)
+    consecutive_errors = models.IntegerField(default=0)
+    error = models.TextField(blank=True, null=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'embedding_migrations'
+        ordering = ['-created_at']
+        constraints = [models.UniqueConstraint(fields=['user', 'target_model'], name='unique_user_embedding_migration')]
+        indexes = [models.Index(fields=['user', 'status'])]
+    
+    def __str__(self):
+        return f'{self.user} -> {self.target_model} ({self.status})'
+
+class UploadSession(models.Model):
+    """A resumable, chunked upload that becomes a Document once every byte has arrived."""
+    
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='upload_sessions')
+    collection = models.ForeignKey(DocumentCollection, on_delete=models.CASCADE, related_name='upload_sessions', null=True, blank=True)
+    document = models.OneToOneField(Document, on_delete=models.SET_NULL, related_name='upload_session', null=True, blank=True)
+    
+    # Declared file info, validated before any bytes are accepted
+    title = models.CharField(max_length=255)
+    filename = models.CharField(max_length=255)
+    file_type = models.CharField(max_length=10, choices=Document.FILE_TYPE_CHOICES)
+    file_size = models.BigIntegerField(help_text='Declared file size in bytes')
+    
+    # Progress
+    received_bytes = models.BigIntegerField(default=0)
+    parts_received = models.IntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True, help_text='Digest of the complete file')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading')
+    error = models.TextField(blank=True, null=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'upload_sessions'
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'updated_at'])]
     
     def __str__(self):
-        return f'Chunk {self.chunk_index} of Document {self.document.id}'
\ No newline at end of file
+        return f"{self.filename} ({self.received_bytes}/{self.file_size})"
+    
+    @property
+    def partial_path(self) -> str:
+        return os.path.join(settings.UPLOAD_PARTIAL_DIR, f"{self.id}.part")
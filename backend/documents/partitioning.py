@@ -0,0 +1,255 @@
+"""Online migration of document_chunks to a table hash-partitioned by user.
+
+Each step is resumable and the table keeps serving reads and writes until the
+final swap, which only holds a lock for a few renames:
+
+1. backfill: fill DocumentChunk.user on rows written before it existed.
+2. create:   create the partitioned table and its partitions, and install a
+             trigger that mirrors every write on document_chunks into it.
+3. copy:     copy existing rows over in id-ordered batches. Rows the trigger
+             has already mirrored are left alone, so the copy can be rerun.
+4. index:    build the per-partition indexes concurrently and attach them.
+5. swap:     rename the partitioned table into place and drop the trigger.
+6. drop-old: drop the unpartitioned table once the swap is known good.
+
+Postgres requires the partition key in every unique constraint, so the new
+primary key is (id, user_id); ids stay unique because they are UUIDs. That is
+also why ChunkEmbedding.chunk carries no database-level foreign key.
+"""
+from django.db import connection, transaction
+from django.db.models import OuterRef, Subquery
+
+from .models import Document, DocumentChunk
+
+
+TABLE = DocumentChunk._meta.db_table
+PARTITIONED_TABLE = f'{TABLE}_partitioned'
+OLD_TABLE = f'{TABLE}_unpartitioned'
+MIRROR_FUNCTION = f'{TABLE}_mirror'
+
+# Indexes every partition gets, besides the primary key: (name suffix, definition)
+PARTITION_INDEXES = [
+    ('document', 'USING btree (document_id)'),
+    ('user', 'USING btree (user_id)'),
+    ('text_search', "USING gin (to_tsvector('english', text))"),
+]
+VECTOR_INDEX = ('embedding_hnsw', 'USING hnsw ((embedding::halfvec(3072)) halfvec_l2_ops)')
+
+
+def _execute(sql: str, params=None):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall() if cursor.description else None
+
+
+def _table_kind(table: str):
+    """'r' for a plain table, 'p' for a partitioned one, None if it doesn't exist."""
+    rows = _execute("SELECT relkind FROM pg_class WHERE relname = %s AND relkind IN ('r', 'p')", [table])
+    return rows[0][0] if rows else None
+
+
+def _meta_index_definitions() -> list:
+    """(name, partition suffix, definition) of DocumentChunk's Meta indexes, rendered as Django creates them."""
+    table = connection.ops.quote_name(TABLE)
+    definitions = []
+    with connection.schema_editor(atomic=False) as schema_editor:
+        for index in DocumentChunk._meta.indexes:
+            # 'CREATE INDEX "name" ON "document_chunks" <method, columns or expressions, opclasses>'
+            definition = str(index.create_sql(DocumentChunk, schema_editor)).split(f' ON {table} ', 1)[1]
+            # Built under a temporary name; the swap gives it the name Django's migrations know
+            definitions.append((f'{index.name}_hash', index.name.removeprefix(f'{TABLE}_'), definition))
+    return definitions
+
+
+def _index_definitions(vector_index: bool) -> list:
+    """(name, partition suffix, definition) of the indexes to build, including DocumentChunk's Meta indexes."""
+    definitions = [(f'{TABLE}_hash_{suffix}', suffix, definition) for suffix, definition in PARTITION_INDEXES]
+    definitions += _meta_index_definitions()
+    if vector_index:
+        definitions.append((f'{TABLE}_hash_{VECTOR_INDEX[0]}',) + VECTOR_INDEX)
+    return definitions
+
+
+def _index_valid(name: str):
+    """True or False for an existing index, None if there is none."""
+    rows = _execute(
+        'SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = %s',
+        [name],
+    )
+    return rows[0][0] if rows else None
+
+
+def partition_names(partitions: int) -> list:
+    return [f'{TABLE}_p{remainder}' for remainder in range(partitions)]
+
+
+def status() -> dict:
+    """Where the migration stands."""
+    if _table_kind(TABLE) == 'p':
+        return {'step': 'swapped', 'old_table': _table_kind(OLD_TABLE) is not None}
+    result = {
+        'step': 'pending',
+        'missing_user': DocumentChunk.objects.filter(user__isnull=True).count(),
+    }
+    if _table_kind(PARTITIONED_TABLE):
+        result['step'] = 'created'
+        # One statement, so both counts come from the same snapshot
+        result['rows'], result['copied_rows'] = _execute(
+            f'SELECT (SELECT count(*) FROM {TABLE}), (SELECT count(*) FROM {PARTITIONED_TABLE})'
+        )[0]
+    return result
+
+
+def backfill_users(batch_size: int = 5000, progress=None) -> int:
+    """Copy document.user onto chunks that don't have it yet, one short transaction per batch."""
+    owner = Subquery(Document.objects.filter(id=OuterRef('document_id')).values('user_id')[:1])
+    updated = 0
+    while True:
+        ids = list(DocumentChunk.objects.filter(user__isnull=True).order_by().values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return updated
+        updated += DocumentChunk.objects.filter(id__in=ids).update(user_id=owner)
+        if progress:
+            progress(updated)
+
+
+def create_partitioned_table(partitions: int):
+    """Create the partitioned table and start mirroring writes into it."""
+    if _table_kind(PARTITIONED_TABLE):
+        raise ValueError(f'{PARTITIONED_TABLE} already exists.')
+    documents_table = Document._meta.db_table
+    users_table = DocumentChunk._meta.get_field('user').related_model._meta.db_table
+
+    with transaction.atomic():
+        _execute(
+            f'CREATE TABLE {PARTITIONED_TABLE} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+            f'PARTITION BY HASH (user_id)'
+        )
+        _execute(f'ALTER TABLE {PARTITIONED_TABLE} ALTER COLUMN user_id SET NOT NULL')
+        _execute(f'ALTER TABLE {PARTITIONED_TABLE} ADD CONSTRAINT {PARTITIONED_TABLE}_pkey PRIMARY KEY (id, user_id)')
+        _execute(
+            f'ALTER TABLE {PARTITIONED_TABLE} ADD CONSTRAINT {PARTITIONED_TABLE}_document_fk '
+            f'FOREIGN KEY (document_id) REFERENCES {documents_table} (id) DEFERRABLE INITIALLY DEFERRED'
+        )
+        _execute(
+            f'ALTER TABLE {PARTITIONED_TABLE} ADD CONSTRAINT {PARTITIONED_TABLE}_user_fk '
+            f'FOREIGN KEY (user_id) REFERENCES {users_table} (id) DEFERRABLE INITIALLY DEFERRED'
+        )
+        for remainder, name in enumerate(partition_names(partitions)):
+            _execute(
+                f'CREATE TABLE {name} PARTITION OF {PARTITIONED_TABLE} '
+                f'FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})'
+            )
+
+        # Mirror every write from here on, filling user_id for writers that don't set it yet
+        _execute(f"""
+            CREATE OR REPLACE FUNCTION {MIRROR_FUNCTION}() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    DELETE FROM {PARTITIONED_TABLE} WHERE id = OLD.id;
+                END IF;
+                IF TG_OP = 'DELETE' THEN
+                    RETURN OLD;
+                END IF;
+                IF NEW.user_id IS NULL THEN
+                    SELECT user_id INTO NEW.user_id FROM {documents_table} WHERE id = NEW.document_id;
+                END IF;
+                INSERT INTO {PARTITIONED_TABLE} SELECT NEW.*;
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql
+        """)
+        _execute(
+            f'CREATE TRIGGER {MIRROR_FUNCTION} BEFORE INSERT OR UPDATE OR DELETE ON {TABLE} '
+            f'FOR EACH ROW EXECUTE FUNCTION {MIRROR_FUNCTION}()'
+        )
+
+
+def copy_rows(batch_size: int = 5000, after=None, progress=None) -> int:
+    """Copy existing rows in id order, skipping rows the trigger already mirrored; returns rows copied."""
+    documents_table = Document._meta.db_table
+    columns = [row[0] for row in _execute(
+        'SELECT column_name FROM information_schema.columns WHERE table_name = %s ORDER BY ordinal_position',
+        [PARTITIONED_TABLE],
+    )]
+    select = ', '.join(
+        f'COALESCE(c.user_id, (SELECT d.user_id FROM {documents_table} d WHERE d.id = c.document_id))'
+        if column == 'user_id' else f'c.{column}'
+        for column in columns
+    )
+
+    copied = 0
+    while True:
+        count, last = _execute(
+            f'SELECT count(*), max(id::text)::uuid FROM (SELECT id FROM {TABLE} '
+            f'WHERE %s::uuid IS NULL OR id > %s::uuid ORDER BY id LIMIT %s) batch',
+            [after, after, batch_size],
+        )[0]
+        if not count:
+            return copied
+        with transaction.atomic():
+            # FOR SHARE waits out concurrent deletes, so a row deleted mid-copy is never resurrected
+            _execute(
+                f'INSERT INTO {PARTITIONED_TABLE} ({", ".join(columns)}) SELECT {select} FROM {TABLE} c '
+                f'WHERE (%s::uuid IS NULL OR c.id > %s::uuid) AND c.id <= %s FOR SHARE OF c '
+                f'ON CONFLICT DO NOTHING',
+                [after, after, last],
+            )
+        copied += count
+        after = last
+        if progress:
+            progress(copied, after)
+
+
+def build_indexes(partitions: int, vector_index: bool = True, progress=None):
+    """Build each index partition by partition without blocking the mirrored writes.
+
+    The parent index is created empty with ON ONLY; each partition's index is
+    built CONCURRENTLY and attached, and the parent becomes valid once every
+    partition has one. Must run outside a transaction.
+    """
+    for name, suffix, definition in _index_definitions(vector_index):
+        _execute(f'CREATE INDEX IF NOT EXISTS {name} ON ONLY {PARTITIONED_TABLE} {definition}')
+        for partition in partition_names(partitions):
+            partition_index = f'{partition}_{suffix}'
+            if _index_valid(partition_index) is False:
+                # Left behind by an interrupted concurrent build
+                _execute(f'DROP INDEX CONCURRENTLY {partition_index}')
+            _execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {partition_index} ON {partition} {definition}')
+            attached = _execute(
+                'SELECT 1 FROM pg_inherits WHERE inhrelid = %s::regclass AND inhparent = %s::regclass',
+                [partition_index, name],
+            )
+            if not attached:
+                _execute(f'ALTER INDEX {name} ATTACH PARTITION {partition_index}')
+        if progress:
+            progress(name)
+    _execute(f'ANALYZE {PARTITIONED_TABLE}')
+
+
+def swap_tables(lock_timeout: str = '5s'):
+    """Put the partitioned table in place of document_chunks and stop mirroring."""
+    invalid = _execute(
+        "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE i.indrelid = %s::regclass AND NOT i.indisvalid",
+        [PARTITIONED_TABLE],
+    )
+    if invalid:
+        raise ValueError(f"Indexes are not built on every partition yet: {', '.join(row[0] for row in invalid)}")
+
+    with transaction.atomic():
+        _execute(f"SET LOCAL lock_timeout = '{lock_timeout}'")
+        _execute(f'LOCK TABLE {TABLE}, {PARTITIONED_TABLE} IN ACCESS EXCLUSIVE MODE')
+        _execute(f'DROP TRIGGER {MIRROR_FUNCTION} ON {TABLE}')
+        _execute(f'ALTER TABLE {TABLE} RENAME TO {OLD_TABLE}')
+        _execute(f'ALTER TABLE {OLD_TABLE} RENAME CONSTRAINT {TABLE}_pkey TO {OLD_TABLE}_pkey')
+        for index in DocumentChunk._meta.indexes:
+            _execute(f'ALTER INDEX {index.name} RENAME TO {index.name}_old')
+            _execute(f'ALTER INDEX {index.name}_hash RENAME TO {index.name}')
+        _execute(f'ALTER TABLE {PARTITIONED_TABLE} RENAME TO {TABLE}')
+        _execute(f'ALTER TABLE {TABLE} RENAME CONSTRAINT {PARTITIONED_TABLE}_pkey TO {TABLE}_pkey')
+    _execute(f'DROP FUNCTION IF EXISTS {MIRROR_FUNCTION}()')
+
+
+def drop_old_table():
+    _execute(f'DROP TABLE IF EXISTS {OLD_TABLE}')
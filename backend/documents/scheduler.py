@@ -0,0 +1,151 @@
+"""Fair, tenant-aware scheduling of ingestion tasks.
+
+Ingestion tasks are not sent to Celery directly. They wait in a per-user Redis
+sorted set, and ``dispatch()`` releases them into the Celery queue:
+
+* round-robin across users, taking up to a user's weight of jobs per turn,
+  starting from a different user on every dispatch;
+* at most INGEST_TENANT_CONCURRENCY jobs in flight per user, and at most
+  INGEST_MAX_INFLIGHT overall, so the Celery queue itself stays short;
+* within a user's queue, small documents first. A job's score is its enqueue
+  time plus INGEST_SIZE_PENALTY_SECONDS_PER_MB per MB, so large documents
+  still age their way to the front.
+
+Weights and caps can be overridden per user with
+``HSET ingest:weights <user_id> <n>`` and ``HSET ingest:caps <user_id> <n>``.
+A dispatched task carries a link callback that frees its slot and dispatches
+again; slots held longer than INGEST_INFLIGHT_TIMEOUT (a lost worker) expire.
+"""
+import json
+import time
+import uuid
+from django.conf import settings
+
+from core.metrics import INGEST_QUEUE_DEPTH, INGEST_QUEUED_TENANTS, INGEST_INFLIGHT, INGEST_WAIT_SECONDS
+
+
+KEY_PREFIX = 'ingest'
+
+
+class IngestionScheduler:
+    """Per-user ingestion queues in Redis with a weighted round-robin dispatcher."""
+
+    def __init__(self, redis_client=None):
+        if redis_client is None:
+            import redis
+            redis_client = redis.Redis.from_url(settings.CELERY_BROKER_URL, decode_responses=True)
+        self.redis = redis_client
+
+    def key(self, *parts) -> str:
+        return ':'.join((KEY_PREFIX,) + tuple(str(part) for part in parts))
+
+    def submit(self, task_name: str, tenant, args: list, size: int = 0) -> str:
+        """Queue a task for a tenant; smaller jobs run ahead of larger ones."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        job = {'task': task_name, 'args': args, 'tenant': str(tenant), 'enqueued_at': now}
+        score = now + size / (1024 * 1024) * settings.INGEST_SIZE_PENALTY_SECONDS_PER_MB
+
+        pipe = self.redis.pipeline()
+        pipe.hset(self.key('jobs'), job_id, json.dumps(job))
+        pipe.zadd(self.key('queue', tenant), {job_id: score})
+        pipe.execute()
+        return job_id
+
+    def release(self, tenant, job_id: str):
+        """Free the slot held by a finished job."""
+        self.redis.zrem(self.key('inflight', tenant), job_id)
+
+    def tenants(self) -> list:
+        """Tenants with queued work; empty sorted sets are removed by Redis, so none go stale."""
+        prefix = self.key('queue', '')
+        return sorted(key[len(prefix):] for key in self.redis.scan_iter(match=prefix + '*'))
+
+    def dispatch(self, send) -> int:
+        """Release queued jobs to ``send(job, job_id)`` within the caps; returns how many."""
+        lock = self.redis.lock(self.key('dispatch-lock'), timeout=60)
+        if not lock.acquire(blocking=False):
+            # Another dispatcher is running; it (or the next periodic run) picks up our work
+            return 0
+
+        try:
+            now = time.time()
+            tenants = self.tenants()
+            inflight = {}
+            for key in self.redis.scan_iter(match=self.key('inflight', '*')):
+                # Slots of jobs that never reported back (lost worker) expire
+                self.redis.zremrangebyscore(key, '-inf', now - settings.INGEST_INFLIGHT_TIMEOUT)
+                inflight[key.rsplit(':', 1)[1]] = self.redis.zcard(key)
+            total_inflight = sum(inflight.values())
+
+            if tenants:
+                start = self.redis.incr(self.key('round-robin')) % len(tenants)
+                tenants = tenants[start:] + tenants[:start]
+            weights = self.redis.hgetall(self.key('weights'))
+            caps = self.redis.hgetall(self.key('caps'))
+
+            dispatched = 0
+            progress = True
+            while progress and total_inflight < settings.INGEST_MAX_INFLIGHT:
+                progress = False
+                for tenant in tenants:
+                    weight = int(weights.get(tenant, settings.INGEST_TENANT_WEIGHT))
+                    cap = int(caps.get(tenant, settings.INGEST_TENANT_CONCURRENCY))
+                    for _ in range(weight):
+                        if total_inflight >= settings.INGEST_MAX_INFLIGHT or inflight.get(tenant, 0) >= cap:
+                            break
+                        popped = self.redis.zpopmin(self.key('queue', tenant))
+                        if not popped:
+                            break
+                        job_id = popped[0][0]
+                        payload = self.redis.hget(self.key('jobs'), job_id)
+                        self.redis.hdel(self.key('jobs'), job_id)
+                        if payload is None:
+                            continue
+                        job = json.loads(payload)
+
+                        self.redis.zadd(self.key('inflight', tenant), {job_id: time.time()})
+                        inflight[tenant] = inflight.get(tenant, 0) + 1
+                        total_inflight += 1
+                        INGEST_WAIT_SECONDS.observe(time.time() - job['enqueued_at'])
+                        send(job, job_id)
+                        dispatched += 1
+                        progress = True
+
+            self.report(tenants, total_inflight)
+            return dispatched
+        finally:
+            lock.release()
+
+    def report(self, tenants: list, total_inflight: int):
+        """Publish queue depth and in-flight gauges, summed over tenants."""
+        pipe = self.redis.pipeline()
+        for tenant in tenants:
+            pipe.zcard(self.key('queue', tenant))
+        depths = pipe.execute()
+        INGEST_QUEUE_DEPTH.set(sum(depths))
+        INGEST_QUEUED_TENANTS.set(sum(1 for depth in depths if depth))
+        INGEST_INFLIGHT.set(total_inflight)
+
+
+_scheduler = None
+
+
+def get_scheduler() -> IngestionScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = IngestionScheduler()
+    return _scheduler
+
+
+def enqueue_ingestion(task, document, *args):
+    """Queue an ingestion task for a document under its owner's fair share."""
+    args = [str(document.id), *args]
+    if not settings.INGEST_FAIR_SCHEDULING:
+        return task.delay(*args)
+
+    from .task import dispatch_ingestion
+
+    job_id = get_scheduler().submit(task.name, document.user_id, args, size=document.file_size)
+    dispatch_ingestion.delay()
+    return job_id
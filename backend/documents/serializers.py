@@ -1,5 +1,7 @@
+import os
+from django.conf import settings
 from rest_framework import serializers
-from .models import Document, DocumentCollection, DocumentChunk
+from .models import Document, DocumentCollection, DocumentChunk, UploadSession
 
 class DocumentChunkSerializer(serializers.ModelSerializer):
     class Meta:
@@ -8,15 +10,10 @@ class DocumentChunkSerializer(serializers.ModelSerializer):
         
 
 class DocumentSerializer(serializers.ModelSerializer):
-    chunks_count = serializers.SerializerMethodField()
-    
     class Meta:
         model = Document
         fields = ('id', 'title', 'file_type', 'file_size', 'status', 'processing_error', 'page_count', 'word_count', 'chunks_count', 'created_at', 'processed_at')
-        read_only_fields = ('id', 'file_size', 'status', 'created_at')
-    
-    def get_chunks_count(self, obj):
-        return obj.chunks.count()
+        read_only_fields = ('id', 'file_size', 'status', 'chunks_count', 'created_at')
     
 
 class DocumentUploadSerializer(serializers.ModelSerializer):
@@ -29,30 +26,46 @@ class DocumentUploadSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("File size exceeds the 50MB limit.")
         return value
     
+    def validate_collection(self, value):
+        if value and value.user_id != self.context['request'].user.id:
+            raise serializers.ValidationError("Collection not found.")
+        return value
+    
     def create(self, validated_data):
+        # The view supplies the owner: serializer.save(user=request.user)
         validated_data['file_size'] = validated_data['file'].size
-        
-        # Get or create a test user (since authentication is disabled)
-        from django.contrib.auth import get_user_model
-        User = get_user_model()
-        user = User.objects.first()
-        if not user:
-            user = User.objects.create_user(
-                username='testuser',
-                email='test@example.com',
-                password='testpass123'
-            )
-        validated_data['user'] = user
-        
         return super().create(validated_data)
     
 
 class DocumentCollectionSerializer(serializers.ModelSerializer):
-    documents_count = serializers.SerializerMethodField()
-    
     class Meta:
         model = DocumentCollection
         fields = ('id', 'name', 'description', 'documents_count', 'created_at')
+        read_only_fields = ('id', 'documents_count', 'created_at')
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = ('id', 'title', 'filename', 'file_type', 'file_size', 'collection', 'received_bytes', 'parts_received', 'sha256', 'status', 'error', 'document', 'created_at')
+        read_only_fields = ('id', 'received_bytes', 'parts_received', 'sha256', 'status', 'error', 'document', 'created_at')
+    
+    def validate_file_size(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("File is empty.")
+        if value > settings.MAX_UPLOAD_SIZE:
+            raise serializers.ValidationError("File size exceeds the 50MB limit.")
+        return value
+    
+    def validate_collection(self, value):
+        if value and value.user_id != self.context['request'].user.id:
+            raise serializers.ValidationError("Collection not found.")
+        return value
     
-    def get_documents_count(self, obj):
-        return obj.documents.count()
\ No newline at end of file
+    def validate(self, attrs):
+        extension = os.path.splitext(attrs['filename'])[1].lower().lstrip('.')
+        if attrs['file_type'] not in settings.ALLOWED_DOCUMENT_TYPES:
+            raise serializers.ValidationError({'file_type': f"Unsupported file type: {attrs['file_type']}"})
+        if extension != attrs['file_type']:
+            raise serializers.ValidationError({'filename': f"File extension does not match file type {attrs['file_type']}."})
+        return attrs
@@ -0,0 +1,39 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Document, DocumentCollection
+
+
+def _adjust_documents_count(collection_id, delta: int):
+    if collection_id:
+        DocumentCollection.objects.filter(id=collection_id).update(documents_count=F('documents_count') + delta)
+
+
+def _record_collection_change(collection_id, document, op: str):
+    """Tell loaded collection shards about the document once the change is committed."""
+    from qa.services.collection_index import record_collection_change
+    if collection_id:
+        transaction.on_commit(lambda: record_collection_change(collection_id, document.user_id, op, document.id))
+
+
+@receiver(post_save, sender=Document)
+def count_saved_document(sender, instance, created, **kwargs):
+    """Keep DocumentCollection.documents_count in step with document creation and moves."""
+    previous_collection_id = None if created else getattr(instance, '_loaded_collection_id', instance.collection_id)
+    if previous_collection_id != instance.collection_id:
+        _adjust_documents_count(previous_collection_id, -1)
+        _adjust_documents_count(instance.collection_id, 1)
+        if not created:
+            _record_collection_change(previous_collection_id, instance, 'remove')
+            _record_collection_change(instance.collection_id, instance, 'add')
+    instance._loaded_collection_id = instance.collection_id
+
+
+@receiver(post_delete, sender=Document)
+def count_deleted_document(sender, instance, **kwargs):
+    # Soft-deleted documents were already uncounted when they were deleted
+    if instance.deleted_at is None:
+        _adjust_documents_count(instance.collection_id, -1)
+        _record_collection_change(instance.collection_id, instance, 'remove')
@@ -1,75 +1,160 @@
-from celery import shared_task
+from datetime import timedelta
+from celery import shared_task, signature
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
 from django.utils import timezone
-from .models import Document, DocumentChunk
+from .models import Document, DocumentChunk, UploadSession
 from .utils import DocumentProcessor
+from .scheduler import get_scheduler, enqueue_ingestion
+from core.metrics import StageTimer
+from core.profiling import profile_task
 
 @shared_task
+@profile_task
 def process_document(document_id: str):
     """Process uploaded document: extract text and create chunks."""
-    try:
-        document = Document.objects.get(id=document_id)
-        document.status = 'processing'
-        document.save()
+    timer = StageTimer('process_document')
+    with timer:
+        try:
+            document = Document.objects.get(id=document_id)
+            # Every write names its fields: a full-row save would undo a concurrent soft delete
+            document.status = 'processing'
+            document.save(update_fields=['status', 'updated_at'])
         
-        file_path = document.file.path
-        processor = DocumentProcessor()
+            file_path = document.file.path
+            processor = DocumentProcessor()
         
-        # Extract text based on file type
-        if document.file_type == 'pdf':
-            extracted_text, page_count = processor.extract_text_from_pdf(file_path)
-        elif document.file_type == 'docx':
-            extracted_text, page_count = processor.extract_text_from_docx(file_path)
-        elif document.file_type in ['txt', 'md']:
-            extracted_text, page_count = processor.extract_text_from_txt(file_path)
-        else:
-            raise ValueError(f"Unsupported file type: {document.file_type}")
+            # Extract text based on file type
+            page_starts = None
+            with timer.stage('extract_text'):
+                if document.file_type == 'pdf':
+                    extracted_text, page_count = processor.extract_text_from_pdf(file_path)
+                elif document.file_type == 'docx':
+                    extracted_text, page_count, page_starts = processor.extract_pages_from_docx(file_path)
+                elif document.file_type in ['txt', 'md']:
+                    extracted_text, page_count = processor.extract_text_from_txt(file_path)
+                else:
+                    raise ValueError(f"Unsupported file type: {document.file_type}")
         
-        # Update document with extracted content
-        document.extracted_text = extracted_text
-        document.page_count = page_count
-        document.word_count = processor.count_words(extracted_text)
+            # Update document with extracted content
+            document.extracted_text = extracted_text
+            document.page_count = page_count
+            document.word_count = processor.count_words(extracted_text)
         
-        # Create chunks
-        chunks = processor.chunk_text(extracted_text)
+            # Create chunks
+            with timer.stage('chunk_text'):
+                chunks = processor.chunk_text_with_offsets(extracted_text)
+                if page_starts:
+                    page_numbers = processor.page_numbers([offset for _, offset in chunks], page_starts)
+                else:
+                    # Without page boundaries, spread the chunks evenly over the pages
+                    page_numbers = [(idx * page_count) // len(chunks) + 1 if page_count > 0 else 1 for idx in range(len(chunks))]
         
-        for idx, chunk_text in enumerate(chunks):
-            DocumentChunk.objects.create(
-                document=document,
-                text=chunk_text,
-                chunk_index=idx,
-                page_number=(idx * page_count) // len(chunks) + 1 if page_count > 0 else 1,
-            )
+            with timer.stage('db_write'), transaction.atomic():
+                # Hold the row until the chunks are in; a document deleted meanwhile is left to its purge
+                if not Document.objects.select_for_update().filter(id=document.id).exists():
+                    return f"Document {document_id} was deleted while processing."
+                
+                DocumentChunk.objects.bulk_create([
+                    DocumentChunk(
+                        document=document,
+                        user_id=document.user_id,
+                        text=chunk_text,
+                        chunk_index=idx,
+                        page_number=page_number,
+                    )
+                    for idx, ((chunk_text, _), page_number) in enumerate(zip(chunks, page_numbers))
+                ], batch_size=500)
+                
+                document.chunks_count = F('chunks_count') + len(chunks)
+                document.status = 'completed'
+                document.processed_at = timezone.now()
+                document.save(update_fields=[
+                    'extracted_text', 'page_count', 'word_count', 'chunks_count', 'status', 'processed_at', 'updated_at',
+                ])
+                # Replace the F() expression, or a later save would add the chunks again
+                document.refresh_from_db(fields=['chunks_count'])
             
-        document.status = 'completed'
-        document.processed_at = timezone.now()
-        document.save()
-        
-        # Update user stats
-        user = document.user
-        user.total_documents += 1
-        user.save()
+                # Update user stats without a full-row save, which would drop concurrent increments
+                get_user_model().objects.filter(id=document.user_id).update(
+                    total_documents=F('total_documents') + 1
+                )
         
-        # Trigger embedding generation
-        generate_embeddings.delay(str(document_id))
+            # Trigger embedding generation
+            enqueue_ingestion(generate_embeddings, document)
         
-        return f"Document {document_id} processed successfully."
+            return f"Document {document_id} processed successfully."
     
-    except Document.DoesNotExist:
-        return f"Document with ID {document_id} does not exist."
-    except Exception as e:
-        document.status = 'failed'
-        document.processing_error = str(e)
-        document.save()
-        return f"Error processing document {document_id}: {str(e)}"
+        except Document.DoesNotExist:
+            return f"Document with ID {document_id} does not exist."
+        except Exception as e:
+            # Matches no row if the document was deleted or purged in the meantime
+            Document.objects.filter(id=document_id).update(
+                status='failed', processing_error=str(e), updated_at=timezone.now(),
+            )
+            return f"Error processing document {document_id}: {str(e)}"
 
 @shared_task
+@profile_task
 def generate_embeddings(document_id: str):
     """Generate embeddings for a document chunks"""
-    from qa.services.rag_service import RAGService
+    from qa.services.rag_service import get_rag_service
     
     try:
-        rag_service = RAGService()
-        count = rag_service.embed_document_chunks(document_id)
+        with StageTimer('generate_embeddings'):
+            rag_service = get_rag_service()
+            count = rag_service.embed_document_chunks(document_id)
         return  f"Generate {count} embeddings for document {document_id}"
     except Exception as e:
-        return f"Error generating embeddings: {str(e)}"
\ No newline at end of file
+        return f"Error generating embeddings: {str(e)}"
+
+
+@shared_task
+def purge_stale_uploads():
+    """Delete unfinished upload sessions and their partial files after UPLOAD_SESSION_TTL_HOURS."""
+    from .uploads import discard_partial
+    
+    cutoff = timezone.now() - timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)
+    stale = UploadSession.objects.filter(status__in=['uploading', 'failed'], updated_at__lt=cutoff)
+    count = 0
+    for session in stale.iterator():
+        discard_partial(session)
+        session.delete()
+        count += 1
+    return f"Purged {count} stale upload sessions"
+
+
+@shared_task(ignore_result=True)
+def dispatch_ingestion():
+    """Release queued ingestion jobs to the workers, fairly across users."""
+    def send(job, job_id):
+        release = signature('documents.task.release_ingestion_slot', args=[job['tenant'], job_id], immutable=True)
+        signature(job['task'], args=job['args']).apply_async(link=release, link_error=release)
+    
+    return get_scheduler().dispatch(send)
+
+
+@shared_task(ignore_result=True)
+def release_ingestion_slot(tenant: str, job_id: str):
+    """Free a finished job's slot and hand it to the next job in line."""
+    scheduler = get_scheduler()
+    scheduler.release(tenant, job_id)
+    return dispatch_ingestion()
+
+
+@shared_task
+def purge_deleted_documents(limit: int = 100):
+    """Purge the chunks, files and rows of soft-deleted documents."""
+    from .deletion import purge_document
+    
+    # Only what the purge needs: extracted_text can run to megabytes per document
+    documents = Document.all_objects.filter(deleted_at__isnull=False).order_by('deleted_at').only('id', 'file')[:limit]
+    purged, chunks = 0, 0
+    for document in documents:
+        chunks += purge_document(document)
+        purged += 1
+    if purged == limit:
+        purge_deleted_documents.delay(limit)
+    return f"Purged {purged} deleted documents ({chunks} chunks)"
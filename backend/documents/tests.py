@@ -1,3 +1,748 @@
-from django.test import TestCase
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import uuid
+from io import StringIO
+from unittest.mock import patch
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
 
-# Create your tests here.
+from .utils import DocumentProcessor
+from .models import ChunkEmbedding, Document, DocumentChunk, DocumentCollection, UploadSession
+from .views import DocumentCollectionViewSet, DocumentViewSet
+
+User = get_user_model()
+
+
+def make_document(user, collection=None, chunks=0, **kwargs):
+    document = Document.objects.create(
+        user=user,
+        collection=collection,
+        title=kwargs.pop('title', 'Contract'),
+        file='documents/test.txt',
+        file_type='txt',
+        file_size=10,
+        **kwargs,
+    )
+    DocumentChunk.objects.bulk_create([
+        DocumentChunk(document=document, user_id=document.user_id, text=f"chunk {i}", chunk_index=i) for i in range(chunks)
+    ])
+    Document.objects.filter(id=document.id).update(chunks_count=chunks)
+    return document
+
+
+class DocumentCounterTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', email='owner@example.com', password='pass12345')
+        self.collection = DocumentCollection.objects.create(user=self.user, name='Inbox')
+
+    def test_collection_documents_count_follows_create_move_and_delete(self):
+        first = DocumentCollection.objects.create(user=self.user, name='First')
+        second = DocumentCollection.objects.create(user=self.user, name='Second')
+
+        document = make_document(self.user, collection=first)
+        make_document(self.user, collection=first)
+        first.refresh_from_db()
+        self.assertEqual(first.documents_count, 2)
+
+        document = Document.objects.get(id=document.id)
+        document.collection = second
+        document.save()
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.documents_count, second.documents_count), (1, 1))
+
+        document.delete()
+        second.refresh_from_db()
+        self.assertEqual(second.documents_count, 0)
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    @patch('documents.task.enqueue_ingestion', side_effect=RuntimeError('broker unavailable'))
+    def test_chunks_are_counted_once_when_queueing_embeddings_fails(self, enqueue):
+        from django.core.files.base import ContentFile
+        from django.core.files.storage import default_storage
+        from .task import process_document
+
+        document = make_document(self.user)
+        document.file = default_storage.save('documents/notes.txt', ContentFile(b'Payment is due in thirty days. ' * 200))
+        document.save()
+
+        process_document(str(document.id))
+        document.refresh_from_db()
+        self.assertEqual(document.status, 'failed')
+        self.assertGreater(document.chunks_count, 0)
+        self.assertEqual(document.chunks_count, DocumentChunk.objects.filter(document=document).count())
+
+
+    def process_while(self, change):
+        """Run process_document with change() applied to the document during text extraction."""
+        from django.core.files.base import ContentFile
+        from django.core.files.storage import default_storage
+        from .task import process_document
+
+        document = make_document(self.user, collection=self.collection)
+        document.file = default_storage.save('documents/notes.txt', ContentFile(b'Payment is due in thirty days. ' * 200))
+        document.save()
+        extract = DocumentProcessor.extract_text_from_txt
+
+        def extract_then_change(path):
+            change(document)
+            return extract(path)
+
+        with patch.object(DocumentProcessor, 'extract_text_from_txt', side_effect=extract_then_change), \
+                patch('documents.task.enqueue_ingestion') as enqueue:
+            process_document(str(document.id))
+        enqueue.assert_not_called()
+        self.assertFalse(DocumentChunk.objects.filter(document_id=document.id).exists())
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.total_documents, 0)
+        return document
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    @patch('documents.task.purge_deleted_documents.delay')
+    def test_document_deleted_while_processing_stays_deleted(self, purge):
+        from .deletion import soft_delete_documents
+
+        with self.captureOnCommitCallbacks(execute=True):
+            document = self.process_while(lambda document: soft_delete_documents(Document.objects.filter(id=document.id)))
+        self.assertFalse(Document.objects.filter(id=document.id).exists())
+        self.assertIsNotNone(Document.all_objects.get(id=document.id).deleted_at)
+        self.collection.refresh_from_db()
+        self.assertEqual(self.collection.documents_count, 0)
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_document_purged_while_processing_is_not_recreated(self):
+        document = self.process_while(lambda document: Document.all_objects.filter(id=document.id).delete())
+        self.assertFalse(Document.all_objects.filter(id=document.id).exists())
+
+class ListQueryCountTests(TestCase):
+    """List endpoints must run a constant number of queries regardless of page size."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', email='owner@example.com', password='pass12345')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def count_queries(self, request):
+        with CaptureQueriesContext(connection) as context:
+            response = request()
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response
+
+    def test_document_list_is_constant_in_rows(self):
+        make_document(self.user, chunks=3)
+        small, _ = self.count_queries(lambda: self.client.get('/api/v1/documents/documents/'))
+
+        for _ in range(9):
+            make_document(self.user, chunks=3)
+        large, response = self.count_queries(lambda: self.client.get('/api/v1/documents/documents/'))
+
+        self.assertEqual(small, large)
+        self.assertEqual(response.data['results'][0]['chunks_count'], 3)
+
+    def test_collection_list_is_constant_in_rows(self):
+        view = DocumentCollectionViewSet.as_view({'get': 'list'})
+        request = APIRequestFactory().get('/')
+        force_authenticate(request, user=self.user)
+
+        collection = DocumentCollection.objects.create(user=self.user, name='Contracts')
+        make_document(self.user, collection=collection)
+        small, _ = self.count_queries(lambda: view(request))
+
+        for i in range(9):
+            make_document(self.user, collection=DocumentCollection.objects.create(user=self.user, name=f"C{i}"))
+        large, response = self.count_queries(lambda: view(request))
+
+        self.assertEqual(small, large)
+        self.assertEqual(response.data['results'][-1]['documents_count'], 1)
+
+
+class DeferredColumnTests(TestCase):
+    """Heavy columns stay out of list/detail queries unless asked for."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', email='owner@example.com', password='pass12345')
+        self.document = make_document(self.user, chunks=2, extracted_text='x' * 1000)
+
+    def assert_not_selected(self, column, request):
+        with CaptureQueriesContext(connection) as context:
+            response = request()
+        self.assertEqual(response.status_code, 200)
+        selects = [q['sql'] for q in context.captured_queries if q['sql'].startswith('SELECT')]
+        self.assertTrue(selects)
+        for sql in selects:
+            self.assertNotIn(column, sql)
+
+    def test_document_list_defers_extracted_text(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assert_not_selected('"extracted_text"', lambda: client.get('/api/v1/documents/documents/'))
+
+    def test_chunks_action_defers_embeddings(self):
+        view = DocumentViewSet.as_view({'get': 'chunks'})
+        request = APIRequestFactory().get('/')
+        force_authenticate(request, user=self.user)
+        self.assert_not_selected('"embedding"', lambda: view(request, pk=self.document.pk))
+
+    def test_content_is_available_on_demand(self):
+        document = Document.objects.with_content().get(id=self.document.id)
+        self.assertEqual(document.get_deferred_fields(), set())
+        self.assertEqual(len(Document.objects.get(id=self.document.id).extracted_text), 1000)
+
+
+class ChunkUserTests(TestCase):
+    """Chunks carry their document's user for partition pruning."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', email='owner@example.com', password='pass12345')
+
+    def test_save_copies_document_user(self):
+        document = make_document(self.user)
+        chunk = DocumentChunk.objects.create(document=document, text='text', chunk_index=0)
+        self.assertEqual(chunk.user_id, self.user.id)
+
+    def test_backfill_fills_missing_users(self):
+        from .partitioning import backfill_users
+
+        document = make_document(self.user, chunks=5)
+        DocumentChunk.objects.update(user=None)
+        self.assertEqual(backfill_users(batch_size=2), 5)
+        self.assertEqual(DocumentChunk.objects.filter(user=self.user, document=document).count(), 5)
+        self.assertEqual(backfill_users(), 0)
+
+
+    def test_migration_fills_existing_chunks(self):
+        import importlib
+        from django.apps import apps
+
+        migration = importlib.import_module('documents.migrations.0006_documentchunk_user')
+        document = make_document(self.user, chunks=3)
+        DocumentChunk.objects.update(user=None)
+        with patch.object(migration, 'BACKFILL_BATCH_SIZE', 2):
+            migration.backfill_chunk_users(apps, None)
+        self.assertEqual(DocumentChunk.objects.filter(user=self.user, document=document).count(), 3)
+
+class ChunkPartitioningTests(TransactionTestCase):
+    """partition_chunks steps against the real document_chunks table; CONCURRENTLY needs autocommit."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', email='owner@example.com', password='pass12345')
+
+    def tearDown(self):
+        from . import partitioning
+
+        # Put the unpartitioned table back for the tests that follow
+        with connection.cursor() as cursor:
+            if partitioning._table_kind(partitioning.OLD_TABLE):
+                cursor.execute(f'DROP TABLE {partitioning.TABLE}')
+                cursor.execute(f'ALTER TABLE {partitioning.OLD_TABLE} RENAME TO {partitioning.TABLE}')
+                cursor.execute(
+                    f'ALTER TABLE {partitioning.TABLE} RENAME CONSTRAINT {partitioning.OLD_TABLE}_pkey TO {partitioning.TABLE}_pkey'
+                )
+                for index in DocumentChunk._meta.indexes:
+                    cursor.execute(f'ALTER INDEX {index.name}_old RENAME TO {index.name}')
+            cursor.execute(f'DROP TABLE IF EXISTS {partitioning.PARTITIONED_TABLE}')
+            cursor.execute(f'DROP FUNCTION IF EXISTS {partitioning.MIRROR_FUNCTION}() CASCADE')
+
+    def partition_indexes(self, partition):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s', [partition])
+            return dict(cursor.fetchall())
+
+    def test_index_step_builds_every_meta_index_on_each_partition(self):
+        from . import partitioning
+
+        make_document(self.user, chunks=4)
+        partitioning.create_partitioned_table(partitions=2)
+        partitioning.copy_rows()
+        partitioning.build_indexes(partitions=2, vector_index=False)
+
+        for partition in partitioning.partition_names(2):
+            indexes = self.partition_indexes(partition)
+            self.assertIn('USING gin (upper(text) gin_trgm_ops)', indexes[f'{partition}_text_trgm'])
+            self.assertIn('(document_id, chunk_index)', indexes[f'{partition}_{DocumentChunk._meta.indexes[0].name}'])
+
+    def test_online_migration_keeps_rows_and_writes_made_during_the_copy(self):
+        from . import partitioning
+
+        other = User.objects.create_user(username='other', email='other@example.com', password='pass12345')
+        embedded = make_document(self.user, chunks=6)
+        make_document(other, chunks=6)
+        DocumentChunk.objects.filter(document=embedded).update(embedding=[0.5] * 3072)
+        partitioning.create_partitioned_table(partitions=4)
+
+        ids = sorted(str(chunk_id) for chunk_id in DocumentChunk.objects.values_list('id', flat=True))
+        writes = []
+
+        def write_mid_copy(copied, last):
+            # After the first batch: a new document, plus an edit and a delete on each side of the copy cursor
+            if writes:
+                return
+            writes.append(make_document(other, chunks=3))
+            DocumentChunk.objects.filter(id__in=[ids[0], ids[-1]]).update(text='edited')
+            DocumentChunk.objects.filter(id__in=[ids[1], ids[-2]]).delete()
+
+        partitioning.copy_rows(batch_size=4, progress=write_mid_copy)
+        # Rerunning the copy from the start is harmless
+        partitioning.copy_rows(batch_size=4)
+        partitioning.build_indexes(partitions=4)
+
+        expected = set(DocumentChunk.objects.values_list('id', 'user_id', 'document_id', 'chunk_index', 'text'))
+        expected_embedded = set(DocumentChunk.objects.filter(embedding__isnull=False).values_list('id', flat=True))
+        self.assertEqual(len(expected), 12 + 3 - 2)
+        self.assertEqual(partitioning.status()['copied_rows'], len(expected))
+        partitioning.swap_tables()
+        self.assertEqual(partitioning.status(), {'step': 'swapped', 'old_table': True})
+
+        # The ORM now reads the partitioned table and writes land in the owner's partition
+        self.assertEqual(set(DocumentChunk.objects.values_list('id', 'user_id', 'document_id', 'chunk_index', 'text')), expected)
+        self.assertEqual(set(DocumentChunk.objects.filter(embedding__isnull=False).values_list('id', flat=True)), expected_embedded)
+        self.assertEqual(DocumentChunk.objects.filter(text='edited').count(), 2)
+        DocumentChunk.objects.create(document=embedded, text='after swap', chunk_index=99)
+        with connection.cursor() as cursor:
+            cursor.execute(' UNION ALL '.join(
+                f'SELECT count(*) FROM {partition}' for partition in partitioning.partition_names(4)
+            ))
+            self.assertEqual(sum(row[0] for row in cursor.fetchall()), len(expected) + 1)
+
+
+class ChunkPaginationTests(TestCase):
+    """Chunk listings page by keyset instead of OFFSET."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', email='reader@example.com', password='pass12345')
+        self.document = make_document(self.user, chunks=25)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_cursor_pages_cover_every_chunk_once(self):
+        url = f'/api/v1/documents/documents/{self.document.id}/chunks/?page_size=10'
+        seen = []
+        while url:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            for query in context.captured_queries:
+                self.assertNotIn('OFFSET', query['sql'])
+            seen.extend(chunk['chunk_index'] for chunk in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, list(range(25)))
+
+    def test_export_streams_all_chunks(self):
+        response = self.client.get(f'/api/v1/documents/documents/{self.document.id}/chunks/export/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        chunks = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([chunk['chunk_index'] for chunk in chunks], list(range(25)))
+
+    def test_chunks_are_private_to_the_owner(self):
+        url = f'/api/v1/documents/documents/{self.document.id}/chunks/'
+        self.assertEqual(APIClient().get(url).status_code, 401)
+
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user(username='other', email='other@example.com', password='pass12345'))
+        self.assertEqual(other.get(url).status_code, 404)
+        self.assertEqual(other.get(f'{url}export/').status_code, 404)
+        self.assertEqual(other.patch(f'/api/v1/documents/documents/{self.document.id}/', {'title': 'Mine'}).status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class DocumentOwnershipTests(TestCase):
+    """The documents/ list and create endpoints only ever see the caller's own documents."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', email='owner@example.com', password='pass12345')
+        self.other = User.objects.create_user(username='other', email='other@example.com', password='pass12345')
+        self.client = APIClient()
+        self.client.force_authenticate(self.other)
+
+    def test_list_and_create_require_authentication(self):
+        anonymous = APIClient()
+        self.assertEqual(anonymous.get('/api/v1/documents/documents/').status_code, 401)
+        self.assertEqual(anonymous.post('/api/v1/documents/documents/', {'title': 'Anonymous'}).status_code, 401)
+
+    def test_list_is_scoped_to_the_caller(self):
+        make_document(self.user)
+        mine = make_document(self.other)
+        response = self.client.get('/api/v1/documents/documents/')
+        self.assertEqual([document['id'] for document in response.data['results']], [str(mine.id)])
+
+    def test_upload_is_owned_by_the_caller(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        # User.objects.first(), whom uploads used to be assigned to, is now someone else
+        User.objects.create_user(username='newest', email='newest@example.com', password='pass12345')
+        upload = SimpleUploadedFile('notes.txt', b'Some notes', content_type='text/plain')
+        response = self.client.post('/api/v1/documents/documents/', {'title': 'Notes', 'file': upload, 'file_type': 'txt'})
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(Document.objects.get(id=response.data['id']).user, self.other)
+
+    def test_upload_cannot_target_another_users_collection(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        collection = DocumentCollection.objects.create(user=self.user, name='Private')
+        upload = SimpleUploadedFile('notes.txt', b'Some notes', content_type='text/plain')
+        response = self.client.post(
+            '/api/v1/documents/documents/', {'title': 'Notes', 'file': upload, 'file_type': 'txt', 'collection': collection.id},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Document.objects.filter(user=self.other).exists())
+
+
+@override_settings(INGEST_MAX_INFLIGHT=10, INGEST_TENANT_CONCURRENCY=10, INGEST_TENANT_WEIGHT=1,
+                   INGEST_SIZE_PENALTY_SECONDS_PER_MB=30, INGEST_INFLIGHT_TIMEOUT=600)
+class IngestionSchedulerTests(SimpleTestCase):
+
+    def setUp(self):
+        import fakeredis
+        from .scheduler import IngestionScheduler
+
+        self.scheduler = IngestionScheduler(fakeredis.FakeRedis(decode_responses=True))
+        self.sent = []
+
+    def submit(self, tenant, name, size=0):
+        return self.scheduler.submit('documents.task.process_document', tenant, [name], size=size)
+
+    def dispatch(self):
+        return self.scheduler.dispatch(lambda job, job_id: self.sent.append((job['tenant'], job['args'][0], job_id)))
+
+    @override_settings(INGEST_TENANT_CONCURRENCY=2)
+    def test_tenant_cap_holds_until_a_slot_is_released(self):
+        from prometheus_client import REGISTRY
+
+        for i in range(4):
+            self.submit('alice', f'a{i}')
+
+        self.assertEqual(self.dispatch(), 2)
+        self.assertEqual(self.dispatch(), 0)
+        self.assertEqual(
+            [REGISTRY.get_sample_value(name) for name in ('ingest_queue_depth', 'ingest_queued_tenants', 'ingest_inflight')],
+            [2, 1, 2],
+        )
+
+        self.scheduler.release('alice', self.sent[0][2])
+        self.assertEqual(self.dispatch(), 1)
+        self.assertEqual([name for _, name, _ in self.sent], ['a0', 'a1', 'a2'])
+
+    @override_settings(INGEST_MAX_INFLIGHT=4)
+    def test_tenants_take_turns(self):
+        for i in range(6):
+            self.submit('alice', f'a{i}')
+        self.submit('bob', 'b0')
+        self.submit('bob', 'b1')
+
+        self.assertEqual(self.dispatch(), 4)
+        self.assertEqual(sorted(tenant for tenant, _, _ in self.sent), ['alice', 'alice', 'bob', 'bob'])
+
+    @override_settings(INGEST_MAX_INFLIGHT=4)
+    def test_weight_gives_a_tenant_more_jobs_per_turn(self):
+        self.scheduler.redis.hset('ingest:weights', 'alice', 3)
+        for i in range(6):
+            self.submit('alice', f'a{i}')
+            self.submit('bob', f'b{i}')
+
+        self.dispatch()
+        self.assertEqual(sorted(tenant for tenant, _, _ in self.sent), ['alice', 'alice', 'alice', 'bob'])
+
+    @override_settings(INGEST_TENANT_CONCURRENCY=1)
+    def test_small_jobs_go_first_within_a_tenant(self):
+        self.submit('alice', 'large', size=50 * 1024 * 1024)
+        self.submit('alice', 'small', size=10 * 1024)
+
+        self.dispatch()
+        self.assertEqual([name for _, name, _ in self.sent], ['small'])
+
+    @override_settings(INGEST_TENANT_CONCURRENCY=1)
+    def test_slots_of_lost_jobs_expire(self):
+        self.submit('alice', 'a0')
+        self.submit('alice', 'a1')
+        self.dispatch()
+
+        with override_settings(INGEST_INFLIGHT_TIMEOUT=-1):
+            self.assertEqual(self.dispatch(), 1)
+        self.assertEqual([name for _, name, _ in self.sent], ['a0', 'a1'])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), UPLOAD_PARTIAL_DIR=tempfile.mkdtemp(), UPLOAD_PART_MAX_SIZE=1024)
+class ResumableUploadTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='uploader', email='uploader@example.com', password='pass12345')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.content = b'%PDF-1.4\n' + bytes(range(256)) * 10
+
+    def initiate(self, **kwargs):
+        payload = dict(title='Report', filename='report.pdf', file_type='pdf', file_size=len(self.content))
+        payload.update(kwargs)
+        return self.client.post('/api/v1/documents/uploads/', payload, format='json')
+
+    def put_part(self, upload_id, offset, data):
+        return self.client.put(
+            f'/api/v1/documents/uploads/{upload_id}/parts/?offset={offset}',
+            data, content_type='application/octet-stream',
+        )
+
+    @patch('documents.uploads.enqueue_ingestion')
+    def test_parts_resume_and_complete(self, enqueue_ingestion):
+        upload_id = self.initiate().data['id']
+
+        self.assertEqual(self.put_part(upload_id, 0, self.content[:1000]).data['received_bytes'], 1000)
+        # A retried or skipped part is refused with the offset to resume from
+        response = self.put_part(upload_id, 0, self.content[:1000])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['received_bytes'], 1000)
+
+        for offset in range(1000, len(self.content), 1000):
+            self.assertEqual(self.put_part(upload_id, offset, self.content[offset:offset + 1000]).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/v1/documents/uploads/{upload_id}/complete/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['upload']['sha256'], hashlib.sha256(self.content).hexdigest())
+
+        document = Document.objects.get(id=response.data['document']['id'])
+        with document.file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+        enqueue_ingestion.assert_called_once()
+        self.assertEqual(enqueue_ingestion.call_args.args[1], document)
+
+    def test_part_that_loses_its_offset_while_uploading_is_refused(self):
+        from .uploads import receive_part
+
+        upload_id = self.initiate().data['id']
+        self.put_part(upload_id, 0, self.content[:1000])
+        session = UploadSession.objects.get(id=upload_id)
+
+        def other_part_lands(*args, **kwargs):
+            part_path = receive_part(*args, **kwargs)
+            # Another request for the same offset commits while this body is still arriving
+            UploadSession.objects.filter(id=upload_id).update(received_bytes=2000, parts_received=2)
+            return part_path
+
+        with patch('documents.views.receive_part', side_effect=other_part_lands):
+            response = self.put_part(upload_id, 1000, self.content[1000:2000])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['received_bytes'], 2000)
+        # Nothing was appended and the refused part's own file is gone
+        self.assertEqual(os.path.getsize(session.partial_path), 1000)
+        self.assertEqual([name for name in os.listdir(os.path.dirname(session.partial_path)) if name.startswith(upload_id)], [f'{upload_id}.part'])
+
+    def test_declared_size_and_type_are_checked_up_front(self):
+        self.assertEqual(self.initiate(file_size=100 * 1024 * 1024).status_code, 400)
+        self.assertEqual(self.initiate(filename='report.exe').status_code, 400)
+
+    def test_first_bytes_must_match_declared_type(self):
+        upload_id = self.initiate().data['id']
+        response = self.put_part(upload_id, 0, b'MZ' + self.content[2:1000])
+        self.assertEqual(response.status_code, 415)
+        self.assertEqual(UploadSession.objects.get(id=upload_id).status, 'failed')
+
+    def test_incomplete_upload_cannot_complete(self):
+        upload_id = self.initiate().data['id']
+        self.put_part(upload_id, 0, self.content[:1000])
+        response = self.client.post(f'/api/v1/documents/uploads/{upload_id}/complete/')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Document.objects.exists())
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), DOCUMENT_PURGE_BATCH_SIZE=4)
+class DocumentDeletionTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='deleter', email='deleter@example.com', password='pass12345')
+        self.collection = DocumentCollection.objects.create(user=self.user, name='Contracts')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @patch('documents.task.purge_deleted_documents.delay')
+    def test_delete_hides_document_then_purge_removes_rows_and_file(self, purge):
+        from django.core.files.base import ContentFile
+        from django.core.files.storage import default_storage
+        from .task import purge_deleted_documents
+
+        document = make_document(self.user, collection=self.collection, chunks=10)
+        document.file = default_storage.save('documents/contract.txt', ContentFile(b'text'))
+        document.save()
+        chunk = document.chunks.first()
+        ChunkEmbedding.objects.create(chunk=chunk, model='fake-embedding@8', embedding=[0.0] * 8)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f'/api/v1/documents/documents/{document.id}/')
+        self.assertEqual(response.status_code, 204)
+        purge.assert_called_once()
+        self.assertFalse(Document.objects.filter(id=document.id).exists())
+        self.assertEqual(DocumentChunk.objects.filter(document_id=document.id).count(), 10)
+        self.collection.refresh_from_db()
+        self.assertEqual(self.collection.documents_count, 0)
+
+        purge_deleted_documents()
+        self.assertFalse(Document.all_objects.filter(id=document.id).exists())
+        self.assertFalse(DocumentChunk.objects.filter(document_id=document.id).exists())
+        self.assertFalse(ChunkEmbedding.objects.exists())
+        self.assertFalse(default_storage.exists('documents/contract.txt'))
+        self.collection.refresh_from_db()
+        self.assertEqual(self.collection.documents_count, 0)
+
+    @patch('documents.task.purge_deleted_documents.delay')
+    def test_purge_does_not_load_extracted_text(self, purge):
+        from .deletion import soft_delete_documents
+        from .task import purge_deleted_documents
+
+        documents = [make_document(self.user, collection=self.collection, chunks=2, extracted_text='x' * 1000) for _ in range(3)]
+        soft_delete_documents(Document.objects.filter(id__in=[document.id for document in documents]))
+        with CaptureQueriesContext(connection) as context:
+            purge_deleted_documents()
+        self.assertFalse(Document.all_objects.exists())
+        for query in context.captured_queries:
+            self.assertNotIn('extracted_text', query['sql'])
+        self.collection.refresh_from_db()
+        self.assertEqual(self.collection.documents_count, 0)
+
+    @patch('documents.task.purge_deleted_documents.delay')
+    def test_collection_delete_detaches_documents(self, purge):
+        documents = [make_document(self.user, collection=self.collection, chunks=3) for _ in range(3)]
+        other = make_document(self.user, chunks=3)
+
+        response = self.client.delete(f'/api/v1/documents/collections/{self.collection.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(DocumentCollection.objects.filter(id=self.collection.id).exists())
+        self.assertEqual(
+            Document.all_objects.filter(id__in=[document.id for document in documents], deleted_at__isnull=False).count(), 3,
+        )
+        self.assertEqual(list(Document.objects.values_list('id', flat=True)), [other.id])
+
+    @patch('documents.task.purge_deleted_documents.delay')
+    def test_bulk_delete_keeps_the_collection(self, purge):
+        make_document(self.user, collection=self.collection, chunks=2)
+        make_document(self.user, collection=self.collection, chunks=2)
+
+        response = self.client.delete(f'/api/v1/documents/collections/{self.collection.id}/documents/')
+        self.assertEqual((response.status_code, response.data), (200, {'deleted': 2}))
+        self.assertTrue(DocumentCollection.objects.filter(id=self.collection.id).exists())
+        self.assertFalse(Document.objects.exists())
+
+    @patch('documents.task.purge_deleted_documents.delay')
+    def test_only_the_owner_can_delete(self, purge):
+        document = make_document(self.user, collection=self.collection, chunks=2)
+        intruder = APIClient()
+        intruder.force_authenticate(User.objects.create_user(username='intruder', email='intruder@example.com', password='pass12345'))
+
+        for client, expected in ((APIClient(), 401), (intruder, 404)):
+            self.assertEqual(client.delete(f'/api/v1/documents/collections/{self.collection.id}/documents/').status_code, expected)
+            self.assertEqual(client.delete(f'/api/v1/documents/collections/{self.collection.id}/').status_code, expected)
+            self.assertEqual(client.delete(f'/api/v1/documents/documents/{document.id}/').status_code, expected)
+        purge.assert_not_called()
+        self.assertTrue(Document.objects.filter(id=document.id).exists())
+        self.assertTrue(DocumentCollection.objects.filter(id=self.collection.id).exists())
+
+
+class DocumentArchiveTests(TestCase):
+
+    def setUp(self):
+        self.source = User.objects.create_user(username='source', email='source@example.com', password='pass12345')
+        self.target = User.objects.create_user(username='target', email='target@example.com', password='pass12345')
+        collection = DocumentCollection.objects.create(user=self.source, name='Contracts')
+        self.documents = [make_document(self.source, collection=collection, chunks=3, extracted_text='text') for _ in range(2)]
+        rng = np.random.default_rng(0)
+        self.vectors = {}
+        for chunk in DocumentChunk.objects.filter(user=self.source).exclude(chunk_index=2):
+            chunk.embedding = rng.random(3072, dtype=np.float32)
+            chunk.embedding_model = 'fake-embedding'
+            chunk.save()
+            self.vectors[(chunk.document_id, chunk.chunk_index)] = chunk.embedding
+        self.directory = os.path.join(tempfile.mkdtemp(), 'archive')
+
+    def test_export_import_round_trip(self):
+        call_command('export_documents', self.directory, user='source@example.com', stdout=StringIO())
+        with patch('qa.services.index_cache.bump_index_version') as bump:
+            call_command('import_documents', self.directory, user='target@example.com', stdout=StringIO())
+        bump.assert_called_once_with(self.target.id)
+
+        imported = Document.objects.filter(user=self.target).order_by('created_at')
+        self.assertEqual(imported.count(), 2)
+        self.assertEqual(imported[0].collection.name, 'Contracts')
+        self.assertEqual(imported[0].collection.documents_count, 2)
+
+        chunks = DocumentChunk.objects.with_embeddings().filter(user=self.target)
+        self.assertEqual(chunks.count(), 6)
+        source_ids = {document.id: source.id for document, source in zip(imported, self.documents)}
+        for chunk in chunks:
+            self.assertEqual(chunk.text, f"chunk {chunk.chunk_index}")
+            expected = self.vectors.get((source_ids[chunk.document_id], chunk.chunk_index))
+            if expected is None:
+                self.assertIsNone(chunk.embedding)
+            else:
+                np.testing.assert_allclose(chunk.embedding, expected, rtol=1e-6)
+                self.assertEqual(chunk.embedding_model, 'fake-embedding')
+
+    def test_corrupted_archive_is_refused(self):
+        call_command('export_documents', self.directory, user='source@example.com', stdout=StringIO())
+        with open(os.path.join(self.directory, 'chunks', 'text.bin'), 'r+b') as f:
+            f.write(b'X')
+        with self.assertRaisesMessage(CommandError, 'chunks/text.bin does not match its checksum'):
+            call_command('import_documents', self.directory, user='target@example.com', stdout=StringIO())
+        self.assertFalse(Document.objects.filter(user=self.target).exists())
+
+    def test_copy_rows_use_pgvector_binary_format(self):
+        from pgvector import Vector
+        from .archive import _copy_row
+
+        vector = np.arange(4, dtype=np.float32)
+        row = _copy_row(uuid.uuid4(), uuid.uuid4(), 7, 'text', 0, None, vector, 'model', self.documents[0].created_at)
+        self.assertEqual(struct.unpack('>h', row[:2])[0], 9)
+        self.assertIn(Vector(vector).to_binary(), row)
+
+
+class DocxExtractionTests(SimpleTestCase):
+
+    def make_docx(self):
+        from docx import Document as DocxDocument
+        from docx.enum.section import WD_SECTION
+
+        doc = DocxDocument()
+        doc.add_paragraph('Payment is due within thirty days.')
+        table = doc.add_table(rows=1, cols=2)
+        table.cell(0, 0).text = 'Fee'
+        table.cell(0, 1).text = '100 EUR'
+        doc.add_page_break()
+        doc.add_page_break()  # A blank page is not counted
+        doc.add_paragraph('Termination requires notice.')
+        doc.add_section(WD_SECTION.NEW_PAGE)
+        doc.add_paragraph('Governing law.')
+        path = os.path.join(tempfile.mkdtemp(), 'contract.docx')
+        doc.save(path)
+        return path
+
+    def test_streams_paragraphs_and_cells_with_pages(self):
+        blocks = list(DocumentProcessor.iter_docx_blocks(self.make_docx()))
+        self.assertEqual(blocks, [
+            (1, 'Payment is due within thirty days.'),
+            (1, 'Fee'),
+            (1, '100 EUR'),
+            (2, 'Termination requires notice.'),
+            (3, 'Governing law.'),
+        ])
+
+    def test_chunk_page_numbers_follow_page_starts(self):
+        text, page_count, page_starts = DocumentProcessor.extract_pages_from_docx(self.make_docx())
+        self.assertEqual(page_count, 3)
+        normalized = ' '.join(text.split())
+        self.assertEqual(normalized[page_starts[1]:].split('.')[0], 'Termination requires notice')
+        self.assertEqual(normalized[page_starts[2]:], 'Governing law.')
+
+        # A chunk is on the page it starts on
+        chunks = DocumentProcessor.chunk_text_with_offsets(text, chunk_size=30, overlap=5)
+        self.assertEqual([normalized[offset:offset + len(chunk)] for chunk, offset in chunks], [chunk for chunk, _ in chunks])
+        self.assertEqual(chunks[-1][0], 'Governing law.')
+        pages = DocumentProcessor.page_numbers([offset for _, offset in chunks], page_starts)
+        self.assertEqual(pages, [1, 1, 2, 3])
@@ -0,0 +1,191 @@
+"""Resumable, chunked uploads.
+
+A client declares the file up front (name, type, size) and then sends its bytes
+as parts at increasing offsets. Each part is streamed from the request body into
+a file of its own and only then appended to the partial file, so neither the
+file nor a part is ever held in memory, no lock is held while the client sends,
+and a dropped connection only loses the part in flight: the client reads
+received_bytes back and resumes from there. On completion the partial file is
+copied into storage, hashed in the same pass, and handed to process_document.
+"""
+import codecs
+import hashlib
+import os
+import shutil
+import uuid
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .models import Document, UploadSession
+from .scheduler import enqueue_ingestion
+
+
+READ_SIZE = 64 * 1024
+
+# Leading bytes every valid file of the type starts with (DOCX is a zip archive)
+FILE_SIGNATURES = {
+    'pdf': (b'%PDF-',),
+    'docx': (b'PK\x03\x04',),
+}
+
+
+class UploadError(Exception):
+    """The upload was rejected; the message is safe to return to the client."""
+
+
+class UploadOffsetMismatch(UploadError):
+    """A part was sent for an offset other than the next expected byte."""
+
+
+class InvalidFileContent(UploadError):
+    """The first bytes show the file is not of its declared type."""
+
+
+class HashingFile(File):
+    """File wrapper that hashes the content as storage reads it in chunks."""
+
+    def __init__(self, file, name=None):
+        super().__init__(file, name)
+        self.sha256 = hashlib.sha256()
+
+    def chunks(self, chunk_size=None):
+        for chunk in super().chunks(chunk_size):
+            self.sha256.update(chunk)
+            yield chunk
+
+
+def check_file_signature(file_type: str, head: bytes):
+    """Reject content whose first bytes don't match the declared file type."""
+    signatures = FILE_SIGNATURES.get(file_type)
+    if signatures:
+        if not head.startswith(signatures):
+            raise InvalidFileContent(f"File content is not a valid {file_type.upper()} file.")
+        return
+
+    # Text files must be UTF-8; the incremental decoder tolerates a character split at the end of the read
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(head)
+    except UnicodeDecodeError:
+        raise InvalidFileContent("Text files must be UTF-8 encoded.")
+    if b'\x00' in head:
+        raise InvalidFileContent("Text files must not contain binary data.")
+
+
+def receive_part(session: UploadSession, stream, offset: int, length: int, expected_sha256: str = None) -> str:
+    """Stream one part from the client into a file of its own and return that file's path.
+
+    Runs without the session lock, so a slow client holds no row lock or
+    transaction; append_part then checks the offset again under the lock.
+    """
+    if session.status != 'uploading':
+        raise UploadError(f"Upload is {session.status}.")
+    if offset != session.received_bytes:
+        raise UploadOffsetMismatch(f"Expected offset {session.received_bytes}, got {offset}.")
+    if length <= 0:
+        raise UploadError("Upload part is empty.")
+    if length > settings.UPLOAD_PART_MAX_SIZE:
+        raise UploadError(f"Upload part exceeds the {settings.UPLOAD_PART_MAX_SIZE} byte limit.")
+    if offset + length > session.file_size:
+        raise UploadError(f"Upload part runs past the declared size of {session.file_size} bytes.")
+
+    os.makedirs(os.path.dirname(session.partial_path), exist_ok=True)
+    # A retried part gets a fresh file, so concurrent attempts never share one
+    part_path = f"{session.partial_path}.{uuid.uuid4().hex}"
+    digest = hashlib.sha256()
+    try:
+        with open(part_path, 'wb') as part:
+            remaining = length
+            while remaining:
+                data = stream.read(min(READ_SIZE, remaining))
+                if not data:
+                    raise UploadError(f"Upload part ended after {length - remaining} of {length} bytes.")
+                if offset == 0 and remaining == length:
+                    check_file_signature(session.file_type, data)
+                part.write(data)
+                digest.update(data)
+                remaining -= len(data)
+
+        if expected_sha256 and expected_sha256.lower() != digest.hexdigest():
+            raise UploadError("Upload part checksum mismatch.")
+    except BaseException:
+        discard_file(part_path)
+        raise
+    return part_path
+
+
+def append_part(session: UploadSession, part_path: str, offset: int, length: int):
+    """Copy a received part onto the partial file and advance received_bytes.
+
+    The caller holds the session's row lock, which only covers this local copy;
+    a part that lost a race for its offset is refused here.
+    """
+    if session.status != 'uploading':
+        raise UploadError(f"Upload is {session.status}.")
+    if offset != session.received_bytes:
+        raise UploadOffsetMismatch(f"Expected offset {session.received_bytes}, got {offset}.")
+
+    mode = 'r+b' if os.path.exists(session.partial_path) else 'wb'
+    with open(part_path, 'rb') as part, open(session.partial_path, mode) as partial:
+        # Drop bytes left behind by an interrupted copy
+        partial.truncate(offset)
+        partial.seek(offset)
+        shutil.copyfileobj(part, partial, READ_SIZE)
+        partial.flush()
+        os.fsync(partial.fileno())
+
+    session.received_bytes = offset + length
+    session.parts_received += 1
+    session.save(update_fields=['received_bytes', 'parts_received', 'updated_at'])
+
+
+def complete_upload(session: UploadSession) -> Document:
+    """Move a fully received upload into storage and queue it for processing."""
+    from .task import process_document
+
+    if session.status != 'uploading':
+        raise UploadError(f"Upload is {session.status}.")
+    if session.received_bytes != session.file_size:
+        raise UploadError(f"Upload is incomplete: {session.received_bytes} of {session.file_size} bytes received.")
+
+    file_field = Document._meta.get_field('file')
+    with open(session.partial_path, 'rb') as partial:
+        content = HashingFile(partial)
+        name = default_storage.save(file_field.generate_filename(None, session.filename), content)
+
+    document = Document.objects.create(
+        user=session.user,
+        collection=session.collection,
+        title=session.title,
+        file=name,
+        file_type=session.file_type,
+        file_size=session.file_size,
+    )
+    session.document = document
+    session.sha256 = content.sha256.hexdigest()
+    session.status = 'completed'
+    session.save(update_fields=['document', 'sha256', 'status', 'updated_at'])
+    discard_partial(session)
+
+    transaction.on_commit(lambda: enqueue_ingestion(process_document, document))
+    return document
+
+
+def fail_upload(session: UploadSession, error: str):
+    """Mark an upload as failed and free its partial file."""
+    session.status = 'failed'
+    session.error = error
+    session.save(update_fields=['status', 'error', 'updated_at'])
+    discard_partial(session)
+
+
+def discard_partial(session: UploadSession):
+    discard_file(session.partial_path)
+
+
+def discard_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
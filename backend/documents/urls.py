@@ -1,6 +1,12 @@
-from django.urls import path
-from .views import DocumentListCreateView
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+from .views import DocumentViewSet, DocumentCollectionViewSet, UploadSessionViewSet
+
+router = DefaultRouter()
+router.register(r'documents', DocumentViewSet, basename='document')
+router.register(r'collections', DocumentCollectionViewSet, basename='collection')
+router.register(r'uploads', UploadSessionViewSet, basename='upload')
 
 urlpatterns = [
-    path('documents/', DocumentListCreateView.as_view(), name='document-list-create'),
+    path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,14 +1,21 @@
-import PyPDF2
-from docx import Document as DocxDocument
-from typing import Tuple, List
+from bisect import bisect_right
+from typing import Iterator, Tuple, List
 import re
 
+
+WORD_NAMESPACE = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+# Alternative renderings for older readers (e.g. of text boxes) would repeat their text
+FALLBACK_TAG = '{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback'
+
+
 class DocumentProcessor:
     """Utility class for document text extraction and processing."""
     
     @staticmethod
     def extract_text_from_pdf(file_path: str) -> tuple[str, int]:
         """Extract text and page count from a PDF file."""
+        import PyPDF2
+        
         text = ""
         try:
             with open(file_path, 'rb') as file:
@@ -23,17 +30,138 @@ class DocumentProcessor:
             raise Exception(f"Error extracting text from PDF: {str(e)}")
         
     @staticmethod
-    def extract_text_from_docx(file_path: str) -> tuple[str, int]:
-        """Extract text and page count from a DOCX file."""
-        text = ""
+    def iter_docx_blocks(file_path: str) -> Iterator[Tuple[int, str]]:
+        """Yield (page number, text) for each paragraph and table cell of a DOCX file, in document order.
+        
+        word/document.xml is streamed from the zip with lxml's iterparse and
+        each body element is freed once read, so memory stays flat however
+        long the document is. Pages are counted from the breaks Word saved
+        while laying the document out (lastRenderedPageBreak) and from explicit
+        page breaks, pageBreakBefore paragraphs and new-page section breaks;
+        consecutive breaks with no text between them count once.
+        """
+        import zipfile
+        from lxml import etree
+        
+        w = f'{{{WORD_NAMESPACE}}}'
+        P, T, TAB, BR, CR, TC, BODY = (w + name for name in ('p', 't', 'tab', 'br', 'cr', 'tc', 'body'))
+        RENDERED_BREAK, BREAK_BEFORE, SECTION = (w + name for name in ('lastRenderedPageBreak', 'pageBreakBefore', 'sectPr'))
+        TYPE, VAL = w + 'type', w + 'val'
+        
+        page = 1
+        page_break = False  # A break was seen since the last text
+        started = False  # Some text was yielded, so a break starts a new page
+        paragraph = []
+        cells = []  # Text of the table cells being read, innermost last
+        section_break = False
+        skipping = 0  # Depth inside mc:Fallback elements
+        
+        def take(parts):
+            nonlocal page, page_break, started
+            text = ''.join(parts)
+            parts.clear()
+            if not text.strip():
+                return None
+            if page_break and started:
+                page += 1
+            page_break = False
+            started = True
+            return page, text
+        
+        with zipfile.ZipFile(file_path) as archive, archive.open('word/document.xml') as xml:
+            for event, element in etree.iterparse(xml, events=('start', 'end')):
+                name = element.tag
+                if name == FALLBACK_TAG:
+                    skipping += 1 if event == 'start' else -1
+                    continue
+                if event == 'start':
+                    if name == TC and not skipping:
+                        cells.append([])
+                    continue
+                
+                if skipping:
+                    continue
+                if name == T:
+                    paragraph.append(element.text or '')
+                elif name == TAB:
+                    paragraph.append('\t')
+                elif name == CR:
+                    paragraph.append('\n')
+                elif name == BR:
+                    if element.get(TYPE) == 'page':
+                        # Text before the break stays on the old page
+                        block = None if cells else take(paragraph)
+                        if block:
+                            yield block
+                        page_break = True
+                    else:
+                        paragraph.append('\n')
+                elif name == RENDERED_BREAK:
+                    block = None if cells else take(paragraph)
+                    if block:
+                        yield block
+                    page_break = True
+                elif name == BREAK_BEFORE:
+                    if element.get(VAL, 'true') not in ('0', 'false', 'off'):
+                        page_break = True
+                elif name == SECTION and element.getparent().getparent().tag == P:
+                    # A section ends with this paragraph; continuous sections stay on the page
+                    section_type = element.find(TYPE)
+                    section_break = section_type is None or section_type.get(VAL) in ('nextPage', 'oddPage', 'evenPage')
+                elif name == P:
+                    if cells:
+                        cells[-1].append(''.join(paragraph))
+                        paragraph.clear()
+                    else:
+                        block = take(paragraph)
+                        if block:
+                            yield block
+                    if section_break:
+                        page_break, section_break = True, False
+                elif name == TC:
+                    block = take(['\n'.join(cells.pop())])
+                    if block:
+                        if cells:
+                            # A nested table is part of the enclosing cell's text
+                            cells[-1].append(block[1])
+                        else:
+                            yield block
+                
+                parent = element.getparent()
+                if parent is not None and parent.tag == BODY:
+                    # Done with this paragraph or table; drop it and everything before it
+                    element.clear()
+                    while element.getprevious() is not None:
+                        del parent[0]
+    
+    @staticmethod
+    def extract_pages_from_docx(file_path: str) -> tuple[str, int, List[int]]:
+        """Extract text, page count and page start offsets from a DOCX file.
+        
+        The offsets index into the text as chunk_text sees it (whitespace
+        collapsed), ready for page_numbers.
+        """
         try:
-            doc = DocxDocument(file_path)
-            text = "\n\n".join([para.text for para in doc.paragraphs if para.text])
-            page_count = len(doc.paragraphs) // 20  # Rough estimate: 20 paragraphs per page
-            return text, max(1,page_count)
+            blocks, page_starts, offset, page_count = [], [], 0, 1
+            for page, text in DocumentProcessor.iter_docx_blocks(file_path):
+                normalized = re.sub(r'\s+', ' ', text).strip()
+                if blocks:
+                    offset += 1  # The space the blank lines between blocks collapse to
+                while len(page_starts) < page:
+                    page_starts.append(offset)
+                blocks.append(text)
+                offset += len(normalized)
+                page_count = page
+            return "\n\n".join(blocks), page_count, page_starts or [0]
         except Exception as e:
             raise Exception(f"Error extracting text from DOCX: {str(e)}")
     
+    @staticmethod
+    def extract_text_from_docx(file_path: str) -> tuple[str, int]:
+        """Extract text and page count from a DOCX file."""
+        text, page_count, _ = DocumentProcessor.extract_pages_from_docx(file_path)
+        return text, page_count
+    
     @staticmethod
     def extract_text_from_txt(file_path: str) -> tuple[str, int]:
         """Extract text and page count from a TXT file."""
@@ -47,31 +175,39 @@ class DocumentProcessor:
     @staticmethod
     def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
         """Chunk text into smaller pieces with specified size and overlap."""
+        return [chunk for chunk, _ in DocumentProcessor.chunk_text_with_offsets(text, chunk_size, overlap)]
+    
+    @staticmethod
+    def chunk_text_with_offsets(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[Tuple[str, int]]:
+        """Chunk text like chunk_text, with each chunk's start offset in the whitespace-collapsed text."""
         text = re.sub(r'\s+', ' ', text).strip()
         
         if len(text) <= chunk_size:
-            return [text]
+            return [(text, 0)]
         
         chunks = []
         start = 0
 
         while start < len(text):
             end = start + chunk_size
-            
-            if end >= len(text):
-                last_period = text.rfind('.', start, end)
-                if last_period > start:
-                    end = last_period + 1
-                    
-            chunk = text[start:end].strip()
+            raw = text[start:end]
+            chunk = raw.strip()
             
             if chunk:
-                chunks.append(chunk)
+                chunks.append((chunk, start + len(raw) - len(raw.lstrip())))
             
+            # The window that reaches the end of the text is the last one
+            if end >= len(text):
+                break
             start = end - overlap
             
         return chunks
     
+    @staticmethod
+    def page_numbers(offsets: List[int], page_starts: List[int]) -> List[int]:
+        """Page number of each offset, given the offset each page starts at."""
+        return [max(1, bisect_right(page_starts, offset)) for offset in offsets]
+    
     @staticmethod
     def count_words(text: str) -> int:
         """Count the number of words in the text."""
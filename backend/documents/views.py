@@ -1,30 +1,37 @@
-from django.shortcuts import render
-from rest_framework import viewsets, status
+from django.shortcuts import render, get_object_or_404
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.db import transaction
+from rest_framework import viewsets, status, mixins
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
-from .models import Document, DocumentCollection
+from core.mixins import ReplicaReadMixin
+from core.pagination import ChunkCursorPagination
+from .deletion import soft_delete_documents
+from .models import Document, DocumentChunk, DocumentCollection, UploadSession
+from .uploads import UploadError, UploadOffsetMismatch, InvalidFileContent, receive_part, append_part, complete_upload, fail_upload, discard_partial, discard_file
 from .serializers import (
     DocumentSerializer, 
     DocumentUploadSerializer, 
     DocumentCollectionSerializer, 
-    DocumentChunkSerializer
+    DocumentChunkSerializer,
+    UploadSessionSerializer,
 )
-from rest_framework import generics
+import json
 
 # Create your views here.
-class DocumentViewSet(viewsets.ModelViewSet):
-    permission_classes = [AllowAny]  # Changed for testing
+class DocumentViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
+    permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['status', 'file_type', 'collection']
     search_fields = ['title']
     ordering = ['-created_at']
     
     def get_queryset(self):
-        # Changed for testing - return all documents
-        return Document.objects.all()
+        return Document.objects.filter(user=self.request.user)
     
     def get_serializer_class(self):
         if self.action in ['create', 'upload']:  # Fixed: check both actions
@@ -32,56 +39,136 @@ class DocumentViewSet(viewsets.ModelViewSet):
         return DocumentSerializer
     
     def perform_create(self, serializer):
-        # Create test user if needed
-        from django.contrib.auth import get_user_model
-        User = get_user_model()
-        user = User.objects.first()
-        if not user:
-            user = User.objects.create_user(
-                username='testuser',
-                email='test@example.com',
-                password='testpass123'
-            )
-        
-        document = serializer.save(user=user)
-        # Commented out - task doesn't exist yet
-        # from .tasks import process_document
-        # process_document.delay(str(document.id))
+        serializer.save(user=self.request.user)
+    
+    def perform_destroy(self, instance):
+        # Returns at once; chunks and the file are purged in the background
+        soft_delete_documents(Document.objects.filter(id=instance.id))
         
     @action(detail=True, methods=['get'])
     def chunks(self, request, pk=None):  # Fixed: pk=None (capital N)
-        """Get all chunks for a document"""
+        """Get the chunks of a document, a cursor page at a time"""
+        document = self.get_object()
+        chunks = DocumentChunk.objects.filter(document=document)
+        paginator = ChunkCursorPagination()
+        page = paginator.paginate_queryset(chunks, request, view=self)
+        serializer = DocumentChunkSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+    
+    @action(detail=True, methods=['get'], url_path='chunks/export')
+    def export_chunks(self, request, pk=None):
+        """Stream every chunk of a document as one JSON array"""
         document = self.get_object()
-        chunks = document.chunks.all()
-        serializer = DocumentChunkSerializer(chunks, many=True)
-        return Response(serializer.data)
+        rows = (
+            DocumentChunk.objects.filter(document=document)
+            .order_by('chunk_index')
+            .values(*DocumentChunkSerializer.Meta.fields)
+            .iterator(chunk_size=500)
+        )
+        
+        def stream():
+            yield '['
+            for i, row in enumerate(rows):
+                yield (',' if i else '') + json.dumps(row, cls=DjangoJSONEncoder)
+            yield ']'
+        
+        response = StreamingHttpResponse(stream(), content_type='application/json')
+        response['Content-Disposition'] = f'attachment; filename="{document.id}-chunks.json"'
+        return response
 
     
-class DocumentCollectionViewSet(viewsets.ModelViewSet):
+class DocumentCollectionViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     serializer_class = DocumentCollectionSerializer
-    permission_classes = [AllowAny]  # Changed for testing
+    permission_classes = [IsAuthenticated]
     
     def get_queryset(self):  # Fixed typo: get_quesryset -> get_queryset
-        # Changed for testing - return all collections
-        return DocumentCollection.objects.all()
+        return DocumentCollection.objects.filter(user=self.request.user)
     
     def perform_create(self, serializer):
-        # Create test user if needed
-        from django.contrib.auth import get_user_model
-        User = get_user_model()
-        user = User.objects.first()
-        if not user:
-            user = User.objects.create_user(
-                username='testuser',
-                email='test@example.com',
-                password='testpass123'
-            )
-        serializer.save(user=user)
+        serializer.save(user=self.request.user)
+    
+    def perform_destroy(self, instance):
+        # Detached documents don't cascade with the collection; they are purged in the background
+        soft_delete_documents(instance.documents.all(), detach_collection=True)
+        instance.delete()
+    
+    @action(detail=True, methods=['delete'], url_path='documents')
+    def delete_documents(self, request, pk=None):
+        """Delete every document in a collection, keeping the collection"""
+        collection = self.get_object()
+        deleted = soft_delete_documents(collection.documents.all())
+        return Response({'deleted': deleted})
+
 
-class DocumentListCreateView(generics.ListCreateAPIView):
-    queryset = Document.objects.all()
+class UploadSessionViewSet(mixins.CreateModelMixin,
+                           mixins.RetrieveModelMixin,
+                           mixins.DestroyModelMixin,
+                           viewsets.GenericViewSet):
+    """Resumable uploads: create a session, PUT its parts, then complete it."""
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAuthenticated]
     
-    def get_serializer_class(self):
-        if self.request.method == 'POST':
-            return DocumentUploadSerializer
-        return DocumentSerializer
\ No newline at end of file
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user)
+    
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+    
+    def perform_destroy(self, instance):
+        discard_partial(instance)
+        instance.delete()
+    
+    @action(detail=True, methods=['put'])
+    def parts(self, request, pk=None):
+        """Append raw bytes at ?offset=; resume from received_bytes after a failure"""
+        try:
+            offset = int(request.query_params['offset'])
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except (KeyError, ValueError):
+            return Response({'error': 'An integer offset query parameter and a Content-Length header are required.'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # The body is read and verified before the row lock is taken, so a slow client blocks nobody
+        session = get_object_or_404(self.get_queryset(), pk=pk)
+        try:
+            part_path = receive_part(session, request.stream, offset, length, request.headers.get('X-Part-SHA256'))
+        except UploadOffsetMismatch as e:
+            return Response({'error': str(e), 'received_bytes': session.received_bytes}, status=status.HTTP_409_CONFLICT)
+        except InvalidFileContent as e:
+            # The first bytes gave the file away; don't wait for the rest of it
+            with transaction.atomic():
+                session = get_object_or_404(self.get_queryset().select_for_update(), pk=pk)
+                if session.status == 'uploading':
+                    fail_upload(session, str(e))
+            return Response({'error': str(e)}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        except UploadError as e:
+            return Response({'error': str(e), 'received_bytes': session.received_bytes}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # The row lock serializes appending parts of one upload; other uploads are unaffected
+        try:
+            with transaction.atomic():
+                session = get_object_or_404(self.get_queryset().select_for_update(), pk=pk)
+                try:
+                    append_part(session, part_path, offset, length)
+                except UploadOffsetMismatch as e:
+                    return Response({'error': str(e), 'received_bytes': session.received_bytes}, status=status.HTTP_409_CONFLICT)
+                except UploadError as e:
+                    return Response({'error': str(e), 'received_bytes': session.received_bytes}, status=status.HTTP_400_BAD_REQUEST)
+        finally:
+            discard_file(part_path)
+        
+        return Response(self.get_serializer(session).data)
+    
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        """Store the assembled file and queue it for processing"""
+        with transaction.atomic():
+            session = get_object_or_404(self.get_queryset().select_for_update(), pk=pk)
+            try:
+                document = complete_upload(session)
+            except UploadError as e:
+                return Response({'error': str(e), 'received_bytes': session.received_bytes}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'upload': self.get_serializer(session).data,
+            'document': DocumentSerializer(document).data,
+        }, status=status.HTTP_201_CREATED)
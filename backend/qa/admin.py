@@ -1,23 +1,35 @@
 from django.contrib import admin
-from .models import Conversation, Question
+from core.admin import LargeTableAdmin
+from .models import Conversation, Question, QuestionBatch
 
 # Register your admins here.
 @admin.register(Conversation)
-class ConversationAdmin(admin.ModelAdmin):
+class ConversationAdmin(LargeTableAdmin):
     list_display = ['title', 'user', 'created_at', 'updated_at']
     list_filter = ['created_at']
+    list_select_related = ['user']
     search_fields = ['title', 'user__email']
+    raw_id_fields = ['user']
     
 @admin.register(Question)
-class QuestionAdmin(admin.ModelAdmin):
-    list_display = ['question_text', 'conversation', 'created_at', 'is_helpful']  # Removed 'user'
+class QuestionAdmin(LargeTableAdmin):
+    list_display = ['question_text', 'get_user', 'conversation', 'created_at', 'is_helpful']
     list_filter = ['created_at', 'is_helpful']
-    search_fields = ['question_text', 'answer_text']
+    list_select_related = ['conversation__user']
+    # answer_text is left out: it is long and has no trigram index, so it would be scanned row by row
+    search_fields = ['question_text']
+    raw_id_fields = ['conversation']
     
-    # Optional: If you want to show the user, add a method
     def get_user(self, obj):
         return obj.conversation.user if obj.conversation else None
     get_user.short_description = 'User'
-    
-    # Then you can add 'get_user' to list_display if needed:
-    # list_display = ['question_text', 'get_user', 'conversation', 'created_at', 'is_helpful']
\ No newline at end of file
+
+
+@admin.register(QuestionBatch)
+class QuestionBatchAdmin(LargeTableAdmin):
+    list_display = ['id', 'user', 'status', 'total_questions', 'completed_questions', 'failed_questions', 'created_at']
+    list_filter = ['status', 'created_at']
+    list_select_related = ['user']
+    search_fields = ['user__email']
+    readonly_fields = ['completed_questions', 'failed_questions', 'completed_at']
+    raw_id_fields = ['user', 'conversation', 'collection']
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class QaConfig(AppConfig):
     name = 'qa'
+
+    def ready(self):
+        from . import signals  # noqa: F401
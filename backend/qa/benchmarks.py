@@ -0,0 +1,187 @@
+"""Offline performance benchmarks for the RAG pipeline.
+
+Meant to run with the deterministic fake provider (RAG_PROVIDER=fake) so
+results do not depend on a Google API key or network latency.
+"""
+import random
+import time
+from typing import List, Dict
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from documents.models import Document, DocumentChunk
+
+
+BENCHMARK_EMAIL = 'benchmark@example.com'
+
+VOCABULARY = (
+    "contract party agreement term payment invoice liability warranty clause notice "
+    "termination confidential data privacy security audit compliance report policy "
+    "service delivery schedule price discount renewal breach remedy dispute court "
+    "law jurisdiction license software hardware support maintenance upgrade risk"
+).split()
+
+
+def percentiles(samples_ms: List[float]) -> Dict:
+    """Summarize latency samples in milliseconds."""
+    import numpy as np
+
+    if not samples_ms:
+        return {'count': 0}
+    values = np.array(samples_ms)
+    return {
+        'count': len(samples_ms),
+        'mean_ms': round(float(values.mean()), 3),
+        'p50_ms': round(float(np.percentile(values, 50)), 3),
+        'p95_ms': round(float(np.percentile(values, 95)), 3),
+        'p99_ms': round(float(np.percentile(values, 99)), 3),
+    }
+
+
+def synthetic_text(rng: random.Random, words: int = 160) -> str:
+    """Deterministic pseudo-prose built from a small domain vocabulary."""
+    sentences = []
+    remaining = words
+    while remaining > 0:
+        length = min(remaining, rng.randint(8, 20))
+        sentence = ' '.join(rng.choice(VOCABULARY) for _ in range(length))
+        sentences.append(sentence.capitalize() + '.')
+        remaining -= length
+    return ' '.join(sentences)
+
+
+def get_benchmark_user():
+    User = get_user_model()
+    user, _ = User.objects.get_or_create(
+        email=BENCHMARK_EMAIL,
+        defaults={'username': 'benchmark'},
+    )
+    return user
+
+
+def clear_corpus(user):
+    """Remove all benchmark documents (with their chunks) and conversations."""
+    from qa.models import Conversation
+
+    Conversation.objects.filter(user=user).delete()
+    DocumentChunk.objects.filter(user=user).delete()
+    Document.objects.filter(user=user).delete()
+
+
+def create_corpus(user, n_documents: int, chunks_per_document: int, seed: int = 0) -> List[Document]:
+    """Create N synthetic documents with M unembedded chunks each."""
+    rng = random.Random(seed)
+    with transaction.atomic():
+        documents = Document.objects.bulk_create([
+            Document(
+                user=user,
+                title=f"Synthetic document {seed}-{i}",
+                file=f"benchmarks/synthetic-{seed}-{i}.txt",
+                file_type='txt',
+                file_size=0,
+                status='completed',
+            )
+            for i in range(n_documents)
+        ])
+        DocumentChunk.objects.bulk_create([
+            DocumentChunk(
+                document=document,
+                user=user,
+                text=synthetic_text(rng),
+                chunk_index=idx,
+                page_number=idx // 3 + 1,
+            )
+            for document in documents
+            for idx in range(chunks_per_document)
+        ], batch_size=1000)
+    return documents
+
+
+def benchmark_ingest(service, user, n_documents: int, chunks_per_document: int, seed: int = 0) -> Dict:
+    """Measure chunk creation and embedding throughput."""
+    start = time.perf_counter()
+    documents = create_corpus(user, n_documents, chunks_per_document, seed=seed)
+    create_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    embedded = sum(service.embed_document_chunks(str(document.id)) for document in documents)
+    embed_seconds = time.perf_counter() - start
+
+    total_chunks = n_documents * chunks_per_document
+    return {
+        'documents': n_documents,
+        'chunks': total_chunks,
+        'embedded': embedded,
+        'create_chunks_per_sec': round(total_chunks / create_seconds, 1) if create_seconds else None,
+        'embed_chunks_per_sec': round(embedded / embed_seconds, 1) if embed_seconds else None,
+        'ingest_chunks_per_sec': round(total_chunks / (create_seconds + embed_seconds), 1),
+    }
+
+
+def benchmark_search(service, user, queries: List[str], top_k: int = 5) -> Dict:
+    """Measure search latency over the user's current corpus."""
+    # The first search after ingestion rebuilds the index; report it separately
+    start = time.perf_counter()
+    service.search_similar_chunks(queries[0], str(user.id), top_k=top_k)
+    cold_ms = (time.perf_counter() - start) * 1000
+
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        service.search_similar_chunks(query, str(user.id), top_k=top_k)
+        samples.append((time.perf_counter() - start) * 1000)
+
+    result = percentiles(samples)
+    result['cold_ms'] = round(cold_ms, 3)
+    result['corpus_chunks'] = DocumentChunk.objects.filter(user=user, embedding__isnull=False).count()
+    return result
+
+
+def benchmark_ask(user, questions: List[str]) -> Dict:
+    """Measure end-to-end latency of the ask endpoint, including DB writes."""
+    from rest_framework.test import APIRequestFactory, force_authenticate
+    from qa.views import ConversationViewSet
+
+    view = ConversationViewSet.as_view({'post': 'ask'})
+    factory = APIRequestFactory()
+
+    samples = []
+    conversation_id = None
+    for question in questions:
+        payload = {'question': question}
+        if conversation_id:
+            payload['conversation_id'] = conversation_id
+        request = factory.post('/api/v1/qa/conversations/ask/', payload, format='json')
+        force_authenticate(request, user=user)
+
+        start = time.perf_counter()
+        response = view(request)
+        samples.append((time.perf_counter() - start) * 1000)
+
+        if response.status_code != 200:
+            raise RuntimeError(f"ask failed with {response.status_code}: {response.data}")
+        conversation_id = str(response.data['conversation_id'])
+
+    return percentiles(samples)
+
+
+def compare_results(previous: Dict, current: Dict) -> List[str]:
+    """Describe latency changes between two benchmark runs."""
+    lines = []
+    previous_search = {row['corpus_chunks']: row for row in previous.get('search', [])}
+    for row in current.get('search', []):
+        before = previous_search.get(row['corpus_chunks'])
+        if before:
+            lines.append(_delta_line(f"search@{row['corpus_chunks']}", before, row))
+    if previous.get('ask') and current.get('ask'):
+        lines.append(_delta_line('ask', previous['ask'], current['ask']))
+    return lines
+
+
+def _delta_line(label: str, before: Dict, after: Dict) -> str:
+    parts = []
+    for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+        if before.get(key):
+            change = (after[key] - before[key]) / before[key] * 100
+            parts.append(f"{key} {before[key]:.2f} -> {after[key]:.2f} ({change:+.1f}%)")
+    return f"{label}: " + ', '.join(parts)
@@ -0,0 +1,102 @@
+import json
+import random
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from qa import benchmarks
+from qa.services.rag_service import get_rag_service, reset_rag_service
+
+
+class Command(BaseCommand):
+    help = 'Benchmark ingestion, search and ask latency on a synthetic corpus'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--provider', default='fake', help="RAG provider to benchmark (default: fake)")
+        parser.add_argument('--documents', type=int, default=20, help='Documents added per corpus step')
+        parser.add_argument('--chunks-per-document', type=int, default=50)
+        parser.add_argument('--steps', type=int, default=3, help='Number of corpus sizes to measure search at')
+        parser.add_argument('--queries', type=int, default=50, help='Search queries per corpus size')
+        parser.add_argument('--asks', type=int, default=10, help='End-to-end ask requests')
+        parser.add_argument('--embed-latency-ms', type=float, default=0)
+        parser.add_argument('--generate-latency-ms', type=float, default=0)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Write results as JSON to this path')
+        parser.add_argument('--compare', help='Previous results JSON to compare against')
+        parser.add_argument('--keep', action='store_true', help='Keep the synthetic corpus afterwards')
+
+    def handle(self, *args, **options):
+        overrides = {
+            'RAG_PROVIDER': options['provider'],
+            'FAKE_LLM_EMBED_LATENCY_MS': options['embed_latency_ms'],
+            'FAKE_LLM_GENERATE_LATENCY_MS': options['generate_latency_ms'],
+        }
+        with override_settings(**overrides):
+            reset_rag_service()
+            try:
+                results = self.run_benchmarks(options)
+            finally:
+                reset_rag_service()
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                previous = json.load(f)
+            for line in benchmarks.compare_results(previous, results):
+                self.stdout.write(line)
+
+    def run_benchmarks(self, options):
+        service = get_rag_service()
+        user = benchmarks.get_benchmark_user()
+        benchmarks.clear_corpus(user)
+
+        rng = random.Random(options['seed'])
+        queries = [benchmarks.synthetic_text(rng, words=12) for _ in range(options['queries'])]
+
+        results = {
+            'meta': {
+                'timestamp': timezone.now().isoformat(),
+                'provider': options['provider'],
+                'documents_per_step': options['documents'],
+                'chunks_per_document': options['chunks_per_document'],
+                'embed_latency_ms': options['embed_latency_ms'],
+                'generate_latency_ms': options['generate_latency_ms'],
+                'seed': options['seed'],
+            },
+            'ingest': [],
+            'search': [],
+        }
+
+        try:
+            for step in range(options['steps']):
+                ingest = benchmarks.benchmark_ingest(
+                    service, user, options['documents'], options['chunks_per_document'],
+                    seed=options['seed'] + step,
+                )
+                results['ingest'].append(ingest)
+                self.stdout.write(
+                    f"ingest step {step + 1}: {ingest['ingest_chunks_per_sec']} chunks/sec "
+                    f"(embed {ingest['embed_chunks_per_sec']} chunks/sec)"
+                )
+
+                search = benchmarks.benchmark_search(service, user, queries)
+                results['search'].append(search)
+                self.stdout.write(
+                    f"search @ {search['corpus_chunks']} chunks: p50 {search['p50_ms']} ms, "
+                    f"p95 {search['p95_ms']} ms, p99 {search['p99_ms']} ms"
+                )
+
+            if options['asks']:
+                results['ask'] = benchmarks.benchmark_ask(user, queries[:options['asks']])
+                self.stdout.write(
+                    f"ask: p50 {results['ask']['p50_ms']} ms, p95 {results['ask']['p95_ms']} ms"
+                )
+        finally:
+            if not options['keep']:
+                benchmarks.clear_corpus(user)
+
+        return results
@@ -0,0 +1,53 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+
+from qa import retrieval_eval
+
+
+class Command(BaseCommand):
+    help = 'Compare recall@k, QPS, build time and memory of FAISS index variants against exact search'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Evaluate on this user\'s stored chunk embeddings')
+        parser.add_argument('--limit', type=int, help='Maximum stored embeddings to load')
+        parser.add_argument('--synthetic', type=int, help='Use N synthetic vectors instead of stored embeddings')
+        parser.add_argument('--dimension', type=int, default=3072, help='Dimension of synthetic vectors')
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('-k', type=int, default=10)
+        parser.add_argument(
+            '--variant', action='append', dest='variants',
+            help="FAISS factory string with an optional search sweep, e.g. 'HNSW32:efSearch=16|64'. "
+                 "Repeatable; '{nlist}' is replaced by a size-based default.",
+        )
+        parser.add_argument(
+            '--reduced-dimension', type=int, action='append', dest='reduced_dimensions',
+            help='Also measure a first pass over this many leading dimensions re-ranked with full vectors. Repeatable.',
+        )
+        parser.add_argument(
+            '--pool', type=int, action='append', dest='pool_sizes',
+            help='Re-rank pool sizes to sweep for --reduced-dimension (default: 50, 100, 200). Repeatable.',
+        )
+        parser.add_argument('--output', help='Write the report as JSON to this path')
+
+    def handle(self, *args, **options):
+        if options['synthetic']:
+            vectors = retrieval_eval.synthetic_embeddings(options['synthetic'], options['dimension'])
+        else:
+            vectors = retrieval_eval.load_chunk_embeddings(options['user'], options['limit'])
+        if len(vectors) < options['k']:
+            raise CommandError(f"Need at least {options['k']} vectors, found {len(vectors)}.")
+
+        report = retrieval_eval.evaluate(
+            vectors,
+            n_queries=options['queries'],
+            k=options['k'],
+            variants=options['variants'],
+            reduced_dimensions=options['reduced_dimensions'],
+            pool_sizes=options['pool_sizes'],
+        )
+        self.stdout.write(retrieval_eval.format_table(report))
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
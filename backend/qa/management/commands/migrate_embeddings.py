@@ -0,0 +1,52 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from documents.models import DocumentChunk, EmbeddingMigration
+from qa.services.reembedding import OPEN_STATUSES, start_embedding_migration
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-embed users' chunks with a new embedding model in the background. Search keeps using the "
+        "current model until a user's backfill completes, then switches over. Rerun to resume after --pause."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', help="Target embedding model, optionally with a dimension, e.g. 'models/gemini-embedding-001@768'")
+        parser.add_argument('--user', action='append', dest='users', help='User email; repeatable (default: every user with chunks)')
+        parser.add_argument('--pause', action='store_true', help='Pause open migrations to --model')
+        parser.add_argument('--status', action='store_true', help='Show migration progress')
+
+    def handle(self, *args, **options):
+        migrations = EmbeddingMigration.objects.select_related('user')
+        if options['model']:
+            migrations = migrations.filter(target_model=options['model'])
+        if options['users']:
+            migrations = migrations.filter(user__email__in=options['users'])
+
+        if options['status']:
+            for migration in migrations:
+                self.stdout.write(
+                    f"{migration.user.email:<32} {migration.target_model:<40} {migration.status:<10} "
+                    f"{migration.embedded_chunks}/{migration.total_chunks} chunks, {migration.requests_per_minute} rpm"
+                    + (f"  error: {migration.error}" if migration.error else '')
+                )
+            return
+
+        if not options['model']:
+            raise CommandError('--model is required.')
+
+        if options['pause']:
+            paused = migrations.filter(status__in=OPEN_STATUSES).update(status='paused')
+            self.stdout.write(self.style.SUCCESS(f"Paused {paused} migrations"))
+            return
+
+        users = get_user_model().objects.all()
+        if options['users']:
+            users = users.filter(email__in=options['users'])
+        else:
+            users = users.filter(id__in=DocumentChunk.objects.values('user_id'))
+
+        for user in users:
+            migration = start_embedding_migration(user.id, options['model'])
+            self.stdout.write(f"{user.email}: {migration.status} ({migration.total_chunks} chunks)")
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-19 10:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qa', '0002_questionbatch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='stage_timings',
+            field=models.JSONField(blank=True, help_text='Per-stage breakdown of processing time in milliseconds', null=True),
+        ),
+    ]
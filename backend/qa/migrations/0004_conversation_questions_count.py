@@ -0,0 +1,32 @@
+# Generated by Django 6.0.1 on 2026-10-19 11:20
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counts(apps, schema_editor):
+    Conversation = apps.get_model('qa', 'Conversation')
+    Question = apps.get_model('qa', 'Question')
+
+    question_counts = (
+        Question.objects.filter(conversation=OuterRef('pk'))
+        .order_by().values('conversation').annotate(count=Count('id')).values('count')
+    )
+    Conversation.objects.update(questions_count=Coalesce(Subquery(question_counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qa', '0003_question_stage_timings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='questions_count',
+            field=models.IntegerField(default=0, editable=False, help_text='Denormalized number of questions'),
+        ),
+        migrations.RunPython(backfill_counts, migrations.RunPython.noop),
+    ]
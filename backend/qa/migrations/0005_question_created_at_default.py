@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-19 17:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('qa', '0004_conversation_questions_count'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='question',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
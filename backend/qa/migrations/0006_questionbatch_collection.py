@@ -0,0 +1,20 @@
+# Generated by Django 6.0.1 on 2026-10-19 11:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0007_document_deleted_at'),
+        ('qa', '0005_question_created_at_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='questionbatch',
+            name='collection',
+            field=models.ForeignKey(blank=True, help_text='Collection to search instead of all user documents', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='documents.documentcollection'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 6.0.1 on 2026-10-19 11:40
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Indexes are built CONCURRENTLY, which cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('qa', '0006_questionbatch_collection'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddIndexConcurrently(
+            model_name='conversation',
+            index=models.Index(fields=['-updated_at'], name='conversations_updated_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='conversation',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('title'), name='gin_trgm_ops'), name='conversations_title_trgm'),
+        ),
+        AddIndexConcurrently(
+            model_name='question',
+            index=models.Index(fields=['-created_at'], name='questions_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='question',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('question_text'), name='gin_trgm_ops'), name='questions_text_trgm'),
+        ),
+    ]
@@ -2,6 +2,9 @@ from django.db import models
 import uuid
 from django.db import models
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db.models.functions import Upper
+from django.utils import timezone
 
 # Create your models here.
 class Conversation(models.Model):
@@ -9,12 +12,17 @@ class Conversation(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='conversations')
     title = models.CharField(max_length=255)
+    questions_count = models.IntegerField(default=0, editable=False, help_text='Denormalized number of questions')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = 'conversations'
         ordering = ['-updated_at']
+        indexes = [
+            models.Index(fields=['-updated_at'], name='conversations_updated_idx'),
+            GinIndex(OpClass(Upper('title'), name='gin_trgm_ops'), name='conversations_title_trgm'),
+        ]
         
 
     def __str__(self):
@@ -36,7 +44,9 @@ class Question(models.Model):
 
     # Timing
     processing_time_ms = models.IntegerField(null=True, blank=True, help_text='Time taken to generate the answer in milliseconds')
-    created_at = models.DateTimeField(auto_now_add=True)
+    stage_timings = models.JSONField(blank=True, null=True, help_text='Per-stage breakdown of processing time in milliseconds')
+    # Set when the question is answered, not when its row is written behind
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     
     # Feedback
     is_helpful = models.BooleanField(null=True, blank=True, help_text='User feedback on whether the answer was helpful')
@@ -46,7 +56,53 @@ class Question(models.Model):
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['conversation', 'created_at']),
+            # The admin lists all questions newest first and searches their text
+            models.Index(fields=['-created_at'], name='questions_created_idx'),
+            GinIndex(OpClass(Upper('question_text'), name='gin_trgm_ops'), name='questions_text_trgm'),
         ]
         
     def __str__(self):
-        return f"Q: {self.question_text[:50]}..."
\ No newline at end of file
+        return f"Q: {self.question_text[:50]}..."
+
+
+class QuestionBatch(models.Model):
+    """Bulk question-answering job run against one document set."""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='question_batches')
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='batches')
+
+    # Input
+    questions = models.JSONField(help_text='Ordered list of question texts')
+    document_ids = models.JSONField(blank=True, null=True, help_text='Document IDs to search, or null for all user documents')
+    collection = models.ForeignKey(
+        'documents.DocumentCollection', on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+        help_text='Collection to search instead of all user documents',
+    )
+
+    # Progress
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    total_questions = models.IntegerField(default=0)
+    completed_questions = models.IntegerField(default=0)
+    failed_questions = models.IntegerField(default=0)
+    error = models.TextField(blank=True, null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'question_batches'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at']),
+        ]
+
+    def __str__(self):
+        return f"Batch of {self.total_questions} questions ({self.status})"
@@ -0,0 +1,213 @@
+"""Recall vs. latency evaluation of FAISS index configurations.
+
+Ground truth is exact IndexFlatL2 top-k over the full vectors, the same search
+RAGService runs by default; every variant is scored against it, including the
+reduced-dimension first pass with full-vector re-ranking.
+"""
+import time
+from typing import List, Dict
+
+
+DEFAULT_VARIANTS = [
+    'Flat',
+    'HNSW32:efSearch=16|64|256',
+    'IVF{nlist},Flat:nprobe=1|8|32',
+    'IVF{nlist},PQ64:nprobe=8|32',
+    'SQfp16',
+    'SQ8',
+]
+
+
+def load_chunk_embeddings(user_id: str = None, limit: int = None):
+    """Load stored chunk embeddings as a float32 matrix."""
+    import numpy as np
+    from documents.models import DocumentChunk
+
+    chunks = DocumentChunk.objects.filter(embedding__isnull=False)
+    if user_id:
+        chunks = chunks.filter(user_id=user_id)
+    rows = chunks.values_list('embedding', flat=True)
+    if limit:
+        rows = rows[:limit]
+    return np.array(list(rows)).astype('float32')
+
+
+def synthetic_embeddings(n: int, dimension: int, clusters: int = 64, seed: int = 0):
+    """Clustered unit vectors, closer to real embedding distributions than uniform noise."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimension)).astype('float32')
+    assignments = rng.integers(0, clusters, size=n)
+    vectors = centers[assignments] + 0.3 * rng.standard_normal((n, dimension)).astype('float32')
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_queries(vectors, n_queries: int, seed: int = 1):
+    """Perturbed corpus vectors, so queries resemble real questions about the corpus."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(vectors), size=n_queries)
+    queries = vectors[picks] + 0.1 * rng.standard_normal((n_queries, vectors.shape[1])).astype('float32')
+    return (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype('float32')
+
+
+def exact_top_k(vectors, queries, k: int):
+    """Ground-truth neighbours using the current production search."""
+    import faiss
+
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    start = time.perf_counter()
+    _, indices = index.search(queries, k)
+    seconds = time.perf_counter() - start
+    return indices, seconds
+
+
+def recall_at_k(approximate, exact) -> float:
+    hits = sum(len(set(a[a >= 0]) & set(e)) for a, e in zip(approximate, exact))
+    return hits / exact.size
+
+
+def parse_variant(spec: str, n_vectors: int):
+    """Split 'IVF{nlist},Flat:nprobe=1|8' into a factory string and a search-parameter sweep."""
+    factory, _, params = spec.partition(':')
+    nlist = max(1, min(int(4 * n_vectors ** 0.5), n_vectors // 39 or 1))
+    factory = factory.replace('{nlist}', str(nlist))
+
+    sweep = [{}]
+    if params:
+        for param in params.split(','):
+            name, _, values = param.partition('=')
+            sweep = [
+                dict(combo, **{name.strip(): float(value) if '.' in value else int(value)})
+                for combo in sweep
+                for value in values.split('|')
+            ]
+    return factory, sweep
+
+
+def evaluate_variant(spec: str, vectors, queries, ground_truth, k: int) -> List[Dict]:
+    """Build one index configuration and measure it at each search setting."""
+    import faiss
+
+    factory, sweep = parse_variant(spec, len(vectors))
+    try:
+        start = time.perf_counter()
+        index = faiss.index_factory(vectors.shape[1], factory)
+        if not index.is_trained:
+            index.train(vectors)
+        index.add(vectors)
+        build_seconds = time.perf_counter() - start
+        memory_bytes = faiss.serialize_index(index).nbytes
+    except Exception as e:
+        return [{'variant': spec, 'factory': factory, 'error': str(e)}]
+
+    parameter_space = faiss.ParameterSpace()
+    rows = []
+    for params in sweep:
+        for name, value in params.items():
+            parameter_space.set_index_parameter(index, name, value)
+
+        start = time.perf_counter()
+        _, indices = index.search(queries, k)
+        seconds = time.perf_counter() - start
+
+        rows.append({
+            'variant': spec,
+            'factory': factory,
+            'params': params,
+            f'recall@{k}': round(recall_at_k(indices, ground_truth), 4),
+            'qps': round(len(queries) / seconds, 1) if seconds else None,
+            'build_seconds': round(build_seconds, 3),
+            'memory_mb': round(memory_bytes / 1024 / 1024, 2),
+        })
+    return rows
+
+
+def evaluate_reduced(dimension: int, pool_sizes: List[int], vectors, queries, ground_truth, k: int) -> List[Dict]:
+    """Measure a truncated-vector first pass re-ranked with full vectors, as RAGService does it."""
+    import faiss
+    import numpy as np
+    from qa.services.rag_service import reduce_embeddings
+
+    factory = f"Flat@{dimension}+rerank"
+    if dimension >= vectors.shape[1]:
+        return [{'variant': f"Reduced{dimension}", 'factory': factory, 'error': 'dimension is not below the full dimension'}]
+
+    start = time.perf_counter()
+    index = faiss.IndexFlatL2(dimension)
+    index.add(reduce_embeddings(vectors, dimension))
+    build_seconds = time.perf_counter() - start
+    memory_bytes = faiss.serialize_index(index).nbytes
+
+    rows = []
+    for pool in pool_sizes:
+        start = time.perf_counter()
+        _, candidates = index.search(reduce_embeddings(queries, dimension), max(pool, k))
+        indices = np.empty((len(queries), k), dtype='int64')
+        for q, row in enumerate(candidates):
+            row = row[row >= 0]
+            scores = ((vectors[row] - queries[q]) ** 2).sum(axis=1)
+            indices[q] = row[np.argsort(scores)[:k]]
+        seconds = time.perf_counter() - start
+
+        rows.append({
+            'variant': f"Reduced{dimension}",
+            'factory': factory,
+            'params': {'pool': pool},
+            f'recall@{k}': round(recall_at_k(indices, ground_truth), 4),
+            'qps': round(len(queries) / seconds, 1) if seconds else None,
+            'build_seconds': round(build_seconds, 3),
+            'memory_mb': round(memory_bytes / 1024 / 1024, 2),
+        })
+    return rows
+
+
+def evaluate(vectors, n_queries: int = 200, k: int = 10, variants: List[str] = None,
+             reduced_dimensions: List[int] = None, pool_sizes: List[int] = None) -> Dict:
+    """Sweep index variants against exact search on one set of vectors."""
+    queries = make_queries(vectors, n_queries)
+    ground_truth, exact_seconds = exact_top_k(vectors, queries, k)
+
+    rows = []
+    for spec in variants or DEFAULT_VARIANTS:
+        rows.extend(evaluate_variant(spec, vectors, queries, ground_truth, k))
+    for dimension in reduced_dimensions or []:
+        rows.extend(evaluate_reduced(dimension, pool_sizes or [50, 100, 200], vectors, queries, ground_truth, k))
+
+    return {
+        'vectors': len(vectors),
+        'dimension': int(vectors.shape[1]),
+        'queries': n_queries,
+        'k': k,
+        'exact_qps': round(n_queries / exact_seconds, 1) if exact_seconds else None,
+        'results': rows,
+    }
+
+
+def _or_dash(value) -> str:
+    # qps is None when a search ran too fast for the timer to measure
+    return '-' if value is None else str(value)
+
+
+def format_table(report: Dict) -> str:
+    recall_key = f"recall@{report['k']}"
+    header = f"{'variant':<28} {'params':<18} {recall_key:>10} {'qps':>10} {'build s':>9} {'mem MB':>9}"
+    lines = [
+        f"{report['vectors']} vectors x {report['dimension']} dims, {report['queries']} queries, "
+        f"exact search {_or_dash(report['exact_qps'])} qps",
+        header,
+        '-' * len(header),
+    ]
+    for row in report['results']:
+        if 'error' in row:
+            lines.append(f"{row['factory']:<28} error: {row['error']}")
+            continue
+        params = ','.join(f"{name}={value}" for name, value in row['params'].items()) or '-'
+        lines.append(
+            f"{row['factory']:<28} {params:<18} {row[recall_key]:>10.4f} {_or_dash(row['qps']):>10} "
+            f"{row['build_seconds']:>9} {row['memory_mb']:>9}"
+        )
+    return '\n'.join(lines)
@@ -1,12 +1,13 @@
 from rest_framework import serializers
-from .models import Conversation, Question
+from django.conf import settings
+from .models import Conversation, Question, QuestionBatch
 
 class QuestionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Question
         fields = (
             'id', 'question_text', 'answer_text', 'source_documents',
-            'processing_time_ms', 'created_at', 'is_helpful'
+            'processing_time_ms', 'stage_timings', 'created_at', 'is_helpful'
         )
         read_only_fields = ('id', 'created_at')
         
@@ -18,14 +19,46 @@ class AskQuestionSerializer(serializers.Serializer):
         allow_empty=True,
     )
     conversation_id = serializers.UUIDField(required=False, allow_null=True)
+    collection_id = serializers.UUIDField(required=False, allow_null=True)
 
-class ConversationSerializer(serializers.ModelSerializer):
-    questions_count = serializers.SerializerMethodField()
+class AskBatchSerializer(serializers.Serializer):
+    questions = serializers.ListField(
+        child=serializers.CharField(max_length=1000),
+        allow_empty=False,
+    )
+    document_ids = serializers.ListField(
+        child=serializers.UUIDField(),
+        required=False,
+        allow_empty=True,
+    )
+    collection_id = serializers.UUIDField(required=False, allow_null=True)
+    title = serializers.CharField(max_length=255, required=False)
+    
+    def validate_questions(self, value):
+        if len(value) > settings.RAG_BATCH_MAX_QUESTIONS:
+            raise serializers.ValidationError(
+                f"A batch can contain at most {settings.RAG_BATCH_MAX_QUESTIONS} questions."
+            )
+        return value
+
+class QuestionBatchSerializer(serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField()
     
+    class Meta:
+        model = QuestionBatch
+        fields = (
+            'id', 'conversation', 'status', 'total_questions', 'completed_questions',
+            'failed_questions', 'progress', 'error', 'created_at', 'completed_at'
+        )
+        read_only_fields = fields
+        
+    def get_progress(self, obj):
+        if not obj.total_questions:
+            return 0.0
+        return round(obj.completed_questions / obj.total_questions, 4)
+
+class ConversationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Conversation
         fields = ('id', 'title', 'questions_count', 'created_at', 'updated_at')
-        read_only_fields = ('id', 'created_at', 'updated_at')
-        
-    def get_questions_count(self, obj):
-        return obj.questions.count()
\ No newline at end of file
+        read_only_fields = ('id', 'questions_count', 'created_at', 'updated_at')
\ No newline at end of file
@@ -0,0 +1,65 @@
+"""Per-conversation pools of retrieval candidates.
+
+Follow-up questions mostly land on the passages the previous turns
+retrieved. Each full search made for a conversation stores its best
+RAG_CANDIDATE_POOL_SIZE chunk ids with their vectors; the pools of the
+last RAG_CANDIDATE_TURNS turns are kept together for
+RAG_CANDIDATE_CACHE_TTL seconds after the conversation's last question.
+A follow-up is scored against these few dozen vectors first and only goes
+to the full index when its best similarity is below
+RAG_CANDIDATE_MIN_SIMILARITY.
+
+A pool is tied to the scope it was searched in: the index version (which
+changes whenever documents are added, re-embedded or deleted), the
+embedding model, and the document or collection filter. A pool from
+another scope is ignored, so it never returns a deleted document's chunks.
+Vectors are kept as float16 to keep the cache entry small.
+"""
+from typing import List, Optional, Tuple
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+
+def _key(conversation_id) -> str:
+    return f"conversation_candidates:{conversation_id}"
+
+
+def candidate_scope(version: int, model: str, document_ids: List[str] = None, collection_id: str = None) -> tuple:
+    return (
+        str(collection_id) if collection_id else None,
+        version,
+        model,
+        tuple(sorted(str(doc_id) for doc_id in document_ids or ())),
+    )
+
+
+def get_candidate_pool(conversation_id, scope: tuple) -> Optional[Tuple[list, np.ndarray]]:
+    """Chunk ids and float32 vectors of the conversation's recent candidates, newest first, or None."""
+    cached = cache.get(_key(conversation_id))
+    if not cached or cached['scope'] != scope:
+        return None
+    chunk_ids, rows, seen = [], [], set()
+    for turn_ids, turn_vectors in cached['turns']:
+        for chunk_id, vector in zip(turn_ids, turn_vectors):
+            if chunk_id not in seen:
+                seen.add(chunk_id)
+                chunk_ids.append(chunk_id)
+                rows.append(vector)
+    if not rows:
+        return None
+    return chunk_ids, np.array(rows, dtype='float32')
+
+
+def store_candidates(conversation_id, scope: tuple, chunk_ids: list, vectors):
+    """Add a full search's best candidates as the conversation's newest turn."""
+    key = _key(conversation_id)
+    cached = cache.get(key)
+    turns = cached['turns'] if cached and cached['scope'] == scope else []
+    turns = [(list(chunk_ids), np.asarray(vectors, dtype='float16'))] + turns[:settings.RAG_CANDIDATE_TURNS - 1]
+    cache.set(key, {'scope': scope, 'turns': turns}, settings.RAG_CANDIDATE_CACHE_TTL)
+
+
+def touch_candidates(conversation_id):
+    """Keep the pool of a conversation that is still being asked."""
+    cache.touch(_key(conversation_id), settings.RAG_CANDIDATE_CACHE_TTL)
@@ -0,0 +1,190 @@
+"""Per-collection index shards.
+
+A question scoped to a collection is searched against a shard holding only
+that collection's vectors, so its cost follows the collection's size rather
+than the owner's whole library.
+
+Shards are updated incrementally. Every change to a collection's membership
+or embeddings is recorded in the cache as a numbered event (add or remove a
+document, or reset the whole collection) and bumps the collection's version.
+A process holding an older shard replays the events it missed: a removal
+drops the document's rows from the faiss index, an add loads just that
+document's vectors. The shard is rebuilt from the database only when events
+have expired, on a reset, when the owner's embedding model changed, or when
+removals have left more than half of its slots empty.
+
+Updates are applied to a copy of the shard, so concurrent searches keep
+using the old one until the new one is swapped in.
+"""
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Tuple
+import faiss
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from core.db_router import pin_to_primary
+from core.metrics import record_cache_lookup
+from .index_cache import IndexEntry
+
+
+ADD = 'add'
+REMOVE = 'remove'
+RESET = 'reset'
+
+
+def _version_key(collection_id) -> str:
+    return f"rag_collection_version:{collection_id}"
+
+
+def _change_key(collection_id, version: int) -> str:
+    return f"rag_collection_change:{collection_id}:{version}"
+
+
+def get_collection_version(collection_id) -> int:
+    """Current version of a collection's shard, shared across processes."""
+    version = cache.get(_version_key(collection_id))
+    if version is None:
+        cache.add(_version_key(collection_id), 1, None)
+        version = cache.get(_version_key(collection_id), 1)
+    return version
+
+
+def record_collection_change(collection_id, user_id, op: str, document_id=None):
+    """Record that a document joined (ADD) or left (REMOVE) a collection, or that it changed wholesale (RESET)."""
+    if not collection_id:
+        return
+    # The shard update must not read from a replica that hasn't seen the change yet
+    pin_to_primary(user_id)
+    try:
+        version = cache.incr(_version_key(collection_id))
+    except ValueError:
+        # Nothing was recorded before, so no process can hold a shard to update
+        cache.set(_version_key(collection_id), 2, None)
+        return
+    cache.set(_change_key(collection_id, version), (op, str(document_id) if document_id else None),
+              settings.RAG_COLLECTION_CHANGE_TTL)
+
+
+def collection_changes(collection_id, since: int, until: int):
+    """The changes between two versions in order, or None if any of them has expired."""
+    keys = [_change_key(collection_id, version) for version in range(since + 1, until + 1)]
+    found = cache.get_many(keys)
+    if len(found) != len(keys):
+        return None
+    return [found[key] for key in keys]
+
+
+class CollectionShard(IndexEntry):
+    """An IndexEntry whose rows can be removed and appended document by document.
+
+    The faiss ids are slot numbers into chunk_ids/document_ids; removed slots
+    keep a None chunk id until the shard is compacted by a rebuild.
+    """
+
+    def __init__(self, version: int, dimension: int, model: str = None, reduced_dimension: int = None):
+        super().__init__(
+            version=version,
+            chunk_ids=[],
+            document_ids=np.array([], dtype=object),
+            index=faiss.IndexIDMap2(faiss.IndexFlatL2(dimension)),
+            model=model,
+            reduced_dimension=reduced_dimension,
+        )
+        self.slots = {}  # document id -> its slot numbers
+        self.removed = 0
+
+    def __len__(self):
+        return self.index.ntotal
+
+    @property
+    def fragmented(self) -> bool:
+        return self.removed > len(self.chunk_ids) // 2
+
+    def add_rows(self, rows: List[Tuple]):
+        """Append (chunk id, document id, vector) rows."""
+        if not rows:
+            return
+        start = len(self.chunk_ids)
+        slots = np.arange(start, start + len(rows), dtype='int64')
+        self.index.add_with_ids(np.array([row[2] for row in rows]).astype('float32'), slots)
+        self.chunk_ids.extend(row[0] for row in rows)
+        self.document_ids = np.concatenate([self.document_ids, np.array([str(row[1]) for row in rows], dtype=object)])
+        for slot, row in zip(slots.tolist(), rows):
+            self.slots.setdefault(str(row[1]), []).append(slot)
+
+    def remove_document(self, document_id):
+        slots = self.slots.pop(str(document_id), None)
+        if not slots:
+            return
+        self.index.remove_ids(np.array(slots, dtype='int64'))
+        for slot in slots:
+            self.chunk_ids[slot] = None
+            self.document_ids[slot] = None
+        self.removed += len(slots)
+
+    def copy(self, version: int) -> "CollectionShard":
+        shard = CollectionShard.__new__(CollectionShard)
+        shard.__dict__.update(self.__dict__)
+        shard.version = version
+        shard.index = faiss.clone_index(self.index)
+        shard.chunk_ids = list(self.chunk_ids)
+        shard.document_ids = self.document_ids.copy()
+        shard.slots = {document_id: list(slots) for document_id, slots in self.slots.items()}
+        return shard
+
+
+class CollectionShardCache:
+    """Per-process LRU cache of collection shards, brought up to date by replaying changes."""
+
+    def __init__(self, max_entries: int = None):
+        self.max_entries = max_entries or settings.RAG_COLLECTION_SHARD_CACHE_SIZE
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, collection_id, model: str, reduced_dimension: int,
+            build: Callable[[int], CollectionShard],
+            load_document: Callable[[str], List[Tuple]]) -> CollectionShard:
+        """Return the collection's shard for model, updating it with load_document or rebuilding it with build."""
+        key = str(collection_id)
+        version = get_collection_version(key)
+
+        with self._lock:
+            shard = self._entries.get(key)
+            if shard is not None:
+                self._entries.move_to_end(key)
+        if shard is not None and (shard.model, shard.reduced_dimension) != (model, reduced_dimension):
+            shard = None
+
+        if shard is not None and shard.version == version:
+            record_cache_lookup('collection_shard', hit=True)
+            return shard
+
+        updated = None
+        if shard is not None and shard.version < version:
+            changes = collection_changes(key, shard.version, version)
+            if changes is not None and all(op != RESET for op, _ in changes):
+                updated = shard.copy(version)
+                for op, document_id in changes:
+                    updated.remove_document(document_id)
+                    if op == ADD:
+                        updated.add_rows(load_document(document_id))
+                if updated.fragmented:
+                    updated = None
+
+        record_cache_lookup('collection_shard', hit=updated is not None)
+        shard = updated or build(version)
+        with self._lock:
+            current = self._entries.get(key)
+            # Another thread may have stored a newer shard meanwhile
+            if current is None or current.version <= shard.version:
+                self._entries[key] = shard
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return shard
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
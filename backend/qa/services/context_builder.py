@@ -0,0 +1,160 @@
+from typing import List, Dict, Tuple
+from django.conf import settings
+from django.core.cache import cache
+
+from core.metrics import record_cache_lookup
+from qa.models import Question
+from qa.write_behind import pending_turns
+
+
+# Rough heuristic for Gemini tokenizers: ~4 characters per token for English text.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens in a piece of text."""
+    if not text:
+        return 0
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text down so it fits in roughly max_tokens tokens."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    return text[:max(max_chars - 3, 0)].rstrip() + '...'
+
+
+def _summarize_turn(question_text: str, answer_text: str) -> str:
+    """Condense one question/answer turn into a single line."""
+    answer = (answer_text or '').strip()
+    first_sentence = answer.split('. ')[0]
+    return f"- Q: {question_text.strip()[:200]} A: {first_sentence[:300]}"
+
+
+def _summary_cache_key(conversation_id) -> str:
+    return f"conversation_summary:{conversation_id}"
+
+
+def load_conversation_history(conversation) -> List[Dict]:
+    """Load prior turns of a conversation as a summary plus recent verbatim turns.
+
+    Turns already folded into the cached running summary are not read again, so
+    each call runs a single query on the (conversation, created_at) index. Turns
+    not yet flushed by the write-behind are merged in from the cache.
+    """
+    recent_turns = settings.RAG_HISTORY_RECENT_TURNS
+    cache_key = _summary_cache_key(conversation.id)
+    cached = cache.get(cache_key) or {}
+    record_cache_lookup('conversation_summary', hit=bool(cached))
+
+    turns_query = Question.objects.filter(conversation=conversation)
+    if cached.get('through'):
+        turns_query = turns_query.filter(created_at__gt=cached['through'])
+    turns = list(
+        turns_query.order_by('created_at').values('id', 'question_text', 'answer_text', 'created_at')
+    )
+    # Turns still waiting in the write-behind stream
+    stored = {turn['id'] for turn in turns}
+    pending = [
+        turn for turn in pending_turns(conversation.id)
+        if turn['id'] not in stored and (not cached.get('through') or turn['created_at'] > cached['through'])
+    ]
+    if pending:
+        turns = sorted(turns + pending, key=lambda turn: turn['created_at'])
+
+    summary = cached.get('summary', '')
+    if recent_turns > 0:
+        older, recent = turns[:-recent_turns], turns[-recent_turns:]
+    else:
+        older, recent = turns, []
+
+    if older:
+        lines = [summary] if summary else []
+        lines.extend(_summarize_turn(t['question_text'], t['answer_text']) for t in older)
+        summary = '\n'.join(lines)
+        # Keep the running summary bounded; the newest lines are the most relevant.
+        max_chars = settings.RAG_HISTORY_TOKEN_BUDGET * CHARS_PER_TOKEN // 2
+        if len(summary) > max_chars:
+            summary = summary[-max_chars:].split('\n', 1)[-1]
+        cache.set(
+            cache_key,
+            {'summary': summary, 'through': older[-1]['created_at']},
+            settings.RAG_HISTORY_SUMMARY_TTL,
+        )
+
+    history = []
+    if summary:
+        history.append({'summary': summary})
+    history.extend({'question': t['question_text'], 'answer': t['answer_text']} for t in recent)
+    return history
+
+
+class ContextBuilder:
+    """Assemble a token-budgeted prompt context from retrieved chunks and conversation history."""
+
+    def __init__(self, token_budget: int = None, history_budget: int = None):
+        self.token_budget = token_budget or settings.RAG_CONTEXT_TOKEN_BUDGET
+        self.history_budget = history_budget or settings.RAG_HISTORY_TOKEN_BUDGET
+
+    def pack_chunks(self, context_chunks: List[Tuple]) -> Tuple[List[Tuple], str, int]:
+        """Pack the highest-scoring chunks into the context token budget."""
+        packed = []
+        parts = []
+        used = 0
+
+        for chunk, score in sorted(context_chunks, key=lambda item: item[1], reverse=True):
+            header = f"[Source {len(packed) + 1} - {chunk.document.title}, Page {chunk.page_number}]:\n"
+            remaining = self.token_budget - used - estimate_tokens(header)
+            if remaining <= 0:
+                break
+
+            text = chunk.text
+            if estimate_tokens(text) > remaining:
+                # Only the best chunk is worth truncating; skip others that don't fit.
+                if packed:
+                    continue
+                text = truncate_to_tokens(text, remaining)
+
+            part = header + text
+            parts.append(part)
+            packed.append((chunk, score))
+            used += estimate_tokens(part)
+
+        return packed, "\n\n".join(parts), used
+
+    def format_history(self, conversation_history: List[Dict] = None) -> Tuple[str, int]:
+        """Render conversation history newest-first into the history token budget."""
+        if not conversation_history:
+            return '', 0
+
+        summary = ''
+        turns = []
+        for entry in conversation_history:
+            if 'summary' in entry:
+                summary = entry['summary']
+            else:
+                turns.append(f"User: {entry['question']}\nAssistant: {entry['answer']}")
+
+        budget = self.history_budget
+        kept = []
+        for turn in reversed(turns):
+            tokens = estimate_tokens(turn)
+            if tokens > budget:
+                if not kept:
+                    kept.append(truncate_to_tokens(turn, budget))
+                    budget = 0
+                break
+            kept.append(turn)
+            budget -= tokens
+        kept.reverse()
+
+        sections = []
+        if summary and budget > 0:
+            sections.append(f"Earlier in this conversation:\n{truncate_to_tokens(summary, budget)}")
+        if kept:
+            sections.append("Recent turns:\n" + "\n\n".join(kept))
+
+        history_text = "\n\n".join(sections)
+        return history_text, estimate_tokens(history_text)
@@ -0,0 +1,82 @@
+import threading
+from collections import OrderedDict
+from typing import Callable
+from django.conf import settings
+from django.core.cache import cache
+
+from core.db_router import pin_to_primary
+from core.metrics import record_cache_lookup
+
+
+def _version_key(user_id) -> str:
+    return f"rag_index_version:{user_id}"
+
+
+def get_index_version(user_id) -> int:
+    """Current version of a user's vector index, shared across processes."""
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        cache.add(_version_key(user_id), 1, None)
+        version = cache.get(_version_key(user_id), 1)
+    return version
+
+
+def bump_index_version(user_id):
+    """Invalidate every process' cached index for a user."""
+    # The rebuilt index must not be loaded from a replica that hasn't seen the change yet
+    pin_to_primary(user_id)
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError:
+        cache.set(_version_key(user_id), 2, None)
+
+
+class IndexEntry:
+    """A loaded vector index plus the chunk/document IDs of its rows and the model that embedded them."""
+
+    def __init__(self, version: int, chunk_ids: list, document_ids, index, model: str = None, reduced_dimension: int = None):
+        self.version = version
+        self.model = model
+        # Set when the index holds truncated vectors and hits must be re-ranked with full ones
+        self.reduced_dimension = reduced_dimension
+        self.chunk_ids = chunk_ids
+        self.document_ids = document_ids
+        self.index = index
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+
+class IndexCache:
+    """Per-process LRU cache of users' vector indexes, invalidated by version."""
+
+    def __init__(self, max_entries: int = None):
+        self.max_entries = max_entries or settings.RAG_INDEX_CACHE_SIZE
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, loader: Callable[[int], IndexEntry]) -> IndexEntry:
+        """Return the user's index, rebuilding it with loader when stale."""
+        key = str(user_id)
+        version = get_index_version(key)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(key)
+                record_cache_lookup('index', hit=True)
+                return entry
+
+        record_cache_lookup('index', hit=False)
+        entry = loader(version)
+
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
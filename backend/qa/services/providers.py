@@ -0,0 +1,134 @@
+import hashlib
+import time
+from typing import List, Dict, Optional, Tuple
+from django.conf import settings
+
+from .context_builder import estimate_tokens
+
+
+def split_model_tag(tag: str) -> Tuple[str, Optional[int]]:
+    """Split an embedding model tag like 'models/gemini-embedding-001@768' into name and dimension."""
+    name, _, dimension = tag.partition('@')
+    return name, int(dimension) if dimension else None
+
+
+class LLMProvider:
+    """Embedding and text generation backend used by RAGService."""
+
+    name = None
+    model_name = None
+    embedding_model = None
+
+    def embed(self, texts: List[str], task_type: str = "retrieval_document", model: str = None) -> List[List[float]]:
+        """Embed a batch of texts (at most RAG_EMBED_BATCH_SIZE) with model, or the default embedding model."""
+        raise NotImplementedError
+
+    def generate(self, prompt: str, temperature: float) -> Dict:
+        """Generate a completion; returns text, prompt_tokens and completion_tokens."""
+        raise NotImplementedError
+
+    def warm_up(self):
+        """Open connections ahead of the first request."""
+
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini via google-generativeai."""
+
+    name = 'gemini'
+
+    def __init__(self):
+        import google.generativeai as genai
+
+        self.genai = genai
+        # Configure Gemini once; the client keeps its gRPC channel open for reuse
+        genai.configure(api_key=settings.GOOGLE_API_KEY, transport='grpc')
+        self.model_name = settings.GEMINI_MODEL_NAME
+        self.llm_model = genai.GenerativeModel(settings.GEMINI_MODEL_NAME)
+        self.embedding_model = settings.GEMINI_EMBEDDING_MODEL
+
+    def embed(self, texts: List[str], task_type: str = "retrieval_document", model: str = None) -> List[List[float]]:
+        name, dimension = split_model_tag(model or self.embedding_model)
+        options = {'output_dimensionality': dimension} if dimension else {}
+        result = self.genai.embed_content(
+            model=name,
+            content=texts,
+            task_type=task_type,
+            **options,
+        )
+        return result['embedding']
+
+    def generate(self, prompt: str, temperature: float) -> Dict:
+        response = self.llm_model.generate_content(
+            prompt,
+            generation_config=self.genai.types.GenerationConfig(
+                temperature=temperature,
+            )
+        )
+        # Prefer the token counts reported by Gemini, fall back to our estimate
+        usage = getattr(response, 'usage_metadata', None)
+        return {
+            'text': response.text,
+            'prompt_tokens': getattr(usage, 'prompt_token_count', None) or estimate_tokens(prompt),
+            'completion_tokens': getattr(usage, 'candidates_token_count', None),
+        }
+
+    def warm_up(self):
+        self.genai.get_model(self.model_name)
+
+
+class FakeProvider(LLMProvider):
+    """Deterministic offline stand-in for benchmarks and tests.
+
+    Embeddings are unit vectors seeded from a hash of the text, so the same
+    text always embeds identically; generation returns a canned answer. Both
+    can simulate API latency.
+    """
+
+    name = 'fake'
+    model_name = 'fake-llm'
+    embedding_model = 'fake-embedding'
+
+    def __init__(self, dimension: int = None, embed_latency_ms: float = None, generate_latency_ms: float = None):
+        self.dimension = dimension or settings.RAG_EMBEDDING_DIMENSION
+        self.embed_latency_ms = settings.FAKE_LLM_EMBED_LATENCY_MS if embed_latency_ms is None else embed_latency_ms
+        self.generate_latency_ms = settings.FAKE_LLM_GENERATE_LATENCY_MS if generate_latency_ms is None else generate_latency_ms
+
+    def embed_one(self, text: str, model: str = None) -> List[float]:
+        import numpy as np
+
+        # Other models get their own vectors for the same text
+        key = text if not model or model == self.embedding_model else f"{model}\0{text}"
+        dimension = (split_model_tag(model)[1] if model else None) or self.dimension
+        seed = int.from_bytes(hashlib.sha256(key.encode('utf-8')).digest()[:8], 'little')
+        vector = np.random.default_rng(seed).standard_normal(dimension).astype('float32')
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed(self, texts: List[str], task_type: str = "retrieval_document", model: str = None) -> List[List[float]]:
+        if self.embed_latency_ms:
+            time.sleep(self.embed_latency_ms / 1000)
+        return [self.embed_one(text, model) for text in texts]
+
+    def generate(self, prompt: str, temperature: float) -> Dict:
+        if self.generate_latency_ms:
+            time.sleep(self.generate_latency_ms / 1000)
+        text = "Based on [Source 1], this is a canned answer from the fake provider."
+        return {
+            'text': text,
+            'prompt_tokens': estimate_tokens(prompt),
+            'completion_tokens': estimate_tokens(text),
+        }
+
+
+PROVIDERS = {
+    GeminiProvider.name: GeminiProvider,
+    FakeProvider.name: FakeProvider,
+}
+
+
+def get_provider(name: str = None) -> LLMProvider:
+    """Instantiate the provider configured by RAG_PROVIDER."""
+    name = name or settings.RAG_PROVIDER
+    try:
+        return PROVIDERS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown RAG provider: {name}")
@@ -1,32 +1,75 @@
-import google.generativeai as genai
 from typing import List, Dict, Tuple
 import numpy as np
 from django.conf import settings
 import faiss
-from documents.models import DocumentChunk
+import os
+import threading
+from documents.models import ChunkEmbedding, Document, DocumentChunk
+from core.db_router import replica_reads
+from core.metrics import record_cache_lookup, stage, CHUNKS_SCANNED, TOKENS
+from .candidate_cache import candidate_scope, get_candidate_pool, store_candidates, touch_candidates
+from .context_builder import ContextBuilder
+from .collection_index import ADD, CollectionShard, CollectionShardCache, get_collection_version, record_collection_change
+from .index_cache import IndexCache, IndexEntry, bump_index_version, get_index_version
+from .providers import LLMProvider, get_provider, split_model_tag
+from .reembedding import embed_chunks_for_model, get_active_embedding_model, get_user_embedding_models
 
 
+_service = None
+_service_pid = None
+_service_lock = threading.Lock()
+
+
+def get_rag_service() -> "RAGService":
+    """Return the process-wide RAGService, creating it on first use.
+    
+    The instance (and the gRPC channel behind the Gemini client) is rebuilt
+    after a fork, since channels cannot be shared between processes.
+    """
+    global _service, _service_pid
+    pid = os.getpid()
+    if _service is None or _service_pid != pid:
+        with _service_lock:
+            if _service is None or _service_pid != pid:
+                _service = RAGService()
+                _service_pid = pid
+    return _service
+
+
+def reduce_embeddings(vectors, dimension: int):
+    """Keep the leading dimensions of each vector and re-normalize (Matryoshka truncation)."""
+    reduced = np.ascontiguousarray(np.asarray(vectors, dtype='float32')[:, :dimension])
+    return reduced / np.maximum(np.linalg.norm(reduced, axis=1, keepdims=True), 1e-12)
+
+
+def reset_rag_service():
+    """Drop the process-wide RAGService so the next call rebuilds it from settings."""
+    global _service, _service_pid
+    with _service_lock:
+        _service = None
+        _service_pid = None
+
 
 class RAGService:
-    """RAG service using Google Gemini"""
+    """RAG service over a pluggable embedding/LLM provider (Google Gemini by default)"""
     
-    def __init__(self):
-        # Configure Gemini
-        genai.configure(api_key=settings.GOOGLE_API_KEY)
-        
-        self.llm_model = genai.GenerativeModel(settings.GEMINI_MODEL_NAME)
-        self.embedding_model = settings.GEMINI_EMBEDDING_MODEL
-        self.embedding_dimension = 3072  # gemini-embedding-001 uses 3072 dimensions
+    def __init__(self, provider: LLMProvider = None):
+        self.provider = provider or get_provider()
+        # Only used to size an empty index; loaded indexes take the dimension of their vectors
+        self.embedding_dimension = settings.RAG_EMBEDDING_DIMENSION
+        self.index_cache = IndexCache()
+        self.collection_cache = CollectionShardCache()
+    
+    def warm_up(self, preload_user_ids: List[str] = None):
+        """Open provider connections and optionally load users' indexes ahead of traffic."""
+        self.provider.warm_up()
+        for user_id in preload_user_ids or []:
+            self._get_user_index(str(user_id))
         
     def generate_embedding(self, text: str) -> List[float]:
         """Generate embedding for a given text."""
         try:
-            result = genai.embed_content(
-                model=self.embedding_model,
-                content=text, 
-                task_type = "retrieval_document",
-                )
-            return result['embedding']
+            return self.provider.embed([text])[0]
         except Exception as e:
             raise Exception(f"Error generating embedding: {str(e)}")
         
@@ -34,6 +77,7 @@ class RAGService:
         """Generate Embeddings for all chunks of a document"""
         chunks = DocumentChunk.objects.filter(
             document_id=document_id,
+            document__deleted_at__isnull=True,
             embedding__isnull=True,
         )
         
@@ -41,69 +85,321 @@ class RAGService:
             return 0
         
         total_embedded = 0
+        model = self.provider.embedding_model
         
         for chunk in chunks:
             try:
-                embedding = self.generate_embedding(chunk.text)
+                with stage('embed_chunk'):
+                    embedding = self.generate_embedding(chunk.text)
                 chunk.embedding = embedding
-                chunk.save(update_fields=['embedding'])
+                chunk.embedding_model = model
+                if settings.RAG_REDUCED_DIMENSION:
+                    chunk.embedding_reduced = reduce_embeddings([embedding], settings.RAG_REDUCED_DIMENSION)[0].tolist()
+                with stage('db_write'):
+                    chunk.save(update_fields=['embedding', 'embedding_model', 'embedding_reduced'])
                 total_embedded += 1
             except Exception as e:
                 print(f"Error embedding chunk {chunk.id}: {str(e)}")
                 continue
+        
+        if total_embedded:
+            user_id, collection_id = Document.objects.filter(id=document_id).values_list('user_id', 'collection_id').first()
+            # Users on (or migrating to) another model need its vectors too
+            for other_model in get_user_embedding_models(user_id, model) - {model}:
+                with stage('embed_chunk'):
+                    embed_chunks_for_model(self, DocumentChunk.objects.filter(document_id=document_id), other_model)
+            bump_index_version(user_id)
+            record_collection_change(collection_id, user_id, ADD, document_id)
         return total_embedded
     
-    def search_similar_chunks(self, query: str, user_id: str, document_ids: List[str] = None, top_k: int = 5) -> List[Tuple[DocumentChunk, float]]:
-        """Search for similar chunks using vector similarity."""
-        query_embedding = np.array(self.generate_embedding(query)).astype('float32')
+    def generate_embeddings(self, texts: List[str], task_type: str = "retrieval_document", model: str = None) -> List[List[float]]:
+        """Generate embeddings for many texts with batched API calls."""
+        embeddings = []
+        batch_size = settings.RAG_EMBED_BATCH_SIZE
+        try:
+            for start in range(0, len(texts), batch_size):
+                embeddings.extend(self.provider.embed(texts[start:start + batch_size], task_type=task_type, model=model))
+            return embeddings
+        except Exception as e:
+            raise Exception(f"Error generating embeddings: {str(e)}")
+    
+    def _index_rows(self, user_id: str, model: str, **chunk_filters) -> Tuple[List[Tuple], int]:
+        """(chunk id, document id, vector) of the user's searchable chunks for model, and the reduced dimension if any."""
+        # Chunks of deleted documents stay in the table until they are purged
+        deleted = Document.all_objects.filter(user_id=user_id, deleted_at__isnull=False).values('id')
+        if model != self.provider.embedding_model:
+            rows = list(ChunkEmbedding.objects.filter(
+                chunk__user_id=user_id,
+                model=model,
+                **{f'chunk__{lookup}': value for lookup, value in chunk_filters.items()},
+            ).exclude(chunk__document_id__in=deleted).values_list('chunk_id', 'chunk__document_id', 'embedding'))
+            return rows, None
+        
+        chunks = DocumentChunk.objects.filter(
+            user_id=user_id,
+            embedding__isnull=False,
+            embedding_model=model,
+            **chunk_filters,
+        ).exclude(document_id__in=deleted)
+        reduced_dimension = settings.RAG_REDUCED_DIMENSION or None
+        if reduced_dimension:
+            return self._load_reduced_vectors(chunks, reduced_dimension), reduced_dimension
+        return list(chunks.values_list('id', 'document_id', 'embedding')), None
+    
+    def _get_user_index(self, user_id: str) -> IndexEntry:
+        """Get the user's cached FAISS index, rebuilding it if embeddings changed."""
+        def load(version):
+            model = get_active_embedding_model(user_id, self.provider.embedding_model)
+            rows, reduced_dimension = self._index_rows(user_id, model)
+            
+            if rows:
+                vectors = np.array([row[2] for row in rows]).astype('float32')
+                index = faiss.IndexFlatL2(vectors.shape[1])
+                index.add(vectors)
+            else:
+                index = faiss.IndexFlatL2(reduced_dimension or split_model_tag(model)[1] or self.embedding_dimension)
+            return IndexEntry(
+                version=version,
+                chunk_ids=[row[0] for row in rows],
+                document_ids=np.array([str(row[1]) for row in rows]),
+                index=index,
+                model=model,
+                reduced_dimension=reduced_dimension,
+            )
+        
+        return self.index_cache.get(user_id, load)
+    
+    def _get_collection_index(self, collection_id: str, user_id: str) -> CollectionShard:
+        """Get the shard of one of the user's collections, updating it with the documents that joined or left."""
+        model = get_active_embedding_model(user_id, self.provider.embedding_model)
+        reduced_dimension = (settings.RAG_REDUCED_DIMENSION or None) if model == self.provider.embedding_model else None
+        
+        def build(version):
+            rows, _ = self._index_rows(user_id, model, document__collection_id=collection_id)
+            shard = CollectionShard(
+                version,
+                dimension=reduced_dimension or split_model_tag(model)[1] or self.embedding_dimension,
+                model=model,
+                reduced_dimension=reduced_dimension,
+            )
+            shard.add_rows(rows)
+            return shard
+        
+        def load_document(document_id):
+            # The document may have left the collection again after this change was recorded
+            return self._index_rows(user_id, model, document_id=document_id, document__collection_id=collection_id)[0]
+        
+        return self.collection_cache.get(collection_id, model, reduced_dimension, build, load_document)
+    
+    def _load_reduced_vectors(self, chunks, dimension: int) -> List[Tuple]:
+        """Load first-pass vectors, filling in (and storing) any missing or of another dimension."""
+        rows = list(chunks.values_list('id', 'document_id', 'embedding_reduced'))
+        stale = [row[0] for row in rows if row[2] is None or len(row[2]) != dimension]
+        
+        filled = {}
+        for start in range(0, len(stale), 1000):
+            full = list(DocumentChunk.objects.filter(id__in=stale[start:start + 1000]).values_list('id', 'embedding'))
+            if not full:
+                continue
+            ids, vectors = zip(*full)
+            reduced = reduce_embeddings(np.array(vectors), dimension)
+            filled.update(zip(ids, reduced))
+            DocumentChunk.objects.bulk_update(
+                [DocumentChunk(id=chunk_id, embedding_reduced=vector.tolist()) for chunk_id, vector in zip(ids, reduced)],
+                ['embedding_reduced'],
+                batch_size=500,
+            )
+        
+        return [
+            (chunk_id, document_id, filled[chunk_id] if chunk_id in filled else vector)
+            for chunk_id, document_id, vector in rows
+            if chunk_id in filled or vector is not None and len(vector) == dimension
+        ]
+    
+    def _rerank(self, entry: IndexEntry, query_embeddings, indices, top_k: int):
+        """Re-score first-pass candidates against full vectors and keep the top_k per query."""
+        positions = np.unique(indices[indices >= 0])
+        full = dict(
+            DocumentChunk.objects.filter(id__in=[entry.chunk_ids[p] for p in positions])
+            .values_list('id', 'embedding')
+        )
+        positions = [p for p in positions if entry.chunk_ids[p] in full]
+        row_of = {p: i for i, p in enumerate(positions)}
+        matrix = np.array([full[entry.chunk_ids[p]] for p in positions], dtype='float32')
         
-        chunks_query = DocumentChunk.objects.filter(
-           document__user_id=user_id,
-           embedding__isnull=False,
-         ).select_related('document')
+        distances = np.full((len(indices), top_k), np.inf, dtype='float32')
+        reranked = np.full((len(indices), top_k), -1, dtype='int64')
+        for q, row in enumerate(indices):
+            candidates = np.array([p for p in row if p in row_of], dtype='int64')
+            if not len(candidates):
+                continue
+            # Squared L2, the same distance IndexFlatL2 reports
+            scores = ((matrix[[row_of[p] for p in candidates]] - query_embeddings[q]) ** 2).sum(axis=1)
+            order = np.argsort(scores)[:top_k]
+            distances[q, :len(order)] = scores[order]
+            reranked[q, :len(order)] = candidates[order]
+        return distances, reranked
+    
+    def search_similar_chunks(self, query: str, user_id: str, document_ids: List[str] = None, top_k: int = 5, collection_id: str = None) -> List[Tuple[DocumentChunk, float]]:
+        """Search for similar chunks using vector similarity."""
+        return self.search_similar_chunks_batch([query], user_id, document_ids, top_k, collection_id)[0]
+    
+    def search_similar_chunks_batch(self, queries: List[str], user_id: str, document_ids: List[str] = None, top_k: int = 5, collection_id: str = None) -> List[List[Tuple[DocumentChunk, float]]]:
+        """Search many queries at once as a (Q x dim) matrix against one loaded index.
         
-        if document_ids:
-            chunks_query = chunks_query.filter(document_id__in=document_ids)
+        With collection_id only that collection's shard is searched; the
+        caller must have checked that the collection belongs to user_id.
+        """
+        # Vector reads are the heaviest queries we run; serve them from a replica when possible
+        with replica_reads(user_id):
+            return self._search(queries, str(user_id), document_ids, top_k, collection_id)
+    
+    def search_conversation_chunks(self, query: str, user_id: str, conversation_id: str, document_ids: List[str] = None, top_k: int = 5, collection_id: str = None) -> List[Tuple[DocumentChunk, float]]:
+        """Search for a conversation's question, trying the candidates of its recent turns before the full index."""
+        user_id = str(user_id)
+        with replica_reads(user_id):
+            model = get_active_embedding_model(user_id, self.provider.embedding_model)
+            version = get_collection_version(collection_id) if collection_id else get_index_version(user_id)
+            scope = candidate_scope(version, model, document_ids, collection_id)
+            
+            query_embeddings = None
+            pool = get_candidate_pool(conversation_id, scope)
+            if pool is not None:
+                with stage('embed_query'):
+                    query_embeddings = np.array(self.generate_embeddings([query], model=model)).astype('float32')
+                with stage('candidate_search'):
+                    results = self._search_candidates(pool, query_embeddings[0], top_k)
+                if results and results[0][1] >= settings.RAG_CANDIDATE_MIN_SIMILARITY:
+                    record_cache_lookup('conversation_candidates', hit=True)
+                    touch_candidates(conversation_id)
+                    return results
+            record_cache_lookup('conversation_candidates', hit=False)
             
-        chunks = list(chunks_query)
+            entry = self._load_index(user_id, collection_id)
+            candidates, search_params = self._selection(entry, document_ids)
+            CHUNKS_SCANNED.observe(candidates)
+            if not candidates:
+                return []
+            if query_embeddings is None or entry.model != model:
+                with stage('embed_query'):
+                    query_embeddings = np.array(self.generate_embeddings([query], model=entry.model)).astype('float32')
+            # Scan for a whole pool; the answer uses its top_k
+            distances, indices = self._scan(
+                entry, query_embeddings, max(top_k, settings.RAG_CANDIDATE_POOL_SIZE), candidates, search_params,
+            )
+            with stage('candidate_store'):
+                store_candidates(conversation_id, scope, *self._candidate_rows(entry, indices[0]))
+            return self._fetch_hits(entry, indices[:, :top_k], distances[:, :top_k])[0]
+    
+    def _search_candidates(self, pool, query_embedding, top_k: int) -> List[Tuple[DocumentChunk, float]]:
+        chunk_ids, vectors = pool
+        # Squared L2, the same distance IndexFlatL2 reports
+        distances = ((vectors - query_embedding) ** 2).sum(axis=1)
+        order = np.argsort(distances)[:top_k]
+        chunks = DocumentChunk.objects.select_related('document').defer(
+            'document__extracted_text'
+        ).in_bulk([chunk_ids[i] for i in order])
+        return [
+            (chunks[chunk_ids[i]], float(1 / (1 + distances[i])))
+            for i in order
+            if chunk_ids[i] in chunks
+        ]
+    
+    def _candidate_rows(self, entry: IndexEntry, positions) -> Tuple[list, np.ndarray]:
+        """Chunk ids and full-dimension vectors of index rows, for a conversation's candidate pool."""
+        positions = [int(p) for p in positions if p >= 0]
+        chunk_ids = [entry.chunk_ids[p] for p in positions]
+        if not entry.reduced_dimension:
+            return chunk_ids, np.array([entry.index.reconstruct(p) for p in positions], dtype='float32')
+        # The index only holds truncated vectors
+        full = dict(DocumentChunk.objects.filter(id__in=chunk_ids).values_list('id', 'embedding'))
+        chunk_ids = [chunk_id for chunk_id in chunk_ids if chunk_id in full]
+        return chunk_ids, np.array([full[chunk_id] for chunk_id in chunk_ids], dtype='float32')
+    
+    def _load_index(self, user_id: str, collection_id: str = None) -> IndexEntry:
+        with stage('load_index'):
+            if collection_id:
+                return self._get_collection_index(str(collection_id), user_id)
+            return self._get_user_index(user_id)
+    
+    def _selection(self, entry: IndexEntry, document_ids: List[str]):
+        """Number of rows a search covers, and the search parameters restricting it to document_ids."""
+        if not document_ids:
+            return len(entry), None
+        # Restrict the search to rows of the requested documents
+        positions = np.flatnonzero(np.isin(entry.document_ids, [str(doc_id) for doc_id in document_ids]))
+        return len(positions), faiss.SearchParameters(sel=faiss.IDSelectorBatch(positions.astype('int64')))
+    
+    def _scan(self, entry: IndexEntry, query_embeddings, top_k: int, candidates: int, search_params):
+        """(distances, positions) of each query's top_k rows."""
+        if entry.reduced_dimension:
+            # Broad scan on the truncated vectors, then exact scores for a candidate pool
+            with stage('vector_search'):
+                pool = min(max(top_k, settings.RAG_RERANK_POOL_SIZE), candidates)
+                _, indices = entry.index.search(
+                    reduce_embeddings(query_embeddings, entry.reduced_dimension), pool, params=search_params,
+                )
+            with stage('rerank'):
+                return self._rerank(entry, query_embeddings, indices, min(top_k, candidates))
+        with stage('vector_search'):
+            return entry.index.search(query_embeddings, min(top_k, candidates), params=search_params)
+    
+    def _fetch_hits(self, entry: IndexEntry, indices, distances) -> List[List[Tuple[DocumentChunk, float]]]:
+        similarities = 1 / (1 + distances)  # Convert L2 distance to similarity score
         
-        if not chunks:
-            return []
+        # Only the hits are loaded as model instances
+        with stage('fetch_chunks'):
+            hit_ids = {entry.chunk_ids[idx] for row in indices for idx in row if idx >= 0}
+            chunks = DocumentChunk.objects.select_related('document').defer(
+                'document__extracted_text'
+            ).in_bulk(list(hit_ids))
         
-        embeddings =  np.array([chunk.embedding for chunk in chunks]).astype('float32')
-        index = faiss.IndexFlatL2(self.embedding_dimension)
-        index.add(embeddings)
-        distances, indices = index.search(query_embedding.reshape(1, -1), min(top_k, len(chunks)))
-        similarities = 1 / (1 + distances[0])  # Convert L2 distance to similarity score
         results = []
-        for idx, sim in zip(indices[0], similarities):
-            results.append((chunks[idx], float(sim)))
-            
+        for row_indices, row_similarities in zip(indices, similarities):
+            results.append([
+                (chunks[entry.chunk_ids[idx]], float(sim))
+                for idx, sim in zip(row_indices, row_similarities)
+                if idx >= 0 and entry.chunk_ids[idx] in chunks
+            ])
         return results
     
+    def _search(self, queries: List[str], user_id: str, document_ids: List[str], top_k: int, collection_id: str = None) -> List[List[Tuple[DocumentChunk, float]]]:
+        entry = self._load_index(user_id, collection_id)
+        candidates, search_params = self._selection(entry, document_ids)
+        CHUNKS_SCANNED.observe(candidates)
+        if not candidates:
+            return [[] for _ in queries]
+        
+        with stage('embed_query'):
+            # Queries must be embedded by the model that built this index
+            query_embeddings = np.array(self.generate_embeddings(queries, model=entry.model)).astype('float32')
+        distances, indices = self._scan(entry, query_embeddings, top_k, candidates, search_params)
+        return self._fetch_hits(entry, indices, distances)
+    
     def generate_answer(self, question: str, context_chunks: List[Tuple[DocumentChunk, float]], conversation_history: List[Dict] = None) -> Dict:
         """Generate answer using RAG"""
-        context_text = "\n\n".join([f"[Source {i+1} - {chunk.document.title}, Page {chunk.page_number}]:\n{chunk.text}"
-                                    for i, (chunk, score) in enumerate(context_chunks)])
+        with stage('build_context'):
+            builder = ContextBuilder()
+            packed_chunks, context_text, context_tokens = builder.pack_chunks(context_chunks)
+            history_text, history_tokens = builder.format_history(conversation_history)
         
         system_instruction = """You are an intelligent document assistant. Answer questions based ONLY on the provided context.
         Rules:
         1. Only use information from the context
         2. If answer not in context, say "I don't have enough information"
         3. Cite sources by referring to [Source X]
-        4. Be concise and clear"""
+        4. Be concise and clear
+        5. Use the conversation history only to resolve what the question refers to"""
         
-        user_prompt = f"""Context:{context_text}
+        history_section = f"Conversation history:\n{history_text}\n\n" if history_text else ""
+        user_prompt = f"""{history_section}Context:{context_text}
         Question: {question}
         Answer based on the context above"""
+        prompt = f"{system_instruction}\n\n{user_prompt}"
         
         try:
-            response = self.llm_model.generate_content(
-                f"{system_instruction}\n\n{user_prompt}",
-                generation_config=genai.types.GenerationConfig(
-                    temperature=float(settings.AI_TEMPERATURE),
-                )
-            )
+            with stage('llm_generate'):
+                response = self.provider.generate(prompt, temperature=float(settings.AI_TEMPERATURE))
 
             sources = [
                 {
@@ -114,14 +410,24 @@ class RAGService:
                     'text_preview': chunk.text[:200] + '...',
                     'similarity_score': score,
                 }
-                for chunk, score in context_chunks
+                for chunk, score in packed_chunks
             ]
             
+            prompt_tokens = response['prompt_tokens']
+            completion_tokens = response['completion_tokens']
+            TOKENS.labels('prompt').observe(prompt_tokens)
+            if completion_tokens:
+                TOKENS.labels('completion').observe(completion_tokens)
+            
             return {
-                'answer': response.text,
+                'answer': response['text'],
                 'sources': sources,
-                'context_used': len(context_chunks),
-                'model': settings.GEMINI_MODEL_NAME,
+                'context_used': len(packed_chunks),
+                'model': self.provider.model_name,
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'context_tokens': context_tokens,
+                'history_tokens': history_tokens,
             }
             
         except Exception as e:
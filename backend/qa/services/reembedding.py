@@ -0,0 +1,159 @@
+"""Per-user migration of chunk embeddings to a new embedding model.
+
+Vectors from the default embedding model stay in DocumentChunk.embedding;
+vectors from any other model (or dimension, tagged 'name@dim') are written
+next to them in ChunkEmbedding, so search keeps working on the old model while
+the new one is backfilled. The backfill walks a user's chunks in id order in
+throttled, checkpointed slices: it can be paused and resumed and survives
+worker restarts. Once every chunk has a vector for the target model the user's
+search switches over in one step; each loaded index remembers which model its
+query embeddings must use.
+"""
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from documents.models import ChunkEmbedding, DocumentChunk, EmbeddingMigration
+from .index_cache import bump_index_version
+
+
+OPEN_STATUSES = ('pending', 'running', 'paused')
+
+
+def _active_model_key(user_id) -> str:
+    return f"rag_embedding_model:{user_id}"
+
+
+def get_active_embedding_model(user_id, default_model: str) -> str:
+    """Model a user's search runs on: the target of their latest completed migration, else the default."""
+    key = _active_model_key(user_id)
+    model = cache.get(key)
+    if model is None:
+        model = EmbeddingMigration.objects.filter(
+            user_id=user_id, status='completed',
+        ).order_by('-completed_at').values_list('target_model', flat=True).first() or ''
+        cache.set(key, model, None)
+    return model or default_model
+
+
+def get_user_embedding_models(user_id, default_model: str) -> set:
+    """Models a user's new chunks need vectors for: the active one plus open migration targets."""
+    models = {get_active_embedding_model(user_id, default_model)}
+    models.update(
+        EmbeddingMigration.objects.filter(user_id=user_id, status__in=OPEN_STATUSES)
+        .values_list('target_model', flat=True)
+    )
+    return models
+
+
+def chunks_missing_model(chunks, model: str):
+    """Narrow a chunk queryset to chunks without a vector from model."""
+    return chunks.exclude(embedding_model=model).exclude(extra_embeddings__model=model)
+
+
+def embed_chunks_for_model(service, chunks, model: str) -> int:
+    """Write model's vectors for the chunks that don't have one yet."""
+    rows = list(chunks_missing_model(chunks, model).values_list('id', 'text'))
+    if not rows:
+        return 0
+    vectors = service.generate_embeddings([text for _, text in rows], model=model)
+    ChunkEmbedding.objects.bulk_create([
+        ChunkEmbedding(chunk_id=chunk_id, model=model, embedding=vector)
+        for (chunk_id, _), vector in zip(rows, vectors)
+    ], batch_size=500, ignore_conflicts=True)
+    return len(rows)
+
+
+def start_embedding_migration(user_id, target_model: str) -> EmbeddingMigration:
+    """Create or resume a user's migration to target_model and queue its backfill."""
+    from qa.tasks import backfill_embeddings
+
+    migration, _ = EmbeddingMigration.objects.get_or_create(user_id=user_id, target_model=target_model)
+    if migration.status == 'completed':
+        return migration
+
+    migration.status = 'running'
+    migration.error = None
+    migration.consecutive_errors = 0
+    migration.requests_per_minute = migration.requests_per_minute or max(
+        settings.RAG_BACKFILL_MAX_RPM // 2, settings.RAG_BACKFILL_MIN_RPM
+    )
+    migration.total_chunks = DocumentChunk.objects.filter(user_id=user_id).count()
+    migration.save()
+    transaction.on_commit(lambda: backfill_embeddings.delay(str(migration.id)))
+    return migration
+
+
+def complete_migration(migration: EmbeddingMigration):
+    """Switch the user's search to the migration's model."""
+    migration.status = 'completed'
+    migration.completed_at = timezone.now()
+    migration.error = None
+    migration.save(update_fields=['status', 'completed_at', 'error', 'updated_at'])
+
+    # The new model and a new index version take effect together; loaded indexes are rebuilt on next use
+    cache.set(_active_model_key(migration.user_id), migration.target_model, None)
+    bump_index_version(migration.user_id)
+
+
+def run_backfill_slice(migration: EmbeddingMigration, service, slice_seconds: float = None) -> str:
+    """Backfill batches until the slice runs out; returns 'continue', 'backoff' or the final status.
+
+    One embedding request is sent per batch, paced to the migration's current
+    rate. The rate grows while requests succeed and is halved on each error,
+    which settles at the highest throughput the API sustains.
+    """
+    deadline = time.monotonic() + (slice_seconds or settings.RAG_BACKFILL_SLICE_SECONDS)
+    user_chunks = DocumentChunk.objects.filter(user_id=migration.user_id)
+
+    while time.monotonic() < deadline:
+        migration.refresh_from_db(fields=['status'])
+        if migration.status != 'running':
+            return migration.status
+
+        pending = chunks_missing_model(user_chunks, migration.target_model).order_by('id')
+        if migration.last_chunk_id:
+            pending = pending.filter(id__gt=migration.last_chunk_id)
+        batch = list(pending.values_list('id', 'text')[:settings.RAG_EMBED_BATCH_SIZE])
+
+        if not batch:
+            if migration.last_chunk_id is None:
+                complete_migration(migration)
+                return 'completed'
+            # Reached the end; sweep once more from the start for chunks created in the meantime
+            migration.last_chunk_id = None
+            migration.save(update_fields=['last_chunk_id', 'updated_at'])
+            continue
+
+        started = time.monotonic()
+        try:
+            vectors = service.generate_embeddings([text for _, text in batch], model=migration.target_model)
+        except Exception as e:
+            migration.consecutive_errors += 1
+            migration.requests_per_minute = max(migration.requests_per_minute // 2, settings.RAG_BACKFILL_MIN_RPM)
+            migration.error = str(e)
+            if migration.consecutive_errors >= settings.RAG_BACKFILL_MAX_ERRORS:
+                migration.status = 'failed'
+            migration.save(update_fields=['consecutive_errors', 'requests_per_minute', 'error', 'status', 'updated_at'])
+            return 'failed' if migration.status == 'failed' else 'backoff'
+
+        ChunkEmbedding.objects.bulk_create([
+            ChunkEmbedding(chunk_id=chunk_id, model=migration.target_model, embedding=vector)
+            for (chunk_id, _), vector in zip(batch, vectors)
+        ], ignore_conflicts=True)
+        migration.last_chunk_id = batch[-1][0]
+        migration.embedded_chunks += len(batch)
+        migration.consecutive_errors = 0
+        migration.error = None
+        migration.requests_per_minute = min(
+            migration.requests_per_minute + settings.RAG_BACKFILL_RPM_STEP, settings.RAG_BACKFILL_MAX_RPM
+        )
+        migration.save(update_fields=[
+            'last_chunk_id', 'embedded_chunks', 'consecutive_errors', 'error', 'requests_per_minute', 'updated_at',
+        ])
+
+        time.sleep(max(60 / migration.requests_per_minute - (time.monotonic() - started), 0))
+
+    return 'continue'
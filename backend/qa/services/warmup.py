@@ -0,0 +1,44 @@
+import logging
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def get_hot_user_ids(limit: int) -> list:
+    """Users who asked the most questions in the last day."""
+    from qa.models import Question
+
+    since = timezone.now() - timedelta(days=1)
+    return list(
+        Question.objects.filter(created_at__gte=since)
+        .values('conversation__user_id')
+        .annotate(questions=Count('id'))
+        .order_by('-questions')
+        .values_list('conversation__user_id', flat=True)[:limit]
+    )
+
+
+def warm_up():
+    """Create the RAG service, open its connections and preload hot users' indexes."""
+    from qa.services.rag_service import get_rag_service
+
+    try:
+        preload_user_ids = []
+        if settings.RAG_WARMUP_PRELOAD_USERS:
+            preload_user_ids = get_hot_user_ids(settings.RAG_WARMUP_PRELOAD_USERS)
+        get_rag_service().warm_up(preload_user_ids=preload_user_ids)
+        logger.info("RAG service warmed up (%d indexes preloaded)", len(preload_user_ids))
+    except Exception:
+        # Warm-up is best effort; the first request will initialize lazily instead
+        logger.exception("RAG service warm-up failed")
+
+
+def warm_up_in_background():
+    """Run warm_up in a daemon thread so process startup is not delayed."""
+    if not settings.RAG_WARMUP_ENABLED:
+        return
+    threading.Thread(target=warm_up, name='rag-warmup', daemon=True).start()
@@ -0,0 +1,17 @@
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Conversation, Question
+
+
+@receiver(post_save, sender=Question)
+def count_created_question(sender, instance, created, **kwargs):
+    """Keep Conversation.questions_count in step with question creation."""
+    if created:
+        Conversation.objects.filter(id=instance.conversation_id).update(questions_count=F('questions_count') + 1)
+
+
+@receiver(post_delete, sender=Question)
+def count_deleted_question(sender, instance, **kwargs):
+    Conversation.objects.filter(id=instance.conversation_id).update(questions_count=F('questions_count') - 1)
@@ -0,0 +1,172 @@
+from celery import shared_task
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+import time
+
+from core.profiling import profile_task
+from .models import Conversation, Question, QuestionBatch
+
+
+def _flush_batch_progress(batch_id, questions: list, failed: int, after=None):
+    """Bulk-insert finished questions and advance the batch progress counters.
+
+    Rows get strictly increasing created_at values, later than ``after``, so
+    the results list them in the order they are flushed. Returns the last one.
+    """
+    created_at = timezone.now()
+    if after is not None and created_at <= after:
+        created_at = after + timedelta(microseconds=1)
+    for offset, question in enumerate(questions):
+        question.created_at = created_at + timedelta(microseconds=offset)
+    Question.objects.bulk_create(questions)
+    # bulk_create skips post_save signals, so count the questions here
+    Conversation.objects.filter(id=questions[0].conversation_id).update(
+        questions_count=F('questions_count') + len(questions)
+    )
+    QuestionBatch.objects.filter(id=batch_id).update(
+        completed_questions=F('completed_questions') + len(questions),
+        failed_questions=F('failed_questions') + failed,
+        updated_at=timezone.now(),
+    )
+    return questions[-1].created_at
+
+
+@shared_task
+@profile_task
+def answer_question_batch(batch_id: str):
+    """Answer every question of a QuestionBatch against one loaded index."""
+    from django.contrib.auth import get_user_model
+    from .services.rag_service import get_rag_service
+    
+    try:
+        batch = QuestionBatch.objects.select_related('conversation').get(id=batch_id)
+    except QuestionBatch.DoesNotExist:
+        return f"Question batch with ID {batch_id} does not exist."
+    
+    batch.status = 'processing'
+    batch.save(update_fields=['status', 'updated_at'])
+    
+    try:
+        rag_service = get_rag_service()
+        
+        # One batched embedding call and one index scan for the whole batch
+        search_results = rag_service.search_similar_chunks_batch(
+            queries=batch.questions,
+            user_id=str(batch.user_id),
+            document_ids=batch.document_ids,
+            top_k=5,
+            collection_id=batch.collection_id,
+        )
+        
+        def answer(index, question_text, similar_chunks):
+            start_time = time.time()
+            if not similar_chunks:
+                return index, question_text, None, 'No documents found.', 0
+            try:
+                result = rag_service.generate_answer(
+                    question=question_text,
+                    context_chunks=similar_chunks,
+                )
+                return index, question_text, result, None, int((time.time() - start_time) * 1000)
+            except Exception as e:
+                return index, question_text, None, str(e), int((time.time() - start_time) * 1000)
+        
+        # Answers finish out of order; rows are written in submission order, so a slow
+        # question holds back the ones after it until it is answered
+        finished, next_index = {}, 0
+        pending, failed, answered, last_created_at = [], 0, 0, None
+        with ThreadPoolExecutor(max_workers=settings.RAG_BATCH_CONCURRENCY) as executor:
+            futures = [
+                executor.submit(answer, index, question_text, similar_chunks)
+                for index, (question_text, similar_chunks) in enumerate(zip(batch.questions, search_results))
+            ]
+            for future in as_completed(futures):
+                index, *outcome = future.result()
+                finished[index] = outcome
+                while next_index in finished:
+                    question_text, result, error, processing_time = finished.pop(next_index)
+                    next_index += 1
+                    if result is None:
+                        failed += 1
+                    pending.append(Question(
+                        conversation=batch.conversation,
+                        question_text=question_text,
+                        answer_text=result['answer'] if result else '',
+                        source_documents=result['sources'] if result else None,
+                        processing_time_ms=processing_time,
+                    ))
+                if len(pending) >= settings.RAG_BATCH_PROGRESS_INTERVAL:
+                    answered += len(pending) - failed
+                    last_created_at = _flush_batch_progress(batch.id, pending, failed, after=last_created_at)
+                    pending, failed = [], 0
+        
+        if pending:
+            answered += len(pending) - failed
+            _flush_batch_progress(batch.id, pending, failed, after=last_created_at)
+        
+        # Update user stats without a full-row save
+        get_user_model().objects.filter(id=batch.user_id).update(
+            total_questions=F('total_questions') + answered
+        )
+        
+        QuestionBatch.objects.filter(id=batch.id).update(
+            status='completed',
+            completed_at=timezone.now(),
+            updated_at=timezone.now(),
+        )
+        return f"Answered {answered} of {len(batch.questions)} questions for batch {batch_id}"
+    
+    except Exception as e:
+        QuestionBatch.objects.filter(id=batch.id).update(
+            status='failed',
+            error=str(e),
+            updated_at=timezone.now(),
+        )
+        return f"Error processing question batch {batch_id}: {str(e)}"
+
+
+@shared_task
+@profile_task
+def backfill_embeddings(migration_id: str):
+    """Run one throttled slice of an embedding migration and chain the next."""
+    from documents.models import EmbeddingMigration
+    from .services.rag_service import get_rag_service
+    from .services.reembedding import run_backfill_slice
+    
+    try:
+        migration = EmbeddingMigration.objects.get(id=migration_id)
+    except EmbeddingMigration.DoesNotExist:
+        return f"Embedding migration with ID {migration_id} does not exist."
+    
+    if migration.status != 'running':
+        return f"Embedding migration {migration_id} is {migration.status}."
+    
+    outcome = run_backfill_slice(migration, get_rag_service())
+    if outcome == 'continue':
+        backfill_embeddings.delay(migration_id)
+    elif outcome == 'backoff':
+        backfill_embeddings.apply_async((migration_id,), countdown=min(2 ** migration.consecutive_errors, 300))
+    return f"Embedding migration {migration_id} {outcome}: {migration.embedded_chunks}/{migration.total_chunks} chunks"
+
+
+@shared_task
+def flush_question_writes():
+    """Drain answered questions from the write-behind stream into the database."""
+    from .write_behind import get_write_behind
+    
+    write_behind = get_write_behind()
+    # Asks arriving from now on schedule the next flush themselves
+    write_behind.clear_flush_flag()
+    
+    # Entries are handed out once per read whatever the consumer name, so one name per host keeps the group's consumer list short
+    consumer = flush_question_writes.request.hostname or 'flush'
+    flushed = 0
+    while True:
+        handled = write_behind.drain(consumer)
+        if not handled:
+            break
+        flushed += handled
+    return f"Flushed {flushed} question writes"
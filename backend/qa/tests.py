@@ -1 +1,680 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from io import StringIO
+from pathlib import Path
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from unittest import mock
+
+from . import retrieval_eval
+from .models import Conversation, Question
+from .services.providers import FakeProvider
+
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Modules that must only be imported on first use of the RAG pipeline
+LAZY_MODULES = ('faiss', 'google.generativeai', 'PyPDF2', 'docx')
+
+
+class StartupImportTests(SimpleTestCase):
+    """Guard Django startup against heavy import regressions in a fresh interpreter."""
+
+    STARTUP_CODE = "import sys, django; django.setup(); import config.urls"
+
+    def run_python(self, code, *flags):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='config.settings')
+        env.pop('RAG_WARMUP_ENABLED', None)
+        result = subprocess.run(
+            [sys.executable, *flags, '-c', code], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=120,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+        return result
+
+    def test_heavy_modules_are_not_imported_at_startup(self):
+        code = (
+            f"{self.STARTUP_CODE}; "
+            f"print(*[name for name in {LAZY_MODULES!r} + ('qa.services.rag_service',) if name in sys.modules])"
+        )
+        self.assertEqual(self.run_python(code).stdout.split(), [])
+
+    def test_wsgi_does_not_load_the_rag_service_unless_warm_up_is_enabled(self):
+        code = (
+            "import sys, threading, config.wsgi; "
+            "print('qa.services.rag_service' in sys.modules, any(t.name == 'rag-warmup' for t in threading.enumerate()))"
+        )
+        self.assertEqual(self.run_python(code).stdout.split(), ['False', 'False'])
+
+    def test_startup_import_time(self):
+        """Benchmark startup with `python -X importtime`; the budget is generous so only regressions trip it."""
+        stderr = self.run_python(self.STARTUP_CODE, '-X', 'importtime').stderr
+
+        # Lines look like: "import time:       123 |       4567 |   package.module"
+        timings = {}
+        for line in stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            timings[name.strip()] = (int(self_us), int(cumulative_us))
+        self.assertIn('config.urls', timings)
+
+        total_ms = sum(self_us for self_us, _ in timings.values()) / 1000
+        budget_ms = float(os.environ.get('STARTUP_IMPORT_BUDGET_MS', 10000))
+        slowest = sorted(timings.items(), key=lambda item: item[1][1], reverse=True)[:10]
+        self.assertLess(
+            total_ms, budget_ms,
+            "Startup imports took %.0f ms (budget %.0f ms, set STARTUP_IMPORT_BUDGET_MS); slowest: %s" % (
+                total_ms, budget_ms, ', '.join(f"{name} ({cumulative / 1000:.0f} ms)" for name, (_, cumulative) in slowest)
+            ),
+        )
+
+
+class FakeProviderTests(SimpleTestCase):
+
+    def test_embeddings_are_deterministic_unit_vectors(self):
+        provider = FakeProvider(dimension=64)
+        first, second, other = provider.embed(['same text', 'same text', 'other text'])
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertEqual(len(first), 64)
+        self.assertAlmostEqual(sum(value * value for value in first), 1.0, places=4)
+
+    def test_generate_reports_token_counts(self):
+        result = FakeProvider(dimension=8).generate('Context: something', temperature=0.0)
+        self.assertIn('[Source 1]', result['text'])
+        self.assertGreater(result['prompt_tokens'], 0)
+        self.assertGreater(result['completion_tokens'], 0)
+
+
+class ContextBuilderTests(SimpleTestCase):
+
+    def chunk(self, text, title='Contract', page=1):
+        from types import SimpleNamespace
+        return SimpleNamespace(text=text, page_number=page, document=SimpleNamespace(title=title))
+
+    def test_chunks_are_packed_best_first_within_the_budget(self):
+        from .services.context_builder import ContextBuilder, estimate_tokens
+
+        weak, best, middle = self.chunk('w' * 200, 'Weak'), self.chunk('b' * 200, 'Best'), self.chunk('m' * 200, 'Middle')
+        packed, text, used = ContextBuilder(token_budget=130).pack_chunks([(weak, 0.2), (best, 0.9), (middle, 0.5)])
+
+        # Each part costs about 65 tokens, so only the two best fit
+        self.assertEqual([score for _, score in packed], [0.9, 0.5])
+        self.assertTrue(text.startswith('[Source 1 - Best, Page 1]:\n'))
+        self.assertIn('[Source 2 - Middle, Page 1]:', text)
+        self.assertNotIn('Weak', text)
+        self.assertEqual(used, sum(estimate_tokens(part) for part in text.split('\n\n')))
+        self.assertLessEqual(used, 130)
+
+    def test_only_the_best_chunk_is_truncated(self):
+        from .services.context_builder import ContextBuilder
+
+        builder = ContextBuilder(token_budget=50)
+        packed, text, used = builder.pack_chunks([(self.chunk('x' * 1000, 'Long'), 0.9), (self.chunk('y' * 1000, 'Other'), 0.8)])
+        self.assertEqual(len(packed), 1)
+        self.assertTrue(text.endswith('...'))
+        self.assertNotIn('Other', text)
+        self.assertLessEqual(used, 50)
+
+        packed, text, _ = builder.pack_chunks([(self.chunk('short'), 0.9), (self.chunk('y' * 1000, 'Other'), 0.8)])
+        self.assertEqual(len(packed), 1)
+        self.assertNotIn('...', text)
+
+    def test_history_keeps_the_newest_turns_in_order(self):
+        from .services.context_builder import ContextBuilder, estimate_tokens
+
+        history = [{'summary': 'Talked about fees.'}] + [
+            {'question': f"Question {i}?", 'answer': f"Answer {i}. " + 'z' * 60} for i in range(5)
+        ]
+        text, tokens = ContextBuilder(history_budget=50).format_history(history)
+
+        # The budget holds two 25-token turns, newest kept, oldest first; nothing is left for the summary
+        self.assertNotIn('Question 2?', text)
+        self.assertLess(text.index('Question 3?'), text.index('Question 4?'))
+        self.assertNotIn('Earlier in this conversation', text)
+        self.assertEqual(tokens, estimate_tokens(text))
+
+        text, _ = ContextBuilder(history_budget=1000).format_history(history)
+        self.assertTrue(text.startswith('Earlier in this conversation:\nTalked about fees.'))
+        self.assertLess(text.index('Question 0?'), text.index('Question 4?'))
+
+    def test_oversized_last_turn_is_truncated(self):
+        from .services.context_builder import ContextBuilder
+
+        text, tokens = ContextBuilder(history_budget=20).format_history([{'question': 'Long?', 'answer': 'a' * 500}])
+        self.assertTrue(text.startswith('Recent turns:\nUser: Long?'))
+        self.assertTrue(text.endswith('...'))
+        self.assertEqual(ContextBuilder().format_history([]), ('', 0))
+
+
+@override_settings(RAG_HISTORY_RECENT_TURNS=2)
+class ConversationHistoryTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        user = get_user_model().objects.create_user(username='historian', email='historian@example.com', password='pass12345')
+        self.conversation = Conversation.objects.create(user=user, title='Lease')
+
+    def add_turns(self, start, stop):
+        from datetime import timedelta
+        from django.utils import timezone
+
+        base = timezone.now() - timedelta(hours=1)
+        Question.objects.bulk_create(
+            Question(
+                conversation=self.conversation, question_text=f"Question {i}?", answer_text=f"Answer {i}. More detail.",
+                created_at=base + timedelta(minutes=i),
+            )
+            for i in reversed(range(start, stop))
+        )
+
+    def test_older_turns_are_summarized_and_recent_ones_kept_in_order(self):
+        from .services.context_builder import load_conversation_history
+
+        self.add_turns(0, 5)
+        history = load_conversation_history(self.conversation)
+
+        self.assertEqual(history[0]['summary'].splitlines(), [
+            '- Q: Question 0? A: Answer 0',
+            '- Q: Question 1? A: Answer 1',
+            '- Q: Question 2? A: Answer 2',
+        ])
+        self.assertEqual([turn['question'] for turn in history[1:]], ['Question 3?', 'Question 4?'])
+
+    def test_summarized_turns_are_not_read_again(self):
+        from .services.context_builder import load_conversation_history
+
+        self.add_turns(0, 4)
+        load_conversation_history(self.conversation)
+        self.add_turns(4, 6)
+        with CaptureQueriesContext(connection) as queries:
+            history = load_conversation_history(self.conversation)
+
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"created_at" >', queries[0]['sql'])
+        self.assertEqual([line.split(' A:')[0] for line in history[0]['summary'].splitlines()], [
+            f"- Q: Question {i}?" for i in range(4)
+        ])
+        self.assertEqual([turn['question'] for turn in history[1:]], ['Question 4?', 'Question 5?'])
+
+
+@override_settings(RAG_PROVIDER='fake')
+class BenchmarkCommandTests(TestCase):
+
+    def test_benchmark_writes_comparable_results(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'results.json')
+            call_command(
+                'benchmark_rag', documents=2, chunks_per_document=5, steps=2,
+                queries=5, asks=2, output=output, stdout=StringIO(),
+            )
+            with open(output) as f:
+                results = json.load(f)
+
+            self.assertEqual(len(results['ingest']), 2)
+            self.assertEqual([row['corpus_chunks'] for row in results['search']], [10, 20])
+            self.assertIn('p99_ms', results['search'][0])
+            self.assertEqual(results['ask']['count'], 2)
+
+            stdout = StringIO()
+            call_command(
+                'benchmark_rag', documents=2, chunks_per_document=5, steps=2,
+                queries=5, asks=2, compare=output, stdout=stdout,
+            )
+            self.assertIn('search@10', stdout.getvalue())
+
+
+class RetrievalEvaluationTests(SimpleTestCase):
+
+    def test_exact_variant_has_perfect_recall(self):
+        vectors = retrieval_eval.synthetic_embeddings(500, 32, clusters=8)
+        report = retrieval_eval.evaluate(vectors, n_queries=20, k=5, variants=['Flat', 'HNSW16:efSearch=8|64'])
+
+        flat, hnsw_low, hnsw_high = report['results']
+        self.assertEqual(flat['recall@5'], 1.0)
+        self.assertEqual(hnsw_low['params'], {'efSearch': 8})
+        self.assertGreaterEqual(hnsw_high['recall@5'], hnsw_low['recall@5'])
+        self.assertGreater(flat['memory_mb'], 0)
+        self.assertIn('HNSW16', retrieval_eval.format_table(report))
+
+    def test_reduced_first_pass_recovers_exact_results_with_full_pool(self):
+        vectors = retrieval_eval.synthetic_embeddings(300, 64, clusters=8)
+        report = retrieval_eval.evaluate(
+            vectors, n_queries=20, k=5, variants=['Flat'], reduced_dimensions=[16], pool_sizes=[5, 300],
+        )
+
+        _, small_pool, full_pool = report['results']
+        self.assertEqual(full_pool['recall@5'], 1.0)
+        self.assertLessEqual(small_pool['recall@5'], full_pool['recall@5'])
+        self.assertIn('Flat@16+rerank', retrieval_eval.format_table(report))
+
+
+    def test_table_shows_unmeasured_qps_as_a_dash(self):
+        report = {
+            'vectors': 10, 'dimension': 4, 'queries': 2, 'k': 5, 'exact_qps': None,
+            'results': [{
+                'variant': 'Flat', 'factory': 'Flat', 'params': {}, 'recall@5': 1.0,
+                'qps': None, 'build_seconds': 0.0, 'memory_mb': 0.01,
+            }],
+        }
+        header, _, _, row = retrieval_eval.format_table(report).splitlines()
+        self.assertTrue(header.endswith('exact search - qps'))
+        self.assertEqual(row.split()[:4], ['Flat', '-', '1.0000', '-'])
+
+class ConversationListTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='asker', email='asker@example.com', password='pass12345')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def make_conversation(self, questions=2):
+        conversation = Conversation.objects.create(user=self.user, title='Contract review')
+        for i in range(questions):
+            Question.objects.create(conversation=conversation, question_text=f"Question {i}?")
+        return conversation
+
+    def test_questions_count_follows_create_and_delete(self):
+        conversation = self.make_conversation(questions=3)
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.questions_count, 3)
+
+        conversation.questions.first().delete()
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.questions_count, 2)
+
+    def test_list_is_constant_in_rows(self):
+        self.make_conversation()
+        with CaptureQueriesContext(connection) as small:
+            self.client.get('/api/v1/qa/conversations/')
+
+        for _ in range(9):
+            self.make_conversation()
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get('/api/v1/qa/conversations/')
+
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+        self.assertEqual(response.data['results'][0]['questions_count'], 2)
+
+    def test_questions_page_by_cursor(self):
+        conversation = self.make_conversation(questions=7)
+        url = f'/api/v1/qa/conversations/{conversation.id}/questions/?page_size=3'
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(question['question_text'] for question in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, [f"Question {i}?" for i in range(7)])
+
+
+@override_settings(RAG_PROVIDER='fake', RAG_BATCH_CONCURRENCY=6, RAG_BATCH_PROGRESS_INTERVAL=2)
+class QuestionBatchTests(TestCase):
+
+    def setUp(self):
+        from .benchmarks import create_corpus
+        from .services.rag_service import RAGService
+
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='batcher', email='batcher@example.com', password='pass12345')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.service = RAGService()
+        for document in create_corpus(self.user, n_documents=2, chunks_per_document=5):
+            self.service.embed_document_chunks(str(document.id))
+        self.questions = [f"What does clause {i} say about payment terms?" for i in range(6)]
+
+    def submit(self):
+        with mock.patch('qa.tasks.answer_question_batch.delay') as delay:
+            response = self.client.post('/api/v1/qa/conversations/ask_batch/', {'questions': self.questions}, format='json')
+        self.assertEqual(response.status_code, 202)
+        delay.assert_called_once_with(response.data['id'])
+        return response.data['id']
+
+    def run_batch(self, batch_id, generate_answer):
+        from .tasks import answer_question_batch
+
+        with mock.patch('qa.services.rag_service.get_rag_service', return_value=self.service), \
+                mock.patch.object(self.service, 'generate_answer', side_effect=generate_answer):
+            answer_question_batch(batch_id)
+        return self.client.get(f'/api/v1/qa/batches/{batch_id}/').data
+
+    def test_results_keep_submission_order(self):
+        import time
+        original = self.service.generate_answer
+
+        def slow_first(question, context_chunks):
+            # Earlier questions finish last
+            time.sleep(0.02 * (len(self.questions) - self.questions.index(question)))
+            return original(question=question, context_chunks=context_chunks)
+
+        batch_id = self.submit()
+        batch = self.run_batch(batch_id, slow_first)
+        self.assertEqual(
+            (batch['status'], batch['completed_questions'], batch['failed_questions'], batch['progress']),
+            ('completed', 6, 0, 1.0),
+        )
+
+        url, seen = f'/api/v1/qa/batches/{batch_id}/results/?page_size=4', []
+        while url:
+            response = self.client.get(url)
+            seen.extend(question['question_text'] for question in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, self.questions)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.total_questions, 6)
+
+    def test_failed_answers_are_counted(self):
+        original = self.service.generate_answer
+
+        def fail_third(question, context_chunks):
+            if question == self.questions[2]:
+                raise RuntimeError('quota exceeded')
+            return original(question=question, context_chunks=context_chunks)
+
+        batch = self.run_batch(self.submit(), fail_third)
+        self.assertEqual((batch['completed_questions'], batch['failed_questions']), (6, 1))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.total_questions, 5)
+
+    def test_batch_size_is_limited(self):
+        with override_settings(RAG_BATCH_MAX_QUESTIONS=3):
+            response = self.client.post('/api/v1/qa/conversations/ask_batch/', {'questions': self.questions}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(RAG_PROVIDER='fake')
+class AskStageTimingTests(TestCase):
+
+    def setUp(self):
+        from .benchmarks import create_corpus
+        from .services.rag_service import RAGService
+
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='timed', email='timed@example.com', password='pass12345')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.service = RAGService()
+        for document in create_corpus(self.user, n_documents=1, chunks_per_document=5):
+            self.service.embed_document_chunks(str(document.id))
+
+    def ask(self):
+        with mock.patch('qa.services.rag_service.get_rag_service', return_value=self.service):
+            response = self.client.post('/api/v1/qa/conversations/ask/', {'question': 'When is payment due?'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def assert_stored_breakdown(self, data):
+        stored = Question.objects.get(id=data['question_id']).stage_timings
+        self.assertEqual(stored, data['stage_timings'])
+        self.assertTrue({'conversation_lookup', 'embed_query', 'llm_generate', 'db_write'} <= set(stored), stored)
+
+    @override_settings(QA_WRITE_BEHIND_ENABLED=False)
+    def test_synchronous_write_stores_the_db_write_stage(self):
+        self.assert_stored_breakdown(self.ask())
+
+    @override_settings(QA_WRITE_BEHIND_ENABLED=True)
+    def test_written_behind_question_stores_the_db_write_stage(self):
+        import fakeredis
+        from .write_behind import QuestionWriteBehind
+
+        write_behind = QuestionWriteBehind(fakeredis.FakeRedis(decode_responses=True))
+        with mock.patch('qa.write_behind._write_behind', write_behind), mock.patch('qa.tasks.flush_question_writes.apply_async'):
+            data = self.ask()
+        self.assertFalse(Question.objects.filter(id=data['question_id']).exists())
+        self.assertEqual(write_behind.drain('test'), 1)
+        self.assert_stored_breakdown(data)
+
+
+    @override_settings(QA_WRITE_BEHIND_ENABLED=True)
+    def test_question_flushed_before_its_timings_are_recorded_gets_the_db_write_stage(self):
+        import fakeredis
+        from . import views
+        from .write_behind import QuestionWriteBehind
+
+        write_behind = QuestionWriteBehind(fakeredis.FakeRedis(decode_responses=True))
+        record_question = views.record_question
+
+        def record_then_flush(question, user_id):
+            # A flush worker picks the question up before the view records its final timings
+            written_behind = record_question(question, user_id)
+            self.assertEqual(write_behind.drain('test'), 1)
+            return written_behind
+
+        with mock.patch('qa.write_behind._write_behind', write_behind), mock.patch('qa.tasks.flush_question_writes.apply_async'), \
+                mock.patch('qa.views.record_question', side_effect=record_then_flush):
+            data = self.ask()
+        self.assert_stored_breakdown(data)
+
+class WriteBehindTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='writer', email='writer@example.com', password='pass12345')
+        self.conversation = Conversation.objects.create(user=self.user, title='Contract review')
+
+    def make_question(self, text):
+        return Question(conversation=self.conversation, question_text=text, answer_text=f"Answer to {text}")
+
+    def test_replayed_batch_is_stored_and_counted_once(self):
+        from .write_behind import persist_questions, question_payload
+
+        payloads = [question_payload(self.make_question(f"Question {i}?"), self.user.id) for i in range(3)]
+        self.assertEqual(persist_questions(payloads[:2]), 2)
+        # A worker died after committing but before acknowledging: the batch comes round again
+        self.assertEqual(persist_questions(json.loads(json.dumps(payloads, cls=DjangoJSONEncoder))), 1)
+
+        self.conversation.refresh_from_db()
+        self.user.refresh_from_db()
+        self.assertEqual(self.conversation.questions.count(), 3)
+        self.assertEqual(self.conversation.questions_count, 3)
+        self.assertEqual(self.user.total_questions, 3)
+
+    def test_history_includes_unflushed_turns(self):
+        from .services.context_builder import load_conversation_history
+        from .write_behind import add_pending_turn, persist_questions, question_payload
+
+        stored = self.make_question('Stored?')
+        persist_questions([question_payload(stored, self.user.id)])
+        pending = self.make_question('Pending?')
+        add_pending_turn(pending)
+
+        history = load_conversation_history(self.conversation)
+        self.assertEqual([turn['question'] for turn in history], ['Stored?', 'Pending?'])
+
+        persist_questions([question_payload(pending, self.user.id)])
+        history = load_conversation_history(self.conversation)
+        self.assertEqual([turn['question'] for turn in history], ['Stored?', 'Pending?'])
+
+
+@override_settings(RAG_PROVIDER='fake', RAG_BACKFILL_MAX_RPM=60000, RAG_EMBED_BATCH_SIZE=4)
+class EmbeddingMigrationTests(TestCase):
+
+    def setUp(self):
+        from .benchmarks import create_corpus
+        from .services.rag_service import RAGService
+
+        cache.clear()
+
+        self.user = get_user_model().objects.create_user(username='migrator', email='migrator@example.com', password='pass12345')
+        self.service = RAGService()
+        self.documents = create_corpus(self.user, n_documents=2, chunks_per_document=5)
+        for document in self.documents:
+            self.service.embed_document_chunks(str(document.id))
+
+    def test_search_switches_model_only_when_backfill_completes(self):
+        from documents.models import ChunkEmbedding, EmbeddingMigration
+        from .services.reembedding import run_backfill_slice
+
+        target = 'fake-embedding-v2@16'
+        migration = EmbeddingMigration.objects.create(
+            user=self.user, target_model=target, status='running', total_chunks=10, requests_per_minute=60000,
+        )
+        user_id = str(self.user.id)
+
+        # Until the backfill finishes, search stays on the old model
+        self.assertEqual(run_backfill_slice(migration, self.service, slice_seconds=1e-9), 'continue')
+        self.assertEqual(self.service._get_user_index(user_id).model, 'fake-embedding')
+
+        # Chunks ingested mid-migration get vectors for the target model as well
+        from .benchmarks import create_corpus
+        late = create_corpus(self.user, n_documents=1, chunks_per_document=3, seed=1)[0]
+        self.service.embed_document_chunks(str(late.id))
+        self.assertEqual(ChunkEmbedding.objects.filter(chunk__document=late, model=target).count(), 3)
+
+        self.assertEqual(run_backfill_slice(migration, self.service, slice_seconds=30), 'completed')
+        self.assertEqual(ChunkEmbedding.objects.filter(model=target).count(), 13)
+
+        entry = self.service._get_user_index(user_id)
+        self.assertEqual((entry.model, entry.index.d, len(entry)), (target, 16, 13))
+        results = self.service.search_similar_chunks('payment terms', user_id, top_k=3)
+        self.assertEqual(len(results), 3)
+
+
+@override_settings(RAG_PROVIDER='fake')
+class ReducedDimensionSearchTests(TestCase):
+
+    def setUp(self):
+        # Index versions and active embedding models are cached per user id
+        cache.clear()
+
+    def test_reranked_search_matches_full_search(self):
+        from documents.models import DocumentChunk
+        from .benchmarks import create_corpus
+        from .services.rag_service import RAGService
+
+        user = get_user_model().objects.create_user(username='reducer', email='reducer@example.com', password='pass12345')
+        service = RAGService()
+        for document in create_corpus(user, n_documents=2, chunks_per_document=10):
+            service.embed_document_chunks(str(document.id))
+        expected = [(chunk.id, round(score, 5)) for chunk, score in service.search_similar_chunks('renewal notice', str(user.id))]
+
+        # Chunks embedded before the mode was enabled get their reduced vectors on the next index load
+        with override_settings(RAG_REDUCED_DIMENSION=16, RAG_RERANK_POOL_SIZE=20):
+            service = RAGService()
+            results = service.search_similar_chunks('renewal notice', str(user.id))
+            self.assertEqual(service._get_user_index(str(user.id)).index.d, 16)
+
+        self.assertEqual(len(expected), 5)
+        self.assertEqual([(chunk.id, round(score, 5)) for chunk, score in results], expected)
+        self.assertEqual(DocumentChunk.objects.filter(embedding_reduced__isnull=False).count(), 20)
+
+
+@override_settings(RAG_PROVIDER='fake')
+class CollectionShardTests(TestCase):
+
+    def setUp(self):
+        from documents.models import DocumentCollection
+        from .benchmarks import create_corpus
+        from .services.rag_service import RAGService
+
+        cache.clear()
+
+        self.user = get_user_model().objects.create_user(username='shards', email='shards@example.com', password='pass12345')
+        self.service = RAGService()
+        self.documents = create_corpus(self.user, n_documents=3, chunks_per_document=4)
+        self.collection = DocumentCollection.objects.create(user=self.user, name='Contracts')
+        for document in self.documents[:2]:
+            document.collection = self.collection
+            document.save(update_fields=['collection'])
+        for document in self.documents:
+            self.service.embed_document_chunks(str(document.id))
+
+    def search(self, top_k=20):
+        return self.service.search_similar_chunks(
+            'payment terms', str(self.user.id), top_k=top_k, collection_id=str(self.collection.id),
+        )
+
+    def test_search_is_limited_to_the_collection(self):
+        results = self.search()
+        self.assertEqual(len(results), 8)
+        self.assertEqual({chunk.document_id for chunk, _ in results}, {document.id for document in self.documents[:2]})
+
+        shard = self.service._get_collection_index(str(self.collection.id), str(self.user.id))
+        self.assertEqual(len(shard), 8)
+        self.assertEqual(len(self.service._get_user_index(str(self.user.id))), 12)
+
+    @mock.patch('documents.task.purge_deleted_documents.delay')
+    def test_shard_follows_documents_joining_and_leaving(self, purge):
+        from documents.deletion import soft_delete_documents
+        from documents.models import Document
+
+        self.search()
+        joining, leaving = Document.objects.get(id=self.documents[2].id), self.documents[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            joining.collection = self.collection
+            joining.save(update_fields=['collection'])
+        with self.captureOnCommitCallbacks(execute=True):
+            soft_delete_documents(Document.objects.filter(id=leaving.id))
+
+        # Only the joining document's vectors are loaded; the rest of the shard is reused
+        with mock.patch.object(self.service, '_index_rows', wraps=self.service._index_rows) as index_rows:
+            results = self.search()
+        self.assertEqual(len(index_rows.call_args_list), 1)
+        self.assertEqual(index_rows.call_args.kwargs['document_id'], str(joining.id))
+
+        self.assertEqual({chunk.document_id for chunk, _ in results}, {self.documents[1].id, joining.id})
+        shard = self.service._get_collection_index(str(self.collection.id), str(self.user.id))
+        self.assertEqual((len(shard), shard.removed), (8, 4))
+
+    def test_ask_rejects_another_users_collection(self):
+        other = get_user_model().objects.create_user(username='intruder', email='intruder@example.com', password='pass12345')
+        client = APIClient()
+        client.force_authenticate(other)
+        response = client.post(
+            '/api/v1/qa/conversations/ask/',
+            {'question': 'What are the payment terms?', 'collection_id': str(self.collection.id)},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(RAG_PROVIDER='fake', RAG_CANDIDATE_POOL_SIZE=6, RAG_CANDIDATE_MIN_SIMILARITY=0.3)
+class ConversationCandidateTests(TestCase):
+
+    def setUp(self):
+        from .benchmarks import create_corpus
+        from .services.rag_service import RAGService
+
+        cache.clear()
+
+        self.user = get_user_model().objects.create_user(username='follower', email='follower@example.com', password='pass12345')
+        self.conversation = Conversation.objects.create(user=self.user, title='Renewals')
+        self.service = RAGService()
+        for document in create_corpus(self.user, n_documents=3, chunks_per_document=10):
+            self.service.embed_document_chunks(str(document.id))
+
+    def ask(self, query):
+        with mock.patch.object(self.service, '_load_index', wraps=self.service._load_index) as load_index:
+            results = self.service.search_conversation_chunks(query, str(self.user.id), str(self.conversation.id), top_k=3)
+        return [(chunk.id, round(score, 4)) for chunk, score in results], load_index.called
+
+    def test_follow_up_is_answered_from_candidates(self):
+        expected = [(chunk.id, round(score, 4)) for chunk, score in self.service.search_similar_chunks('renewal notice', str(self.user.id), top_k=3)]
+        self.assertEqual(len(expected), 3)
+
+        self.assertEqual(self.ask('renewal notice'), (expected, True))
+        # The same passages score high enough in the pool; the index isn't touched
+        self.assertEqual(self.ask('renewal notice'), (expected, False))
+
+        # A question the pool doesn't cover well goes back to the full index
+        with override_settings(RAG_CANDIDATE_MIN_SIMILARITY=1.01):
+            self.assertTrue(self.ask('renewal notice')[1])
+
+    def test_pool_is_dropped_when_the_index_changes(self):
+        from .benchmarks import create_corpus
+
+        self.ask('renewal notice')
+        late = create_corpus(self.user, n_documents=1, chunks_per_document=2, seed=7)[0]
+        self.service.embed_document_chunks(str(late.id))
+        self.assertTrue(self.ask('renewal notice')[1])
+        self.assertFalse(self.ask('renewal notice')[1])
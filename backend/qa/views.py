@@ -5,11 +5,26 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
 import time
 
-from .models import Conversation, Question
-from .serializers import ConversationSerializer, AskQuestionSerializer
-from .services.rag_service import RAGService
+from core.metrics import StageTimer
+from core.mixins import ReplicaReadMixin
+from core.pagination import QuestionCursorPagination
+from documents.models import DocumentCollection
+from .models import Conversation, Question, QuestionBatch
+from .serializers import (
+    ConversationSerializer,
+    AskQuestionSerializer,
+    AskBatchSerializer,
+    QuestionBatchSerializer,
+    QuestionSerializer,
+)
+from .services.context_builder import load_conversation_history
+from .write_behind import record_question, record_stage_timings
 
-class ConversationViewSet(viewsets.ModelViewSet):
+
+def _collection_not_found(collection_id, user) -> bool:
+    return bool(collection_id) and not DocumentCollection.objects.filter(id=collection_id, user=user).exists()
+
+class ConversationViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     serializer_class = ConversationSerializer
     permission_classes = [IsAuthenticated]
     
@@ -19,64 +34,89 @@ class ConversationViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
         
+    @action(detail=True, methods=['get'])
+    def questions(self, request, pk=None):
+        """Get the questions of a conversation, oldest first, a cursor page at a time"""
+        conversation = self.get_object()
+        questions = Question.objects.filter(conversation=conversation)
+        paginator = QuestionCursorPagination()
+        page = paginator.paginate_queryset(questions, request, view=self)
+        return paginator.get_paginated_response(QuestionSerializer(page, many=True).data)
+    
     @action(detail=False, methods=['post'])
     def ask(self, request):
         """Ask a question with RAG"""
+        from .services.rag_service import get_rag_service
+        
         serializer = AskQuestionSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         question_text = serializer.validated_data['question']
         document_ids = serializer.validated_data.get('document_ids')
         conversation_id = serializer.validated_data.get('conversation_id')
+        collection_id = serializer.validated_data.get('collection_id')
+        if _collection_not_found(collection_id, request.user):
+            return Response({'error': 'Collection not found.'}, status=status.HTTP_404_NOT_FOUND)
         
         start_time = time.time()
+        timer = StageTimer('ask')
         
         try:
-            # Get or create conversation
-            if conversation_id:
-                conversation = Conversation.objects.get(
-                    id=conversation_id,
-                    user=request.user
-                )
-            else:
-                conversation = Conversation.objects.create(
-                    user=request.user,
-                    title=question_text[:100]  # Use first 100 chars as title
-                    )
+            with timer:
+                # Get or create conversation
+                conversation_history = None
+                with timer.stage('conversation_lookup'):
+                    if conversation_id:
+                        conversation = Conversation.objects.get(
+                            id=conversation_id,
+                            user=request.user
+                        )
+                    else:
+                        conversation = Conversation.objects.create(
+                            user=request.user,
+                            title=question_text[:100]  # Use first 100 chars as title
+                            )
+                if conversation_id:
+                    with timer.stage('history_load'):
+                        conversation_history = load_conversation_history(conversation)
 
-            # RAG: Search similar chunks
-            rag_service = RAGService()
-            similar_chunks = rag_service.search_similar_chunks(
-                query=question_text,
-                user_id=str(request.user.id),
-                document_ids=document_ids,
-                top_k=5
-            )
-            
-            if not similar_chunks:
-                return Response({
-                    'error': 'No documents found. Please upload documents first.'
-                }, status=status.HTTP_400_BAD_REQUEST)
+                # RAG: Search similar chunks, starting with those of the conversation's recent turns
+                rag_service = get_rag_service()
+                similar_chunks = rag_service.search_conversation_chunks(
+                    query=question_text,
+                    user_id=str(request.user.id),
+                    conversation_id=str(conversation.id),
+                    document_ids=document_ids,
+                    top_k=5,
+                    collection_id=collection_id,
+                )
                 
-            # RAG: Generate answer
-            result = rag_service.generate_answer(
-                question=question_text,
-                context_chunks=similar_chunks,
-            )
-            
-            processing_time = int((time.time() - start_time) * 1000)  # in ms
-            
-            # Save question and answer
-            question = Question.objects.create(
-                conversation=conversation,
-                question_text=question_text,
-                answer_text=result['answer'],
-                source_documents=result['sources'],
-                processing_time_ms=processing_time,
-            )
-            
-            # Update user stats
-            request.user.total_questions += 1
-            request.user.save()
+                if not similar_chunks:
+                    return Response({
+                        'error': 'No documents found. Please upload documents first.'
+                    }, status=status.HTTP_400_BAD_REQUEST)
+                    
+                # RAG: Generate answer
+                result = rag_service.generate_answer(
+                    question=question_text,
+                    context_chunks=similar_chunks,
+                    conversation_history=conversation_history,
+                )
+                
+                processing_time = int((time.time() - start_time) * 1000)  # in ms
+                
+                with timer.stage('db_write'):
+                    # Question row and user stats are written behind, in batches
+                    question = Question(
+                        conversation=conversation,
+                        question_text=question_text,
+                        answer_text=result['answer'],
+                        source_documents=result['sources'],
+                        processing_time_ms=processing_time,
+                        stage_timings=dict(timer.timings),
+                    )
+                    written_behind = record_question(question, request.user.id)
+                # The stored breakdown so far lacks db_write, which has only now been timed
+                record_stage_timings(question, timer.timings, written_behind)
             
             return Response({
                 'question_id': question.id,
@@ -85,6 +125,9 @@ class ConversationViewSet(viewsets.ModelViewSet):
                 'answer': result['answer'],
                 'sources': result['sources'],
                 'processing_time_ms': processing_time,
+                'stage_timings': timer.timings,
+                'prompt_tokens': result['prompt_tokens'],
+                'completion_tokens': result['completion_tokens'],
             })
             
         
@@ -92,5 +135,49 @@ class ConversationViewSet(viewsets.ModelViewSet):
             return Response({
                 'error': str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    @action(detail=False, methods=['post'])
+    def ask_batch(self, request):
+        """Queue many questions against one document set; poll the batch for progress"""
+        from .tasks import answer_question_batch
+        
+        serializer = AskBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        questions = serializer.validated_data['questions']
+        document_ids = serializer.validated_data.get('document_ids')
+        collection_id = serializer.validated_data.get('collection_id')
+        if _collection_not_found(collection_id, request.user):
+            return Response({'error': 'Collection not found.'}, status=status.HTTP_404_NOT_FOUND)
+        
+        conversation = Conversation.objects.create(
+            user=request.user,
+            title=serializer.validated_data.get('title') or f"Batch: {questions[0][:90]}",
+        )
+        batch = QuestionBatch.objects.create(
+            user=request.user,
+            conversation=conversation,
+            questions=questions,
+            document_ids=[str(doc_id) for doc_id in document_ids] if document_ids else None,
+            collection_id=collection_id,
+            total_questions=len(questions),
+        )
+        answer_question_batch.delay(str(batch.id))
+        
+        return Response(QuestionBatchSerializer(batch).data, status=status.HTTP_202_ACCEPTED)
 
 
+class QuestionBatchViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
+    serializer_class = QuestionBatchSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        return QuestionBatch.objects.filter(user=self.request.user)
+    
+    @action(detail=True, methods=['get'])
+    def results(self, request, pk=None):
+        """Get the answered questions of a batch"""
+        batch = self.get_object()
+        questions = Question.objects.filter(conversation_id=batch.conversation_id)
+        paginator = QuestionCursorPagination()
+        page = paginator.paginate_queryset(questions, request, view=self)
+        return paginator.get_paginated_response(QuestionSerializer(page, many=True).data)
@@ -0,0 +1,223 @@
+"""Write-behind persistence of answered questions.
+
+``ask`` does not insert its Question row or bump the usage counters itself.
+It appends the row to a Redis stream and returns; ``flush_question_writes``
+drains the stream into one ``bulk_create`` per batch plus one ``F()`` update
+per conversation and user, so concurrent asks no longer overwrite each other's
+counter increments.
+
+Durability: entries are read through a consumer group and acknowledged (and
+deleted) only after their transaction commits. A worker that dies mid-batch
+leaves its entries pending, and the next flush takes them over once they have
+been idle for QA_WRITE_BEHIND_CLAIM_IDLE_SECONDS. Question ids are assigned at
+ask time and rows already in the database are skipped, so a batch that is
+replayed after a crash between commit and acknowledgement is not counted twice.
+Entries that cannot be stored (e.g. the conversation was deleted meanwhile)
+are moved to a dead-letter stream instead of blocking the rest. If Redis is
+unreachable, the ask falls back to writing synchronously. Redis must run with
+appendonly for the stream to survive a Redis restart.
+
+Until an entry is flushed, the turn is also kept in the cache so a follow-up
+question in the same conversation sees it in its history. So is the ask's
+final stage breakdown: it includes the time spent recording the question, so
+it is only known after the entry was appended, and the flush stores it in
+place of the partial one in the entry.
+"""
+import json
+import logging
+from collections import Counter
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DataError, IntegrityError, transaction
+from django.db.models import F
+from django.utils.dateparse import parse_datetime
+
+from .models import Conversation, Question
+
+
+logger = logging.getLogger(__name__)
+
+STREAM = 'qa:writes'
+DEAD_LETTER_STREAM = 'qa:writes:dead'
+GROUP = 'qa-writers'
+FLUSH_SCHEDULED_KEY = 'qa:writes:flush-scheduled'
+
+QUESTION_FIELDS = (
+    'question_text', 'answer_text', 'source_documents', 'processing_time_ms', 'stage_timings', 'created_at',
+)
+
+
+def question_payload(question: Question, user_id) -> dict:
+    payload = {field: getattr(question, field) for field in QUESTION_FIELDS}
+    payload.update(id=str(question.id), conversation_id=str(question.conversation_id), user_id=user_id)
+    return payload
+
+
+def _timings_key(question_id) -> str:
+    return f"question_stage_timings:{question_id}"
+
+
+def persist_questions(payloads: list) -> int:
+    """Insert the questions not stored yet and add them to the counters; returns how many were new."""
+    ids = [payload['id'] for payload in payloads]
+    final_timings = cache.get_many([_timings_key(question_id) for question_id in ids])
+    for payload in payloads:
+        payload['stage_timings'] = final_timings.get(_timings_key(payload['id']), payload['stage_timings'])
+    with transaction.atomic():
+        stored = {str(question_id) for question_id in Question.objects.filter(id__in=ids).values_list('id', flat=True)}
+        questions, users = [], Counter()
+        for payload in payloads:
+            if payload['id'] in stored:
+                continue
+            stored.add(payload['id'])
+            created_at = payload['created_at']
+            questions.append(Question(
+                id=payload['id'],
+                conversation_id=payload['conversation_id'],
+                created_at=parse_datetime(created_at) if isinstance(created_at, str) else created_at,
+                **{field: payload[field] for field in QUESTION_FIELDS if field != 'created_at'},
+            ))
+            users[payload['user_id']] += 1
+        if not questions:
+            return 0
+
+        Question.objects.bulk_create(questions)
+        # bulk_create skips post_save signals, so count the questions here
+        for conversation_id, count in Counter(question.conversation_id for question in questions).items():
+            Conversation.objects.filter(id=conversation_id).update(questions_count=F('questions_count') + count)
+        for user_id, count in users.items():
+            get_user_model().objects.filter(id=user_id).update(total_questions=F('total_questions') + count)
+    cache.delete_many(list(final_timings))
+    return len(questions)
+
+
+def _pending_key(conversation_id) -> str:
+    return f"conversation_pending:{conversation_id}"
+
+
+def add_pending_turn(question: Question):
+    key = _pending_key(question.conversation_id)
+    turns = cache.get(key) or []
+    turns.append({
+        'id': question.id,
+        'question_text': question.question_text,
+        'answer_text': question.answer_text,
+        'created_at': question.created_at,
+    })
+    cache.set(key, turns, settings.QA_WRITE_BEHIND_PENDING_TTL)
+
+
+def pending_turns(conversation_id) -> list:
+    """Recent turns of a conversation that may not have been flushed to the database yet."""
+    return cache.get(_pending_key(conversation_id)) or []
+
+
+class QuestionWriteBehind:
+    """Redis stream of answered questions, drained in batches through a consumer group."""
+
+    def __init__(self, redis_client=None):
+        if redis_client is None:
+            import redis
+            redis_client = redis.Redis.from_url(settings.CELERY_BROKER_URL, decode_responses=True)
+        self.redis = redis_client
+        self._group_ready = False
+
+    def ensure_group(self):
+        if self._group_ready:
+            return
+        import redis
+        try:
+            self.redis.xgroup_create(STREAM, GROUP, id='0', mkstream=True)
+        except redis.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        self._group_ready = True
+
+    def append(self, payload: dict) -> str:
+        self.ensure_group()
+        entry_id = self.redis.xadd(STREAM, {'payload': json.dumps(payload, cls=DjangoJSONEncoder)})
+
+        # The first write in a quiet period schedules a flush; later ones ride along with it
+        delay = settings.QA_WRITE_BEHIND_FLUSH_DELAY
+        if self.redis.set(FLUSH_SCHEDULED_KEY, 1, nx=True, px=max(int(delay * 1000), 1)):
+            from .tasks import flush_question_writes
+            flush_question_writes.apply_async(countdown=delay)
+        return entry_id
+
+    def read(self, consumer: str, count: int) -> list:
+        """Entries abandoned by a dead consumer first, then new ones."""
+        self.ensure_group()
+        idle_ms = settings.QA_WRITE_BEHIND_CLAIM_IDLE_SECONDS * 1000
+        claimed = self.redis.xautoclaim(STREAM, GROUP, consumer, min_idle_time=idle_ms, start_id='0-0', count=count)
+        entries = [(entry_id, fields) for entry_id, fields in claimed[1] if fields]
+        if len(entries) < count:
+            for _, messages in self.redis.xreadgroup(GROUP, consumer, {STREAM: '>'}, count=count - len(entries)) or []:
+                entries.extend(messages)
+        return entries
+
+    def drain(self, consumer: str, count: int = None) -> int:
+        """Persist one batch and acknowledge it; returns how many entries were handled."""
+        entries = self.read(consumer, count or settings.QA_WRITE_BEHIND_BATCH_SIZE)
+        if not entries:
+            return 0
+        entry_ids = [entry_id for entry_id, _ in entries]
+        payloads = [json.loads(fields['payload']) for _, fields in entries]
+
+        try:
+            persist_questions(payloads)
+        except (IntegrityError, DataError):
+            # Store what can be stored and set the rest aside; database outages propagate and are retried
+            for entry_id, payload in zip(entry_ids, payloads):
+                try:
+                    persist_questions([payload])
+                except (IntegrityError, DataError) as e:
+                    logger.warning("Moving question %s to %s: %s", payload['id'], DEAD_LETTER_STREAM, e)
+                    self.redis.xadd(DEAD_LETTER_STREAM, {'payload': json.dumps(payload), 'error': str(e)})
+
+        pipe = self.redis.pipeline()
+        pipe.xack(STREAM, GROUP, *entry_ids)
+        pipe.xdel(STREAM, *entry_ids)
+        pipe.execute()
+        return len(entries)
+
+    def clear_flush_flag(self):
+        self.redis.delete(FLUSH_SCHEDULED_KEY)
+
+
+_write_behind = None
+
+
+def get_write_behind() -> QuestionWriteBehind:
+    global _write_behind
+    if _write_behind is None:
+        _write_behind = QuestionWriteBehind()
+    return _write_behind
+
+
+def record_question(question: Question, user_id) -> bool:
+    """Persist an answered question and its counters, off the request path when possible.
+
+    Returns whether the question was written behind rather than stored already.
+    """
+    payload = question_payload(question, user_id)
+    if settings.QA_WRITE_BEHIND_ENABLED:
+        import redis
+        try:
+            get_write_behind().append(payload)
+            add_pending_turn(question)
+            return True
+        except redis.RedisError:
+            logger.warning("Write-behind stream unavailable; saving question %s synchronously", question.id)
+    persist_questions([payload])
+    return False
+
+
+def record_stage_timings(question: Question, timings: dict, written_behind: bool):
+    """Store a recorded question's complete stage breakdown, including the time spent recording it."""
+    if written_behind:
+        # For the flush still to come; the update below covers one that already ran
+        cache.set(_timings_key(question.id), dict(timings), settings.QA_WRITE_BEHIND_PENDING_TTL)
+    # Matches no row while the question is still waiting to be flushed
+    Question.objects.filter(id=question.id).update(stage_timings=dict(timings))
@@ -0,0 +1,57 @@
+"""JWT authentication that skips the user lookup on most requests.
+
+simplejwt's JWTAuthentication loads the token's user from the database on
+every request. CachedJWTAuthentication keeps the resolved user in the
+shared cache for AUTH_USER_CACHE_TTL seconds under auth_user:{id}, so a
+client making a burst of requests costs one SELECT per TTL instead of one
+per request. The token signature and expiry are still checked each time,
+and so are the is_active and revocation checks, against the cached user.
+
+The cache is shared (Redis) rather than per process so that users/signals.py
+can drop an entry for every worker when the user is saved or deleted:
+profile updates, deactivation and password changes take effect on the next
+request. Queryset .update() calls send no signals; the counters they bump
+(total_documents, total_questions) may lag by up to the TTL, which is why
+the profile endpoint reads the user fresh.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+def user_cache_key(user_id) -> str:
+    return f"auth_user:{user_id}"
+
+
+def invalidate_cached_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that resolves the token's user from the cache when it can."""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            # The parent runs the active and revocation checks; only users that pass are cached
+            user = super().get_user(validated_token)
+            cache.set(key, user, settings.AUTH_USER_CACHE_TTL)
+            return user
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN and (
+            validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password)
+        ):
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
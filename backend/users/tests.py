@@ -1,3 +1,45 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
 
-# Create your tests here.
+
+@override_settings(AUTH_USER_CACHE_TTL=60)
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            username='reader', email='reader@example.com', password='secret-pass-1',
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def _user_queries(self, url, requests=5):
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(requests):
+                self.assertEqual(self.client.get(url).status_code, 200)
+        return sum('FROM "users"' in query['sql'] for query in queries.captured_queries)
+
+    def test_repeated_requests_look_up_the_user_once(self):
+        # Before caching, every request loaded the token's user
+        self.assertEqual(self._user_queries('/api/v1/qa/conversations/', requests=5), 1)
+        self.assertEqual(self._user_queries('/api/v1/qa/conversations/', requests=5), 0)
+
+    def test_deactivation_applies_to_the_next_request(self):
+        self.assertEqual(self.client.get('/api/v1/qa/conversations/').status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/v1/qa/conversations/').status_code, 401)
+
+    def test_profile_update_is_not_hidden_by_the_cache(self):
+        self.client.get('/api/v1/auth/profile/')
+        response = self.client.patch('/api/v1/auth/profile/', {'bio': 'Reads a lot'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        # Counters bumped with .update() bypass the signals; the profile still reads them fresh
+        get_user_model().objects.filter(pk=self.user.pk).update(total_documents=4)
+        response = self.client.get('/api/v1/auth/profile/')
+        self.assertEqual(response.data['bio'], 'Reads a lot')
+        self.assertEqual(response.data['total_documents'], 4)
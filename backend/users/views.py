@@ -29,4 +29,5 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
     serializer_class = UserSerializer
     
     def get_object(self):
-        return self.request.user
\ No newline at end of file
+        # request.user may come from the authentication cache; read counters and fields fresh
+        return User.objects.get(pk=self.request.user.pk)